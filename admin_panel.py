@@ -1,9 +1,6 @@
 import os
 import logging
 import asyncio
-import matplotlib.pyplot as plt
-import matplotlib.dates as mdates
-import io
 import psycopg2.extras
 from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, Router, F
@@ -12,27 +9,24 @@ from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
-from database import Database
+from database import Database, DatabaseThread
+from message_renderer import MessageRenderer
+from ttl_cache import TTLCache
+from chart_renderer import chart_fingerprint, render_publications_chart
+from task_manager import BackgroundTaskManager
 from dotenv import load_dotenv
 from aiogram.types import BufferedInputFile
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("admin_panel.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 # Список администраторов (ID пользователей Telegram)
 ADMIN_IDS = [int(id) for id in os.getenv('ADMIN_IDS', '').split(',') if id]
 
+PAGE_KEY_FORMAT = "%Y%m%d%H%M%S%f"  # Время поста в ключе страницы (callback_data не длиннее 64 байт)
+
 class AdminStates(StatesGroup):
     """Состояния для FSM админ-панели"""
     waiting_for_post_id = State()  # Ожидание ID поста для просмотра деталей
@@ -42,11 +36,27 @@ class AdminStates(StatesGroup):
     waiting_for_timezone = State()  # Ожидание часового пояса
     waiting_for_schedule_slot = State()  # Ожидание номера слота расписания для изменения
     waiting_for_api_key = State()  # Ожидание нового значения API ключа
+    waiting_for_shift_hours = State()  # Ожидание количества часов для сдвига очереди
+    waiting_for_respread_range = State()  # Ожидание периода для перераспределения по слотам
+    waiting_for_drop_category = State()  # Ожидание категории для снятия с публикации
 
 class AdminPanel:
-    def __init__(self, bot: Bot, db: Database):
+    def __init__(self, bot: Bot, db: Database, news_api=None, ai_worker=None, http_session=None):
         self.bot = bot
         self.db = db
+        # Компоненты конвейера общие с планировщиком при запуске в одном процессе (runtime.py),
+        # иначе создаются один раз при первом автоматическом планировании
+        self.news_api = news_api
+        self.ai_worker = ai_worker
+        self.http_session = http_session
+        self._own_ai_processor = None
+        self.renderer = MessageRenderer(db)  # Подготовка сообщений при изменении расписания
+        self.stats_cache = TTLCache(int(os.getenv('ADMIN_STATS_CACHE_SECONDS', '30')))  # Кэш статистики для кнопки "📊"
+        self.stats_max_age = int(os.getenv('STATS_REFRESH_MINUTES', '5')) * 60  # Допустимый возраст сводной статистики
+        self.stats_thread = DatabaseThread("admin-stats")  # Обновление устаревшей статистики вне event loop бота
+        self.chart_file_ids = TTLCache(24 * 3600, max_entries=32)  # Отпечаток данных графика -> file_id в Telegram
+        self.page_size = int(os.getenv('ADMIN_PAGE_SIZE', '10'))  # Постов на странице очереди публикаций
+        self.tasks = BackgroundTaskManager()  # Длительные операции админ-панели выполняются в фоне
         self.router = Router()
         self.setup_handlers()
     
@@ -57,10 +67,12 @@ class AdminPanel:
         
         # Обработчики кнопок админ-панели
         self.router.callback_query.register(self.show_scheduled_posts, F.data == "show_scheduled")
+        self.router.callback_query.register(self.show_scheduled_posts, F.data.startswith("sched_page_"))
         self.router.callback_query.register(self.show_post_stats, F.data == "show_stats")
         self.router.callback_query.register(self.show_post_graph, F.data == "show_graph")
         self.router.callback_query.register(self.back_to_admin_menu, F.data == "back_to_admin")
         self.router.callback_query.register(self.auto_schedule_posts, F.data == "auto_schedule")
+        self.router.callback_query.register(self.cancel_background_job, F.data.startswith("cancel_job_"))
         
         # Обработчики для просмотра деталей поста
         self.router.callback_query.register(self.view_post_details, F.data.startswith("view_post_"))
@@ -81,6 +93,13 @@ class AdminPanel:
         self.router.message.register(self.process_timezone, AdminStates.waiting_for_timezone)
         self.router.message.register(self.process_schedule_time, AdminStates.waiting_for_schedule_time)
         
+        # Обработчики массовых операций с очередью публикаций
+        self.router.callback_query.register(self.show_bulk_menu, F.data == "bulk_menu")
+        self.router.callback_query.register(self.ask_bulk_parameter, F.data.in_({"bulk_shift", "bulk_respread", "bulk_drop"}))
+        self.router.message.register(self.process_shift_hours, AdminStates.waiting_for_shift_hours)
+        self.router.message.register(self.process_respread_range, AdminStates.waiting_for_respread_range)
+        self.router.message.register(self.process_drop_category, AdminStates.waiting_for_drop_category)
+        
         # Обработчики для настройки API ключей
         self.router.callback_query.register(self.show_api_settings, F.data == "api_settings")
         self.router.callback_query.register(self.edit_openrouter_api_key, F.data == "edit_openrouter_api_key")
@@ -106,6 +125,7 @@ class AdminPanel:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="📅 Запланированные посты", callback_data="show_scheduled")],
             [InlineKeyboardButton(text="🤖 Автоматическое планирование", callback_data="auto_schedule")],
+            [InlineKeyboardButton(text="🗂 Массовые операции", callback_data="bulk_menu")],
             [InlineKeyboardButton(text="⏰ Настройки расписания", callback_data="schedule_settings")],
             [InlineKeyboardButton(text="🔑 Настройки API", callback_data="api_settings")],
             [InlineKeyboardButton(text="📊 Статистика публикаций", callback_data="show_stats")],
@@ -116,15 +136,25 @@ class AdminPanel:
         logger.info(f"Пользователь {user_id} открыл админ-панель")
     
     async def show_scheduled_posts(self, callback: CallbackQuery):
-        """Показать запланированные посты"""
+        """Показать запланированные посты (постранично)"""
         user_id = callback.from_user.id
         
         if not await self.is_admin(user_id):
             await callback.answer("⛔ У вас нет доступа к этой функции", show_alert=True)
             return
         
-        # Получение запланированных постов из базы данных
-        scheduled_posts = await self.get_scheduled_posts()
+        # Направление и ключ страницы из callback_data вида sched_page_n_<время>_<id>
+        direction, key = None, None
+        if callback.data.startswith("sched_page_"):
+            _, _, direction, key_date, key_id = callback.data.split("_")
+            key = (datetime.strptime(key_date, PAGE_KEY_FORMAT), int(key_id))
+        
+        # Получение страницы запланированных постов из базы данных
+        scheduled_posts, has_more = await self.get_scheduled_posts(key, backward=direction == "p")
+        if not scheduled_posts and key is not None:
+            # Посты страницы успели опубликовать или удалить - возврат к началу очереди
+            direction, key = None, None
+            scheduled_posts, has_more = await self.get_scheduled_posts()
         
         if not scheduled_posts:
             await callback.message.edit_text(
@@ -142,7 +172,7 @@ class AdminPanel:
         for post in scheduled_posts:
             pub_date = post["scheduled_date"].strftime("%d.%m.%Y %H:%M")
             message_text += f"🔹 ID: {post['id']} - {pub_date}\n"
-            message_text += f"   {post['title'][:50]}...\n\n"
+            message_text += f"   {post['title']}...\n\n"
         
         # Добавление кнопок для каждого поста
         keyboard = []
@@ -152,6 +182,25 @@ class AdminPanel:
                 callback_data=f"view_post_{post['id']}"
             )])
         
+        # Кнопки перехода между страницами
+        has_prev = has_more if direction == "p" else key is not None
+        has_next = has_more if direction != "p" else True
+        navigation = []
+        if has_prev:
+            first = scheduled_posts[0]
+            navigation.append(InlineKeyboardButton(
+                text="⬅️ Назад",
+                callback_data=f"sched_page_p_{first['scheduled_date'].strftime(PAGE_KEY_FORMAT)}_{first['id']}"
+            ))
+        if has_next:
+            last = scheduled_posts[-1]
+            navigation.append(InlineKeyboardButton(
+                text="Далее ➡️",
+                callback_data=f"sched_page_n_{last['scheduled_date'].strftime(PAGE_KEY_FORMAT)}_{last['id']}"
+            ))
+        if navigation:
+            keyboard.append(navigation)
+        
         # Добавление кнопки "Назад"
         keyboard.append([InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_admin")])
         
@@ -237,8 +286,8 @@ class AdminPanel:
             date_str = message.text.strip()
             new_date = datetime.strptime(date_str, "%d.%m.%Y").date()
             
-            # Сохранение даты в состоянии
-            await state.update_data(new_date=new_date)
+            # Сохранение даты в состоянии (в виде строки: состояние хранится в JSON)
+            await state.update_data(new_date=new_date.isoformat())
             
             # Запрос времени публикации
             await message.answer(
@@ -277,7 +326,7 @@ class AdminPanel:
             hour, minute = map(int, time_str.split(":"))
             
             # Создание полной даты и времени
-            new_datetime = datetime.combine(new_date, datetime.min.time()) + timedelta(hours=hour, minutes=minute)
+            new_datetime = datetime.fromisoformat(new_date) + timedelta(hours=hour, minutes=minute)
             
             # Обновление времени публикации в базе данных
             success = await self.update_post_schedule(post_id, new_datetime)
@@ -405,6 +454,13 @@ class AdminPanel:
         for category, count in stats['categories'].items():
             message_text += f"- {category}: {count}\n"
         
+        if stats['refreshed_at'] is None:
+            message_text += "\n⏳ Статистика еще собирается, повторите запрос через минуту"
+        else:
+            message_text += f"\n🕒 Данные на {stats['refreshed_at'].strftime('%d.%m.%Y %H:%M')}"
+            if stats['age_seconds'] > self.stats_max_age:
+                message_text += " (обновляются)"
+        
         await callback.message.edit_text(
             message_text,
             reply_markup=InlineKeyboardMarkup(inline_keyboard=[
@@ -434,39 +490,29 @@ class AdminPanel:
             await callback.answer()
             return
         
-        # Создание графика
-        plt.figure(figsize=(10, 6))
-        plt.plot(graph_data['dates'], graph_data['counts'], marker='o', linestyle='-', color='#1e88e5')
-        
-        # Настройка графика
-        plt.title('График публикаций за последние 30 дней')
-        plt.xlabel('Дата')
-        plt.ylabel('Количество публикаций')
-        plt.grid(True, linestyle='--', alpha=0.7)
-        
-        # Форматирование оси X для отображения дат
-        plt.gca().xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
-        plt.gca().xaxis.set_major_locator(mdates.DayLocator(interval=5))
-        plt.gcf().autofmt_xdate()
-        
-        # Сохранение графика в буфер
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=100)
-        buf.seek(0)
-        plt.close()
-
-        # Преобразование буфера в BufferedInputFile
-        image_file = BufferedInputFile(buf.read(), filename="graph.png")
-
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_admin")]
+        ])
+        caption = "📈 График публикаций за последние 30 дней"
         await callback.message.delete()
-        await self.bot.send_photo(
+        
+        # Уже отправленный график с теми же данными переиспользуется по file_id
+        fingerprint = chart_fingerprint('publications', graph_data['dates'], graph_data['counts'])
+        file_id = self.chart_file_ids.get(fingerprint)
+        if file_id:
+            await self.bot.send_photo(chat_id=user_id, photo=file_id, caption=caption, reply_markup=keyboard)
+            await callback.answer()
+            return
+        
+        image = await render_publications_chart(graph_data['dates'], graph_data['counts'])
+        sent = await self.bot.send_photo(
             chat_id=user_id,
-            photo=image_file,  # Используем BufferedInputFile
-            caption="📈 График публикаций за последние 30 дней",
-            reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_admin")]
-            ])
+            photo=BufferedInputFile(image, filename="graph.png"),
+            caption=caption,
+            reply_markup=keyboard
         )
+        if sent.photo:
+            self.chart_file_ids.set(fingerprint, sent.photo[-1].file_id)
         await callback.answer()
     
     async def back_to_admin_menu(self, callback: CallbackQuery):
@@ -474,6 +520,7 @@ class AdminPanel:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
             [InlineKeyboardButton(text="📅 Запланированные посты", callback_data="show_scheduled")],
             [InlineKeyboardButton(text="🤖 Автоматическое планирование", callback_data="auto_schedule")],
+            [InlineKeyboardButton(text="🗂 Массовые операции", callback_data="bulk_menu")],
             [InlineKeyboardButton(text="⏰ Настройки расписания", callback_data="schedule_settings")],
             [InlineKeyboardButton(text="🔑 Настройки API", callback_data="api_settings")],
             [InlineKeyboardButton(text="📊 Статистика публикаций", callback_data="show_stats")],
@@ -483,6 +530,130 @@ class AdminPanel:
         await callback.message.edit_text("🔧 Админ-панель бота @async_news_bot", reply_markup=keyboard)
         await callback.answer()
         
+    async def show_bulk_menu(self, callback: CallbackQuery, state: FSMContext):
+        """Показать меню массовых операций с очередью публикаций"""
+        if not await self.is_admin(callback.from_user.id):
+            await callback.answer("⛔ У вас нет доступа к этой функции", show_alert=True)
+            return
+        
+        await state.clear()
+        keyboard = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="⏩ Сдвинуть очередь на N часов", callback_data="bulk_shift")],
+            [InlineKeyboardButton(text="🔀 Перераспределить период по слотам", callback_data="bulk_respread")],
+            [InlineKeyboardButton(text="🗑 Снять с публикации категорию", callback_data="bulk_drop")],
+            [InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_admin")]
+        ])
+        await callback.message.edit_text(
+            "🗂 Массовые операции с очередью публикаций\n\n"
+            "Каждая операция применяется ко всем ожидающим постам сразу.",
+            reply_markup=keyboard
+        )
+        await callback.answer()
+    
+    async def ask_bulk_parameter(self, callback: CallbackQuery, state: FSMContext):
+        """Запрос параметра выбранной массовой операции"""
+        if not await self.is_admin(callback.from_user.id):
+            await callback.answer("⛔ У вас нет доступа к этой функции", show_alert=True)
+            return
+        
+        prompts = {
+            "bulk_shift": (AdminStates.waiting_for_shift_hours,
+                           "⏩ Введите количество часов для сдвига всех ожидающих постов "
+                           "(отрицательное число - сдвиг назад), например: 3"),
+            "bulk_respread": (AdminStates.waiting_for_respread_range,
+                              "🔀 Введите период в формате ДД.ММ.ГГГГ-ДД.ММ.ГГГГ или одну дату ДД.ММ.ГГГГ.\n"
+                              "Посты периода будут заново распределены по слотам расписания в порядке приоритета."),
+            "bulk_drop": (AdminStates.waiting_for_drop_category,
+                          "🗑 Введите категорию, посты которой нужно снять с публикации, например: web3")
+        }
+        next_state, prompt = prompts[callback.data]
+        await state.set_state(next_state)
+        await callback.message.edit_text(prompt, reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="◀️ Отмена", callback_data="bulk_menu")]
+        ]))
+        await callback.answer()
+    
+    async def _finish_bulk_operation(self, message: Message, state: FSMContext, text):
+        """Ответ с результатом массовой операции"""
+        await state.clear()
+        self.stats_cache.invalidate()
+        await message.answer(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="📅 К списку постов", callback_data="show_scheduled")],
+            [InlineKeyboardButton(text="🗂 Массовые операции", callback_data="bulk_menu")]
+        ]))
+    
+    async def process_shift_hours(self, message: Message, state: FSMContext):
+        """Сдвиг всех ожидающих постов на введенное количество часов"""
+        user_id = message.from_user.id
+        if not await self.is_admin(user_id):
+            return
+        
+        try:
+            hours = int(message.text.strip())
+        except ValueError:
+            await message.answer("❌ Введите целое количество часов, например: 3 или -2")
+            return
+        
+        shifted = self.db.shift_pending_posts(hours)
+        if shifted is None:
+            await self._finish_bulk_operation(message, state, "❌ Не удалось сдвинуть очередь публикаций")
+            return
+        logger.info(f"Администратор {user_id} сдвинул очередь публикаций на {hours} ч")
+        await self._finish_bulk_operation(message, state, f"✅ Сдвинуто постов: {shifted} (на {hours} ч)")
+    
+    async def process_respread_range(self, message: Message, state: FSMContext):
+        """Перераспределение постов введенного периода по слотам расписания"""
+        user_id = message.from_user.id
+        if not await self.is_admin(user_id):
+            return
+        
+        try:
+            parts = [part.strip() for part in message.text.split("-")]
+            start_date = datetime.strptime(parts[0], "%d.%m.%Y").date()
+            end_date = datetime.strptime(parts[-1], "%d.%m.%Y").date()
+            if len(parts) > 2 or end_date < start_date:
+                raise ValueError
+        except ValueError:
+            await message.answer("❌ Неверный период. Введите ДД.ММ.ГГГГ-ДД.ММ.ГГГГ или одну дату ДД.ММ.ГГГГ")
+            return
+        
+        from slot_allocator import SlotAllocator, SlotCapacityError
+        try:
+            assignments = SlotAllocator(self.db).respread(start_date, end_date)
+        except SlotCapacityError as e:
+            await self._finish_bulk_operation(
+                message, state,
+                f"❌ В периоде {e.available} свободных слотов, а постов {e.needed}. "
+                f"Расширьте период или снимите часть постов с публикации"
+            )
+            return
+        if assignments is None:
+            await self._finish_bulk_operation(message, state, "❌ Не удалось перераспределить посты")
+            return
+        if not assignments:
+            await self._finish_bulk_operation(message, state, "📅 В указанном периоде нет ожидающих постов")
+            return
+        logger.info(f"Администратор {user_id} перераспределил посты за период {start_date} - {end_date}")
+        await self._finish_bulk_operation(
+            message, state,
+            f"✅ Перераспределено постов: {len(assignments)}\n"
+            f"📅 Слоты с {assignments[0][1].strftime('%d.%m.%Y %H:%M')} по {assignments[-1][1].strftime('%d.%m.%Y %H:%M')}"
+        )
+    
+    async def process_drop_category(self, message: Message, state: FSMContext):
+        """Снятие с публикации всех ожидающих постов введенной категории"""
+        user_id = message.from_user.id
+        if not await self.is_admin(user_id):
+            return
+        
+        category = message.text.strip()
+        cancelled = self.db.cancel_pending_posts_by_category(category)
+        if cancelled is None:
+            await self._finish_bulk_operation(message, state, "❌ Не удалось снять посты с публикации")
+            return
+        logger.info(f"Администратор {user_id} снял с публикации посты категории {category}")
+        await self._finish_bulk_operation(message, state, f"✅ Снято с публикации постов категории «{category}»: {cancelled}")
+    
     async def show_api_settings(self, callback: CallbackQuery):
         """Показать настройки API ключей"""
         user_id = callback.from_user.id
@@ -966,36 +1137,36 @@ class AdminPanel:
     
     # Методы для работы с базой данных
     
-    async def get_scheduled_posts(self):
-        """Получение запланированных постов из базы данных"""
+    async def get_scheduled_posts(self, key=None, backward=False):
+        """Страница запланированных постов после (или до) ключа (время, ID); возвращает (посты, есть_еще)"""
         try:
             with self.db.conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT n.id, n.title, n.url, n.category, s.scheduled_date,
-                           p.processed_title, p.processed_content, s.status, s.attempts
-                    FROM news n
-                    JOIN processed_news p ON n.id = p.news_id
-                    JOIN scheduled_posts s ON n.id = s.news_id
-                    WHERE n.processed = TRUE AND n.published = FALSE
-                    ORDER BY s.scheduled_date ASC
-                """)
-                
-                posts = [{
-                    'id': row[0],
-                    'title': row[1],
-                    'url': row[2],
-                    'category': row[3],
-                    'scheduled_date': row[4],
-                    'processed_title': row[5],
-                    'processed_content': row[6],
-                    'status': row[7],
-                    'attempts': row[8]
-                } for row in cursor.fetchall()]
-                
-                return posts
+                # Только поля списка; полный текст поста загружается в view_post_details
+                cursor.execute(f"""
+                    SELECT s.news_id, s.scheduled_date, LEFT(n.title, 50)
+                    FROM scheduled_posts s
+                    JOIN news n ON n.id = s.news_id
+                    WHERE n.processed = TRUE AND n.published = FALSE AND s.status <> 'cancelled'
+                      AND (%s::timestamp IS NULL OR (s.scheduled_date, s.news_id) {'<' if backward else '>'} (%s, %s))
+                    ORDER BY s.scheduled_date {'DESC' if backward else 'ASC'}, s.news_id {'DESC' if backward else 'ASC'}
+                    LIMIT %s
+                """, (key and key[0], key and key[0], key and key[1], self.page_size + 1))
+                rows = cursor.fetchall()
+            
+            has_more = len(rows) > self.page_size
+            rows = rows[:self.page_size]
+            if backward:
+                rows.reverse()
+            posts = [{
+                'id': row[0],
+                'scheduled_date': row[1],
+                'title': row[2]
+            } for row in rows]
+            return posts, has_more
         except Exception as e:
+            self.db.conn.rollback()
             logger.error(f"Ошибка при получении запланированных постов: {e}")
-            return []
+            return [], False
     
     async def get_post_by_id(self, post_id):
         """Получение информации о посте по ID"""
@@ -1037,6 +1208,7 @@ class AdminPanel:
             # Используем метод schedule_post из класса Database
             result = self.db.schedule_post(post_id, new_datetime)
             if result:
+                self.renderer.prerender([post_id])
                 logger.info(f"Время публикации поста #{post_id} обновлено на {new_datetime}")
                 return True
             else:
@@ -1048,56 +1220,51 @@ class AdminPanel:
     
     async def get_publication_stats(self):
         """Получение статистики публикаций"""
-        try:
-            stats = {
-                'total_news': 0,
-                'published': 0,
-                'scheduled': 0,
-                'processed': 0,
-                'categories': {}
-            }
-            
-            with self.db.conn.cursor() as cursor:
-                # Общее количество новостей
-                cursor.execute("SELECT COUNT(*) FROM news")
-                stats['total_news'] = cursor.fetchone()[0]
-                
-                # Количество опубликованных новостей
-                cursor.execute("SELECT COUNT(*) FROM news WHERE published = TRUE")
-                stats['published'] = cursor.fetchone()[0]
-                
-                # Количество запланированных новостей
-                cursor.execute("SELECT COUNT(*) FROM news WHERE processed = TRUE AND published = FALSE")
-                stats['scheduled'] = cursor.fetchone()[0]
-                
-                # Количество обработанных новостей
-                cursor.execute("SELECT COUNT(*) FROM news WHERE processed = TRUE")
-                stats['processed'] = cursor.fetchone()[0]
-                
-                # Статистика по категориям
-                cursor.execute("""
-                    SELECT category, COUNT(*)
-                    FROM news
-                    GROUP BY category
-                    ORDER BY COUNT(*) DESC
-                """)
-                
-                for row in cursor.fetchall():
-                    stats['categories'][row[0]] = row[1]
-            
+        empty = {
+            'total_news': 0,
+            'published': 0,
+            'scheduled': 0,
+            'processed': 0,
+            'categories': {},
+            'refreshed_at': None,
+            'age_seconds': None
+        }
+        stats = self.stats_cache.get('publication')
+        if stats is not None:
             return stats
-        except Exception as e:
-            logger.error(f"Ошибка при получении статистики публикаций: {e}")
-            return {
-                'total_news': 0,
-                'published': 0,
-                'scheduled': 0,
-                'processed': 0,
-                'categories': {}
-            }
+        
+        # Одно чтение сводной статистики вместо подсчета по всей таблице news
+        stats = self.db.get_news_stats()
+        if stats is None:
+            logger.error("Не удалось получить статистику публикаций")
+            return empty
+        if stats['age_seconds'] is None or stats['age_seconds'] > self.stats_max_age:
+            # Показываем то, что есть, а свежие данные готовятся в фоне
+            self.tasks.start("stats_refresh", self._refresh_stats, on_done=self._stats_refreshed)
+        self.stats_cache.set('publication', stats)
+        return stats
+    
+    async def _refresh_stats(self, job):
+        """Обновление сводной статистики на отдельном соединении"""
+        return await self.stats_thread.run(Database.refresh_news_stats)
+    
+    async def _stats_refreshed(self, job):
+        """Сброс кэша, чтобы следующий запрос увидел обновленную статистику"""
+        if job.result:
+            self.stats_cache.invalidate('publication')
+    
+    async def close(self):
+        """Остановка фоновых задач и закрытие собственного соединения админ-панели"""
+        await self.tasks.shutdown()
+        self.stats_thread.close()
+        if self._own_ai_processor is not None:
+            self._own_ai_processor.close()
     
     async def get_graph_data(self):
         """Получение данных для графика публикаций"""
+        cached = self.stats_cache.get('graph')
+        if cached is not None:
+            return cached
         try:
             # Получение данных за последние 30 дней
             thirty_days_ago = datetime.now() - timedelta(days=30)
@@ -1118,7 +1285,9 @@ class AdminPanel:
                     dates.append(row[0])
                     counts.append(row[1])
             
-            return {'dates': dates, 'counts': counts}
+            graph_data = {'dates': dates, 'counts': counts}
+            self.stats_cache.set('graph', graph_data)
+            return graph_data
         except Exception as e:
             logger.error(f"Ошибка при получении данных для графика: {e}")
             return {'dates': [], 'counts': []}
@@ -1177,158 +1346,105 @@ class AdminPanel:
             return False
     
     async def auto_schedule_posts(self, callback: CallbackQuery):
-        """Автоматическое планирование 10 постов"""
+        """Автоматическое планирование 10 постов (выполняется в фоне)"""
         user_id = callback.from_user.id
         
         if not await self.is_admin(user_id):
             await callback.answer("⛔ У вас нет доступа к этой функции", show_alert=True)
             return
         
-        # Сообщаем пользователю о начале процесса
-        await callback.message.edit_text(
-            "🔄 Начинаю процесс автоматического планирования постов..."
-        )
+        message = callback.message
+        
+        async def show_progress(job, text):
+            await message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="⛔ Отменить", callback_data=f"cancel_job_{job.id}")]
+            ]))
+        
+        async def show_result(job):
+            await message.edit_text(self._auto_schedule_summary(job), reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="📅 Посмотреть запланированные", callback_data="show_scheduled")],
+                [InlineKeyboardButton(text="◀️ Назад в меню", callback_data="back_to_admin")]
+            ]))
+        
+        job = self.tasks.start("auto_schedule", self._auto_schedule_job, show_progress, show_result)
+        if job is None:
+            await callback.answer("⏳ Автоматическое планирование уже выполняется", show_alert=True)
+            return
+        
+        # Сообщаем пользователю о начале процесса; бот продолжает отвечать на другие команды
+        await job.report("🔄 Начинаю процесс автоматического планирования постов...", force=True)
         await callback.answer()
+    
+    def _create_pipeline(self):
+        """Конвейер новостей на общих компонентах процесса (недостающие создаются один раз)"""
+        from news_api import NewsAPI
+        from ai_processor import AIProcessor
+        from job_queue import AIWorker
+        from pipeline import NewsPipeline
+        
+        if self.news_api is None:
+            self.news_api = NewsAPI(self.db)
+        if self.ai_worker is None:
+            self._own_ai_processor = AIProcessor(self.db)
+            self.ai_worker = AIWorker(self.db, self._own_ai_processor)
+        # Отдельный экземпляр конвейера: счетчики этого запуска не смешиваются с запусками планировщика
+        return NewsPipeline(self.db, self.news_api, self.ai_worker, self.http_session)
+    
+    async def _auto_schedule_job(self, job):
+        """Сбор, обработка и планирование новостей потоковым конвейером с отчетами о прогрессе"""
+        pipeline = self._create_pipeline()
         
+        # Берем первые 5 ключевых слов для разнообразия
+        run = asyncio.create_task(pipeline.run(keywords=self.news_api.keywords[:5]))
         try:
-            # Инициализация необходимых компонентов
-            from news_api import NewsAPI
-            from ai_processor import AIProcessor
-            
-            news_api = NewsAPI(self.db)
-            ai_processor = AIProcessor(self.db)
-            
-            # Шаг 1: Сбор новостей через API
-            await callback.message.edit_text("🔍 Собираю свежие новости через API...")
-            
-            # Получаем больше новостей, чем нужно, на случай если некоторые не пройдут обработку
-            articles = []
-            for keyword in news_api.keywords[:5]:  # Берем первые 5 ключевых слов для разнообразия
-                batch = news_api.fetch_news(keyword=keyword, max_results=5)
-                articles.extend(batch)
-                # Небольшая пауза между запросами
-                await asyncio.sleep(1)
-            
-            # Удаление дубликатов
-            unique_articles = {}
-            for article in articles:
-                url = article.get("link", "")
-                if url and url not in unique_articles:
-                    unique_articles[url] = article
-            
-            articles = list(unique_articles.values())
-            
-            # Фильтрация и сохранение в БД
-            filtered_articles = news_api.filter_news(articles)
-            saved_count = news_api.save_news_to_db(filtered_articles)
-            
-            if saved_count == 0:
-                await callback.message.edit_text(
-                    "❌ Не удалось найти подходящие новости. Пожалуйста, попробуйте позже.",
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_admin")]
-                    ])
+            while not run.done():
+                await asyncio.wait({run}, timeout=self.tasks.progress_interval)
+                stats = pipeline.stats
+                await job.report(
+                    f"🔄 Автоматическое планирование постов ({job.elapsed:.0f} с)\n\n"
+                    f"🔍 Найдено новостей: {stats['fetched']}\n"
+                    f"📥 Сохранено: {stats['store']}\n"
+                    f"🧠 Обработано ИИ: {stats['ai']}\n"
+                    f"📅 Запланировано: {stats['scheduled']}"
                 )
-                return
-            
-            # Шаг 2: Обработка новостей с помощью ИИ
-            await callback.message.edit_text(f"🧠 Обрабатываю {saved_count} новостей с помощью ИИ...")
-            
-            # Получение необработанных новостей из базы данных
-            with self.db.conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT id, title, content, url, category
-                    FROM news
-                    WHERE processed = FALSE
-                    ORDER BY published_date DESC
-                    LIMIT 15
-                """)
-                news_items = [{
-                    'id': row[0],
-                    'title': row[1],
-                    'content': row[2],
-                    'url': row[3],
-                    'category': row[4]
-                } for row in cursor.fetchall()]
-            
-            if not news_items:
-                await callback.message.edit_text(
-                    "❌ Не найдено новостей для обработки.",
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_admin")]
-                    ])
-                )
-                return
-            
-            # Обработка новостей через AI
-            results = ai_processor.process_batch(news_items, batch_size=15)
-            
-            # Подсчет успешно обработанных новостей
-            processed_news = [result for result in results if result.get("success", False)]
-            processed_count = len(processed_news)
-            
-            if processed_count == 0:
-                await callback.message.edit_text(
-                    "❌ Не удалось обработать новости. Пожалуйста, попробуйте позже.",
-                    reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                        [InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_admin")]
-                    ])
-                )
-                return
-            
-            # Шаг 3: Планирование публикаций с равномерным распределением по времени
-            await callback.message.edit_text(f"📅 Планирую публикацию {min(processed_count, 10)} постов...")
-            
-            # Получение обработанных новостей для планирования
-            with self.db.conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT n.id
-                    FROM news n
-                    JOIN processed_news p ON n.id = p.news_id
-                    WHERE n.processed = TRUE AND n.published = FALSE
-                    ORDER BY n.published_date ASC
-                    LIMIT 10
-                """)
-                post_ids = [row[0] for row in cursor.fetchall()]
-            
-            # Определение временного интервала для публикаций (начиная с текущего времени + 1 час)
-            start_time = datetime.now() + timedelta(hours=1)
-            # Равномерное распределение по времени (каждые 2 часа)
-            time_interval = timedelta(hours=2)
-            
-            scheduled_count = 0
-            for i, post_id in enumerate(post_ids):
-                # Расчет времени публикации для текущего поста
-                publish_time = start_time + (time_interval * i)
-                
-                # Обновление времени публикации в базе данных
-                success = await self.update_post_schedule(post_id, publish_time)
-                if success:
-                    scheduled_count += 1
-            
-            # Формирование сообщения о результатах
-            message_text = f"✅ Автоматическое планирование завершено!\n\n"
-            message_text += f"📊 Результаты:\n"
-            message_text += f"- Собрано новостей: {saved_count}\n"
-            message_text += f"- Обработано ИИ: {processed_count}\n"
-            message_text += f"- Запланировано к публикации: {scheduled_count}\n\n"
-            
-            if scheduled_count > 0:
-                message_text += f"📅 Посты будут опубликованы в течение {scheduled_count * 2} часов, начиная с {start_time.strftime('%d.%m.%Y %H:%M')}"
-            
-            await callback.message.edit_text(
-                message_text,
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="📅 Посмотреть запланированные", callback_data="show_scheduled")],
-                    [InlineKeyboardButton(text="◀️ Назад в меню", callback_data="back_to_admin")]
-                ])
-            )
-            
-        except Exception as e:
-            logger.error(f"Ошибка при автоматическом планировании постов: {e}")
-            await callback.message.edit_text(
-                f"❌ Произошла ошибка при планировании постов: {str(e)}",
-                reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="◀️ Назад", callback_data="back_to_admin")]
-                ])
-            )
\ No newline at end of file
+            run.result()
+        finally:
+            if not run.done():
+                # Отмена задачи останавливает конвейер; незавершенная AI-обработка вернется в очередь
+                run.cancel()
+                await asyncio.gather(run, return_exceptions=True)
+        return pipeline.stats
+    
+    @staticmethod
+    def _auto_schedule_summary(job):
+        """Итоговое сообщение фоновой задачи автоматического планирования"""
+        if job.status == 'cancelled':
+            return "⛔ Автоматическое планирование отменено"
+        if job.status == 'failed':
+            return f"❌ Произошла ошибка при планировании постов: {job.error}"
+        
+        stats = job.result
+        if stats['store'] == 0 and stats['scheduled'] == 0:
+            return "❌ Не удалось найти подходящие новости. Пожалуйста, попробуйте позже."
+        
+        # Формирование сообщения о результатах
+        message_text = f"✅ Автоматическое планирование завершено за {job.elapsed:.0f} с!\n\n"
+        message_text += f"📊 Результаты:\n"
+        message_text += f"- Собрано новостей: {stats['store']}\n"
+        message_text += f"- Обработано ИИ: {stats['ai']}\n"
+        message_text += f"- Запланировано к публикации: {stats['scheduled']}\n\n"
+        if stats['scheduled'] > 0:
+            message_text += "📅 Посты распределены по свободным слотам расписания"
+        return message_text
+    
+    async def cancel_background_job(self, callback: CallbackQuery):
+        """Отмена фоновой задачи админ-панели"""
+        if not await self.is_admin(callback.from_user.id):
+            await callback.answer("⛔ У вас нет доступа к этой функции", show_alert=True)
+            return
+        
+        job_id = int(callback.data.split("_")[-1])
+        if self.tasks.cancel(job_id):
+            await callback.answer("⛔ Задача будет остановлена")
+        else:
+            await callback.answer("Задача уже завершена", show_alert=True)
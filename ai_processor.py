@@ -1,21 +1,20 @@
 import os
+import time
+import asyncio
 import logging
-from openai import OpenAI
 from dotenv import load_dotenv
-from database import Database
+from database import Database, DatabaseThread
+from rate_limiter import RateLimiter
+from llm_cache import LLMCache
+from prompt_builder import PromptBuilder
+from model_router import ModelRouter
+from post_validator import StreamingPostValidator, PostFormatError
+import metrics
+import tracing
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("ai_processor.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 class AIProcessor:
@@ -24,6 +23,10 @@ class AIProcessor:
         self.site_url = os.getenv('SITE_URL', 'https://async-news.ru')
         self.site_name = os.getenv('SITE_NAME', 'AsyncNews')
         self.db = db
+        self.base_url = os.getenv('OPENROUTER_BASE_URL', "https://openrouter.ai/api/v1")  # OpenAI-совместимый API
+        self.system_prompt = "Ты - редактор IT-новостей для Telegram-канала."
+        self.max_tokens = 500
+        self.temperature = 0.7
         self.prompt_template = """
         Перепиши следующую новость в стиле Telegram-поста для IT-канала 🔧
         Требования:
@@ -38,116 +41,287 @@ class AIProcessor:
         В конце — ссылка на источник (если есть) и хэштеги
         Финал: интригующий вопрос или призыв к дискуссии
         Категория новости: [укажи категорию, например: ИИ, стартапы, кибербезопасность и т.д.]
+        Оригинальный заголовок: {original_title}
         Оригинальный контент: {original_content}
         
         """
 
-        # Инициализация клиента OpenAI с OpenRouter
-        self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=self.openrouter_api_key
-        )
+        # Сборка промта с ограничением входных токенов
+        self.prompt_builder = PromptBuilder(self.prompt_template)
 
-    def process_news(self, news_item):
-        """Обработка новости с помощью AI"""
-        try:
-            # Проверка наличия и длины контента
-            content = news_item.get('content', '')
-            content_length = len(content)
-            
-            if content_length < 50:
-                logger.warning(f"Контент новости '{news_item['title']}' слишком короткий ({content_length} символов). Качество обработки может быть низким.")
-            else:
-                logger.info(f"Обработка новости '{news_item['title']}' с контентом длиной {content_length} символов")
-            
-            # Подготовка промта
-            prompt = self.prompt_template.format(
-                original_title=news_item['title'],
-                original_content=content,
-                source_url=news_item['url'],
-                category=news_item['category']
-            )
+        # Параметры асинхронной обработки
+        self.max_concurrent = int(os.getenv('AI_MAX_CONCURRENT', '3'))  # Одновременных запросов к API
+        self.requests_per_minute = int(os.getenv('AI_REQUESTS_PER_MINUTE', '20'))  # Лимит бесплатных моделей OpenRouter
+        self.request_timeout = float(os.getenv('AI_REQUEST_TIMEOUT', '60'))  # Таймаут запроса к одной модели (в секундах)
+        self.rate_limiter = RateLimiter(self.requests_per_minute, 60)
 
-            logger.info(f"Отправка новости '{news_item['title']}' на обработку AI через OpenRouter")
-
-            # Запрос к OpenRouter API с моделью Qwen3
-            completion = self.client.chat.completions.create(
-                extra_headers={
-                    "HTTP-Referer": self.site_url,  # Для рейтинга на openrouter.ai
-                    "X-Title": self.site_name,      # Для рейтинга на openrouter.ai
-                },
-                extra_body={},
-                model="google/gemma-3-27b-it:free",
-                messages=[
-                    {"role": "system", "content": "Ты - редактор IT-новостей для Telegram-канала."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=500,
-                temperature=0.7
-            )
+        # Потоковый режим с проверкой формата поста по мере генерации
+        self.streaming = os.getenv('AI_STREAMING', '0') == '1'
+        self.stream_max_retries = int(os.getenv('AI_STREAM_MAX_RETRIES', '2'))  # Повторов на модель при нарушении формата
+
+        # Постоянный кэш ответов LLM
+        self.cache = LLMCache(db)
+
+        # Кэш и результаты обработки записываются через отдельное соединение в своем потоке, не блокируя event loop
+        self.db_thread = DatabaseThread("ai-db")
 
-            # Получение ответа от AI
-            ai_response = completion.choices[0].message.content.strip()
+        # Упорядоченный список моделей с резервированием
+        self.router = ModelRouter()
 
-            # Разделение на заголовок и контент
-            lines = ai_response.split('\n')
-            processed_title = lines[0] if lines else ""
-            processed_content = '\n'.join(lines[1:]) if len(lines) > 1 else ""
+        # Асинхронный клиент и семафор создаются при первом использовании в event loop
+        # (библиотека openai загружается долго, поэтому импортируется там же)
+        self.async_client = None
+        self._semaphore = None
+        self._async_loop = None
 
-            # Сохранение обработанной новости в базу данных
-            processed_id = self.db.save_processed_news(
-                news_item['id'],
-                processed_title,
-                processed_content
+    def _ensure_async_resources(self):
+        """Получение асинхронного клиента и семафора для текущего event loop"""
+        loop = asyncio.get_running_loop()
+        # Соединения httpx привязаны к event loop, поэтому при смене loop создаем клиент заново
+        if self.async_client is None or self._async_loop is not loop:
+            from openai import AsyncOpenAI
+            self.async_client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.openrouter_api_key,
+                timeout=self.request_timeout,
+                max_retries=0
             )
+            self._semaphore = asyncio.Semaphore(self.max_concurrent)
+            self._async_loop = loop
+        return self.async_client, self._semaphore
+
+    def _prepare_prompt(self, news_item):
+        """Проверка контента и подготовка промта для новости"""
+        # Проверка наличия и длины контента
+        content = news_item.get('content', '')
+        content_length = len(content)
+
+        if content_length < 50:
+            logger.warning(f"Контент новости '{news_item['title']}' слишком короткий ({content_length} символов). Качество обработки может быть низким.")
+        else:
+            logger.info(f"Обработка новости '{news_item['title']}' с контентом длиной {content_length} символов")
+
+        # Подготовка промта в рамках бюджета токенов
+        return self.prompt_builder.build(news_item)
+
+    def _build_request(self, prompt, model):
+        """Формирование параметров запроса к OpenRouter API"""
+        return {
+            "extra_headers": {
+                "HTTP-Referer": self.site_url,  # Для рейтинга на openrouter.ai
+                "X-Title": self.site_name,      # Для рейтинга на openrouter.ai
+            },
+            "extra_body": {},
+            "model": model,
+            "messages": [
+                {"role": "system", "content": self.system_prompt},
+                {"role": "user", "content": prompt}
+            ],
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature
+        }
+
+    def _cache_key(self, request):
+        """Ключ кэша для параметров запроса"""
+        messages = request["messages"]
+        return self.cache.make_key(
+            request["model"],
+            messages[0]["content"],
+            messages[1]["content"],
+            request["temperature"],
+            request["max_tokens"]
+        )
+
+    def _extract_response(self, completion):
+        """Извлечение текста ответа, пустой ответ считается ошибкой модели"""
+        if not completion.choices or not completion.choices[0].message.content:
+            raise ValueError("Пустой ответ модели")
+        return completion.choices[0].message.content.strip(), completion.usage
+
+    def _record_usage(self, model, usage):
+        """Учет израсходованных токенов в метриках и текущем отрезке трассировки"""
+        if usage is None:
+            return
+        metrics.LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model, kind="prompt")
+        metrics.LLM_TOKENS.inc(usage.completion_tokens or 0, model=model, kind="completion")
+        span = tracing.current_span()
+        if span is not None:
+            span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens)
+
+    def _mark_cached(self):
+        """Отметка в трассировке, что ответ взят из кэша без запроса к модели"""
+        span = tracing.current_span()
+        if span is not None:
+            span.set(cached=True)
+
+    def _cache_keys(self, prompt):
+        """Ключи кэша запроса для всех моделей цепочки"""
+        return {model: self._cache_key(self._build_request(prompt, model)) for model in self.router.models}
+
+    async def _lookup_cache(self, cache_keys):
+        """Поиск ответа в кэше по ключам всех моделей цепочки"""
+        if not self.cache.enabled:
+            return None
+        cached = await self.db_thread.run(lambda db: self.cache.get(list(cache_keys.values()), db))
+        return cached["completion"] if cached else None
+
+    async def _complete_async(self, prompt):
+        """Асинхронное получение ответа AI из кэша или через OpenRouter API с резервированием"""
+        cache_keys = self._cache_keys(prompt)
+        cached = await self._lookup_cache(cache_keys)
+        if cached:
+            self._mark_cached()
+            return cached
+
+        client, semaphore = self._ensure_async_resources()
+
+        async def call(model):
+            with tracing.span("llm.request", model=model, streaming=self.streaming):
+                if self.streaming:
+                    result = await self._stream_with_validation(client, semaphore, prompt, model)
+                else:
+                    async with semaphore:
+                        # Ожидание свободного места в лимите запросов в минуту
+                        await self.rate_limiter.acquire()
+                        with metrics.track(metrics.LLM_SECONDS, metrics.LLM_REQUESTS, model=model):
+                            completion = await asyncio.wait_for(
+                                client.chat.completions.create(**self._build_request(prompt, model)),
+                                timeout=self.request_timeout
+                            )
+                            result = self._extract_response(completion)
+                self._record_usage(model, result[1])
+            return result
+
+        model, (ai_response, usage) = await self.router.complete_async(call)
+        logger.info(f"Ответ получен от модели {model}")
+        if self.cache.enabled:
+            await self.db_thread.run(lambda db: self.cache.set(cache_keys[model], model, ai_response, usage, db))
+        return ai_response
+
+    async def _consume_stream(self, stream, validator):
+        """Чтение потока токенов с проверкой формата, возвращает расход токенов"""
+        usage = None
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                # При явном нарушении формата validator выбрасывает PostFormatError
+                validator.feed(chunk.choices[0].delta.content)
+        return usage
+
+    async def _stream_with_validation(self, client, semaphore, prompt, model):
+        """Потоковое получение ответа с отменой и повтором при нарушении формата"""
+        last_error = None
+        for attempt in range(self.stream_max_retries + 1):
+            validator = StreamingPostValidator()
+            async with semaphore:
+                # Ожидание свободного места в лимите запросов в минуту
+                await self.rate_limiter.acquire()
+                started = time.perf_counter()
+                status = "error"
+                stream = None
+                try:
+                    stream = await asyncio.wait_for(
+                        client.chat.completions.create(
+                            **self._build_request(prompt, model),
+                            stream=True,
+                            stream_options={"include_usage": True}
+                        ),
+                        timeout=self.request_timeout
+                    )
+                    usage = await asyncio.wait_for(
+                        self._consume_stream(stream, validator),
+                        timeout=self.request_timeout
+                    )
+                    result = validator.finish()
+                    status = "ok"
+                    return result, usage
+                except PostFormatError as e:
+                    status = "format_error"
+                    last_error = e
+                    logger.warning(f"Модель {model} нарушила формат поста (попытка {attempt + 1}), "
+                                   f"генерация прервана после {len(validator.text)} символов: {e}")
+                finally:
+                    metrics.LLM_SECONDS.observe(time.perf_counter() - started, model=model)
+                    metrics.LLM_REQUESTS.inc(model=model, status=status)
+                    # Закрытие соединения прекращает генерацию и расход токенов
+                    if stream is not None:
+                        await stream.close()
+
+        raise last_error
+
+    def _save_result(self, db, news_item, ai_response):
+        """Разбор ответа AI и сохранение обработанной новости (выполняется в потоке db_thread)"""
+        # Разделение на заголовок и контент
+        lines = ai_response.split('\n')
+        processed_title = lines[0] if lines else ""
+        processed_content = '\n'.join(lines[1:]) if len(lines) > 1 else ""
+
+        # Сохранение обработанной новости в базу данных
+        processed_id = db.save_processed_news(
+            news_item['id'],
+            processed_title,
+            processed_content,
+            news_item.get('job_id'),
+            news_item.get('worker_id')
+        )
+
+        if processed_id:
+            logger.info(f"Новость успешно обработана и сохранена с ID {processed_id}")
+            return {
+                "id": news_item['id'],
+                "processed_title": processed_title,
+                "processed_content": processed_content,
+                "success": True
+            }
+        elif processed_id is None:
+            # Аренда задачи истекла и ее обрабатывает другой воркер - его результат и будет сохранен
+            return {"success": False, "error": "Job lease lost", "lease_lost": True}
+        else:
+            logger.error(f"Не удалось сохранить обработанную новость в базу данных")
+            return {"success": False, "error": "Database error"}
+
+    @staticmethod
+    def _trace_result(span, result):
+        """Итог обработки в отрезке трассировки"""
+        if not result.get("success"):
+            span.status = "error"
+            span.error = result.get("error")
+        return result
+
+    async def process_news_async(self, news_item):
+        """Асинхронная обработка новости с помощью AI с ограничением частоты и таймаутом"""
+        with tracing.span("ai.process", news_item.get('trace_id'), news_id=news_item.get('id'),
+                          attempt=news_item.get('attempts')) as span:
+            try:
+                prompt = self._prepare_prompt(news_item)
+
+                logger.info(f"Асинхронная отправка новости '{news_item['title']}' на обработку AI через OpenRouter")
+
+                # Получение ответа от AI
+                ai_response = await self._complete_async(prompt)
+
+                # Сохраняем результат сразу после получения, не дожидаясь остальных новостей
+                result = await self.db_thread.run(self._save_result, news_item, ai_response)
+                return self._trace_result(span, result)
+
+            except Exception as e:
+                logger.error(f"Ошибка при асинхронной обработке новости: {e}")
+                return self._trace_result(span, {"success": False, "error": str(e)})
+
+    def check_content(self, news_item):
+        """Проверка качества контента перед обработкой, возвращает результат пропуска или None"""
+        content_length = len(news_item.get('content', ''))
+        if content_length < 50:
+            logger.warning(f"Пропуск новости '{news_item['title']}' из-за недостаточного контента ({content_length} символов)")
+            return {
+                "id": news_item['id'],
+                "success": False,
+                "error": "Insufficient content length",
+                "content_length": content_length
+            }
+        return None
 
-            if processed_id:
-                logger.info(f"Новость успешно обработана и сохранена с ID {processed_id}")
-                return {
-                    "id": news_item['id'],
-                    "processed_title": processed_title,
-                    "processed_content": processed_content,
-                    "success": True
-                }
-            else:
-                logger.error(f"Не удалось сохранить обработанную новость в базу данных")
-                return {"success": False, "error": "Database error"}
-
-        except Exception as e:
-            logger.error(f"Ошибка при обработке новости: {e}")
-            return {"success": False, "error": str(e)}
-
-    def process_batch(self, news_items, batch_size=5):
-        """Обработка пакета новостей с учетом качества контента"""
-        results = []
-        count = 0
-        skipped = 0
-
-        for news_item in news_items:
-            if count >= batch_size:
-                break
-
-            # Проверка качества контента
-            content_length = len(news_item.get('content', ''))
-            if content_length < 50:
-                logger.warning(f"Пропуск новости '{news_item['title']}' из-за недостаточного контента ({content_length} символов)")
-                results.append({
-                    "id": news_item['id'],
-                    "success": False,
-                    "error": "Insufficient content length",
-                    "content_length": content_length
-                })
-                skipped += 1
-                continue
-
-            # Обработка новости
-            result = self.process_news(news_item)
-            results.append(result)
-
-            if result["success"]:
-                count += 1
-            else:
-                logger.error(f"Ошибка при обработке новости '{news_item['title']}': {result.get('error', 'Неизвестная ошибка')}")
-
-        logger.info(f"Обработано {count} новостей, пропущено {skipped} из {len(news_items)}")
-        return results
\ No newline at end of file
+    def close(self):
+        """Закрытие соединения, через которое сохраняются результаты"""
+        self.db_thread.close()
@@ -0,0 +1,305 @@
+"""Сквозной бенчмарк без внешних сервисов: newsdata.io, сайты, OpenRouter и Telegram заменены заглушками.
+
+Запуск из корня проекта:
+    python -m bench.run --scenario all --count 200 --concurrency 10
+
+Данные пишутся в отдельную базу (по умолчанию news_bot_bench), ее нужно создать заранее.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from dotenv import load_dotenv
+from bench.stubs import StubServers, StubConfig
+
+# Лимиты приложения рассчитаны на реальные сервисы; в бенчмарке измеряется сам код.
+# Любое значение можно переопределить переменной окружения перед запуском.
+BENCH_ENV = {
+    "AI_REQUESTS_PER_MINUTE": "1000000",
+    "AI_HEDGE_REQUESTS": "0",
+    "LLM_CACHE_ENABLED": "0",
+    "TELEGRAM_GLOBAL_RATE": "1000000",
+    "TELEGRAM_CHAT_RATE": "60000000",
+    "TELEGRAM_CHAT_BURST": "1000000",
+    "TELEGRAM_CHANNEL_ID": "@bench",
+    "TELEGRAM_BOT_TOKEN": "1:bench",
+    "OPENROUTER_API_KEY": "bench",
+    "NEWS_API_KEY": "bench",
+    "TRACE_EXPORT": "none",
+    "LOG_LEVEL": "WARNING",
+}
+
+SCENARIOS = ["news_api", "scraper", "ai", "publisher", "pipeline"]
+
+def percentile(values, q):
+    """Перцентиль q (0-100) по отсортированным значениям"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def peak_rss_mb():
+    """Пиковый объем памяти процесса (МБ) или None, если платформа не сообщает его"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux сообщает килобайты, macOS - байты
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+class ScenarioResult:
+    """Итоги сценария: пропускная способность, задержки и память"""
+
+    def __init__(self, name, operations, errors, wall_seconds, latencies, py_peak_mb=None, extra=None):
+        self.name = name
+        self.operations = operations
+        self.errors = errors
+        self.wall_seconds = wall_seconds
+        self.latencies = latencies
+        self.py_peak_mb = py_peak_mb
+        self.rss_mb = peak_rss_mb()
+        self.extra = extra or {}
+
+    def to_dict(self):
+        p50, p99 = percentile(self.latencies, 50), percentile(self.latencies, 99)
+        return {
+            "scenario": self.name,
+            "operations": self.operations,
+            "errors": self.errors,
+            "wall_s": round(self.wall_seconds, 3),
+            "throughput_per_s": round(self.operations / self.wall_seconds, 2) if self.wall_seconds else None,
+            "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+            "p99_ms": round(p99 * 1000, 1) if p99 is not None else None,
+            "peak_rss_mb": round(self.rss_mb, 1) if self.rss_mb is not None else None,
+            "py_peak_mb": round(self.py_peak_mb, 1) if self.py_peak_mb is not None else None,
+            **self.extra,
+        }
+
+async def measure(items, func, concurrency):
+    """Выполнение func для всех элементов с ограничением параллельности; (задержки, ошибки, время)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(item):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = bool(await func(item))
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in items))
+    return latencies, errors, time.perf_counter() - started
+
+class BenchContext:
+    """Общие для сценариев база данных, заглушки и параметры запуска"""
+
+    def __init__(self, db, stubs, args):
+        self.db = db
+        self.stubs = stubs
+        self.args = args
+        self.run_id = uuid.uuid4().hex[:8]
+
+    def create_news(self, tag, count, processed=False):
+        """Новости для сценариев AI-обработки и публикации (подготовка не входит в замер)"""
+        news_items = []
+        for i in range(count):
+            # Уникальные заголовки, иначе проверка дубликатов отбросит новости
+            title = f"Bench {tag}: Python developers adopt new AI framework {self.run_id}-{i}"
+            content = ("The software engineer team shipped a new API for cloud developers. " * 40).strip()
+            url = f"{self.stubs.base_url('articles')}/articles/{self.run_id}-{tag}-{i}"
+            news_id = self.db.save_news(title, content, url, time_now(), "ai")
+            if not news_id:
+                continue
+            if processed:
+                self.db.save_processed_news(news_id, f"НОВОСТЬ {i} 🚀", "Текст поста 💻 для бенчмарка.\n\n#AI")
+            news_items.append({"id": news_id, "title": title, "content": content, "url": url, "category": "ai"})
+        return news_items
+
+def time_now():
+    from datetime import datetime
+    return datetime.now()
+
+async def scenario_news_api(ctx):
+    """Запросы к API новостей: NewsAPI.fetch_news_async"""
+    import aiohttp
+    from news_api import NewsAPI
+    api = NewsAPI(ctx.db)
+    async with aiohttp.ClientSession() as session:
+        latencies, errors, wall = await measure(
+            range(ctx.args.count),
+            lambda i: api.fetch_news_async(session, keyword=f"bench{i}", max_results=ctx.args.page_size),
+            ctx.args.concurrency,
+        )
+    return latencies, errors, wall, {}
+
+async def scenario_scraper(ctx):
+    """Загрузка и разбор страниц статей: WebScraper.get_full_article_content_async"""
+    from web_scraper import WebScraper
+    scraper = WebScraper(ctx.db)
+    scraper.retry_delay = ctx.args.retry_delay
+    urls = [f"{ctx.stubs.base_url('articles')}/articles/{ctx.run_id}-scrape-{i}" for i in range(ctx.args.count)]
+    try:
+        latencies, errors, wall = await measure(urls, scraper.get_full_article_content_async, ctx.args.concurrency)
+    finally:
+        await scraper.close()
+    return latencies, errors, wall, {}
+
+async def scenario_ai(ctx):
+    """AI-обработка новостей: AIProcessor.process_news_async"""
+    from ai_processor import AIProcessor
+    news_items = ctx.create_news("ai", ctx.args.count)
+    processor = AIProcessor(ctx.db)
+    processor.streaming = ctx.args.streaming
+    try:
+        latencies, errors, wall = await measure(
+            news_items,
+            lambda item: _success(processor.process_news_async(item)),
+            ctx.args.concurrency,
+        )
+    finally:
+        processor.close()
+    return latencies, errors, wall, {"streaming": ctx.args.streaming}
+
+async def scenario_publisher(ctx):
+    """Публикация обработанных новостей: TelegramPublisher.publish_news"""
+    from telegram_publisher import TelegramPublisher
+    news_items = ctx.create_news("publish", ctx.args.count, processed=True)
+    publisher = TelegramPublisher(ctx.db)
+    try:
+        latencies, errors, wall = await measure(news_items, publisher.publish_news, ctx.args.concurrency)
+    finally:
+        await publisher.close()
+    return latencies, errors, wall, {}
+
+async def scenario_pipeline(ctx):
+    """Весь конвейер: получение → скрапинг → сохранение → AI → планирование (NewsPipeline.run)"""
+    from news_api import NewsAPI
+    from ai_processor import AIProcessor
+    from job_queue import AIWorker
+    from pipeline import NewsPipeline
+    per_keyword = 5  # NewsPipeline запрашивает 5 новостей на ключевое слово
+    keywords = [f"bench-{ctx.run_id}-{i}" for i in range(max(1, ctx.args.count // per_keyword))]
+    processor = AIProcessor(ctx.db)
+    processor.streaming = ctx.args.streaming
+    pipeline = NewsPipeline(ctx.db, NewsAPI(ctx.db), AIWorker(ctx.db, processor, f"bench-{ctx.run_id}"))
+    pipeline.fetch_delay = ctx.args.fetch_delay
+    started = time.perf_counter()
+    try:
+        saved = await pipeline.run(keywords)
+    finally:
+        processor.close()
+    wall = time.perf_counter() - started
+    fetched = pipeline.stats["fetched"]
+    return [], fetched - pipeline.stats["ai"], wall, {
+        "fetched": fetched, "saved": saved, "ai_processed": pipeline.stats["ai"],
+        "scheduled": pipeline.stats["scheduled"], "operations_override": fetched,
+    }
+
+async def _success(coro):
+    result = await coro
+    return result and result.get("success")
+
+async def run_scenario(name, ctx):
+    """Запуск сценария с замером памяти"""
+    func = globals()[f"scenario_{name}"]
+    if ctx.args.tracemalloc:
+        tracemalloc.start()
+    latencies, errors, wall, extra = await func(ctx)
+    py_peak = None
+    if ctx.args.tracemalloc:
+        py_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    operations = extra.pop("operations_override", len(latencies))
+    return ScenarioResult(name, operations, errors, wall, latencies, py_peak, extra)
+
+def print_report(results, stubs):
+    """Таблица результатов"""
+    columns = ["scenario", "operations", "errors", "wall_s", "throughput_per_s", "p50_ms", "p99_ms", "peak_rss_mb", "py_peak_mb"]
+    rows = [[str(r.to_dict().get(c, "")) if r.to_dict().get(c) is not None else "-" for c in columns] for r in results]
+    widths = [max(len(c), *(len(row[i]) for row in rows)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(v.ljust(w) for v, w in zip(row, widths)))
+    for r in results:
+        if r.extra:
+            print(f"{r.name}: " + ", ".join(f"{k}={v}" for k, v in r.extra.items()))
+    print("Запросов к заглушкам: " + ", ".join(f"{k}={v}" for k, v in stubs.counters.items()))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера новостей на локальных заглушках внешних сервисов")
+    parser.add_argument("--scenario", choices=SCENARIOS + ["all"], default="all", help="Сценарий (по умолчанию все)")
+    parser.add_argument("--count", type=int, default=100, help="Операций (запросов, статей, новостей) в сценарии")
+    parser.add_argument("--concurrency", type=int, default=10, help="Одновременных операций")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Задержка ответа заглушек (мс)")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="Разброс задержки заглушек (мс)")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="Время генерации ответа модели (мс)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов заглушек с ошибкой (0..1)")
+    parser.add_argument("--page-size", type=int, default=10, help="Новостей на странице API новостей")
+    parser.add_argument("--article-kb", type=int, default=30, help="Размер HTML-страницы статьи (КБ)")
+    parser.add_argument("--retry-delay", type=float, default=0.1, help="Пауза между повторами скрапинга (сек)")
+    parser.add_argument("--fetch-delay", type=float, default=0.0, help="Пауза между запросами к API в конвейере (сек)")
+    parser.add_argument("--streaming", action="store_true", help="Потоковый режим AI-обработки")
+    parser.add_argument("--tracemalloc", action="store_true", help="Замер пикового объема памяти Python (замедляет код)")
+    parser.add_argument("--db-name", default="news_bot_bench", help="База данных для бенчмарка (создается заранее)")
+    parser.add_argument("--json", dest="json_path", help="Сохранить результаты в JSON-файл")
+    return parser.parse_args(argv)
+
+async def main(argv=None):
+    args = parse_args(argv)
+    for key, value in BENCH_ENV.items():
+        os.environ.setdefault(key, value)
+    load_dotenv(os.path.join(ROOT, ".env"))
+    if args.db_name == os.getenv("DB_NAME"):
+        sys.exit(f"База {args.db_name} используется приложением; бенчмарку нужна отдельная база (--db-name)")
+    os.environ["DB_NAME"] = args.db_name
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+
+    config = StubConfig(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                        page_size=args.page_size, article_kb=args.article_kb, llm_latency_ms=args.llm_latency_ms)
+    with StubServers(config) as stubs:
+        os.environ.update(stubs.env)
+        os.environ.setdefault("AI_MAX_CONCURRENT", str(args.concurrency))
+        # Файлы, которые приложение пишет в текущий каталог (кэш URL), не попадают в проект
+        os.chdir(tempfile.mkdtemp(prefix="news_bench_"))
+
+        from logging_config import setup_logging, shutdown_logging
+        setup_logging("bench")
+        from database import Database
+        db = Database()
+        ctx = BenchContext(db, stubs, args)
+        results = []
+        try:
+            for name in (SCENARIOS if args.scenario == "all" else [args.scenario]):
+                print(f"Сценарий {name}...", flush=True)
+                results.append(await run_scenario(name, ctx))
+        finally:
+            db.close()
+            shutdown_logging()
+        print_report(results, stubs)
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump([r.to_dict() for r in results], f, ensure_ascii=False, indent=2)
+    return results
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import random
+import asyncio
+import threading
+from datetime import datetime
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+TOPICS = [
+    "AI startup raises funding for machine learning platform",
+    "Python developers adopt new open source framework",
+    "Cybersecurity firm warns of ransomware targeting cloud APIs",
+    "Kubernetes release improves DevOps automation",
+    "Large language model beats benchmark on coding tasks",
+    "Blockchain project launches smart contract audit tool",
+]
+SENTENCE = ("The software engineer team shipped a new API for cloud developers, "
+            "using Python, Kubernetes and machine learning to automate data analytics. ")
+
+class StubConfig:
+    """Поведение заглушек: задержка ответа, доля ошибок и объем данных"""
+
+    def __init__(self, latency_ms=20, jitter_ms=10, error_rate=0.0, page_size=10, article_kb=30,
+                 llm_latency_ms=300, llm_tokens=180, seed=1):
+        self.latency_ms = latency_ms  # Задержка API новостей, страниц и Bot API
+        self.jitter_ms = jitter_ms  # Случайный разброс задержки
+        self.error_rate = error_rate  # Доля ответов с ошибкой (5xx/429)
+        self.page_size = page_size  # Новостей на странице API новостей
+        self.article_kb = article_kb  # Примерный размер HTML-страницы статьи
+        self.llm_latency_ms = llm_latency_ms  # Время генерации ответа модели
+        self.llm_tokens = llm_tokens  # Токенов в ответе модели
+        self.random = random.Random(seed)
+
+    async def delay(self, base_ms=None):
+        base = self.latency_ms if base_ms is None else base_ms
+        await asyncio.sleep(max(0.0, base + self.random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+
+    def failed(self):
+        return self.random.random() < self.error_rate
+
+class StubServers:
+    """Локальные заменители newsdata.io, сайтов со статьями, OpenAI-совместимого API и Bot API.
+
+    Серверы работают в отдельном потоке со своим event loop, чтобы не делить его с измеряемым кодом.
+    """
+
+    def __init__(self, config=None, host="127.0.0.1"):
+        self.config = config or StubConfig()
+        self.host = host
+        self.ports = {}
+        self.counters = {"news": 0, "articles": 0, "llm": 0, "telegram": 0, "errors": 0}
+        with open(os.path.join(FIXTURES_DIR, "article.html"), encoding="utf-8") as f:
+            self.article_template = f.read()
+        self._loop = None
+        self._thread = None
+        self._runners = []
+        self._message_id = 0
+
+    # --- newsdata.io ---
+
+    async def news_handler(self, request):
+        self.counters["news"] += 1
+        await self.config.delay()
+        if self.config.failed():
+            self.counters["errors"] += 1
+            return web.json_response({"status": "error", "results": {"message": "stub failure"}}, status=500)
+        size = int(request.query.get("size", self.config.page_size))
+        query = request.query.get("q", request.query.get("category", "technology"))
+        page = int(request.query.get("page", "1"))
+        results = []
+        for i in range(size):
+            article_id = f"{self.counters['news']}-{page}-{i}-{self.config.random.getrandbits(32):08x}"
+            results.append({
+                "article_id": article_id,
+                "title": f"{self.config.random.choice(TOPICS)} ({query} #{article_id})",
+                "link": f"{self.base_url('articles')}/articles/{article_id}",
+                "description": "Short teaser from the feed.",
+                "content": "",  # Как у бесплатного тарифа: полный текст получается скрапингом
+                "pubDate": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "source_id": "bench",
+                "category": ["technology"],
+                "language": "english",
+            })
+        return web.json_response({"status": "success", "totalResults": size * 10,
+                                  "results": results, "nextPage": str(page + 1)})
+
+    # --- сайты со статьями ---
+
+    async def article_handler(self, request):
+        self.counters["articles"] += 1
+        await self.config.delay()
+        if self.config.failed():
+            self.counters["errors"] += 1
+            return web.Response(status=503, text="Service Unavailable")
+        article_id = request.match_info["article_id"]
+        paragraphs_count = max(1, self.config.article_kb * 1024 // (len(SENTENCE) * 4 + 20))
+        paragraphs = "\n".join(f"        <p>{SENTENCE * 4}</p>" for _ in range(paragraphs_count))
+        html = self.article_template.format(
+            title=f"{TOPICS[hash(article_id) % len(TOPICS)]} #{article_id}",
+            published=datetime.now().strftime("%Y-%m-%d"),
+            paragraphs=paragraphs,
+        )
+        return web.Response(text=html, content_type="text/html")
+
+    # --- OpenAI-совместимый API ---
+
+    def _post_text(self, model):
+        body = " ".join(["Новый релиз 🚀 упрощает работу разработчиков 💻."] * max(1, self.config.llm_tokens // 12))
+        return f"НОВОСТЬ ДНЯ ДЛЯ РАЗРАБОТЧИКОВ 🔥\n\n{body}\n\nА вы уже попробовали? 🤔 #AI #Python ({model})"
+
+    async def llm_handler(self, request):
+        self.counters["llm"] += 1
+        payload = await request.json()
+        model = payload.get("model", "stub")
+        prompt_tokens = sum(len(m.get("content", "")) for m in payload.get("messages", [])) // 4
+        if self.config.failed():
+            self.counters["errors"] += 1
+            await self.config.delay()
+            return web.json_response({"error": {"message": "stub rate limit", "code": 429}}, status=429)
+
+        text = self._post_text(model)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": self.config.llm_tokens,
+                 "total_tokens": prompt_tokens + self.config.llm_tokens}
+        if not payload.get("stream"):
+            await self.config.delay(self.config.llm_latency_ms)
+            return web.json_response({
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        # Потоковый ответ (SSE): время генерации распределяется по фрагментам
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+        pause = self.config.llm_latency_ms / 1000 / max(1, len(chunks))
+        try:
+            for piece in chunks:
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                await asyncio.sleep(pause)
+            final = {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": model,
+                     "choices": [], "usage": usage}
+            await response.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+        except ConnectionResetError:
+            # Клиент прервал генерацию (например, из-за нарушения формата)
+            pass
+        return response
+
+    # --- Bot API ---
+
+    async def telegram_handler(self, request):
+        self.counters["telegram"] += 1
+        method = request.match_info["method"]
+        if request.content_type == "application/json":
+            data = await request.json()
+        else:
+            data = dict(await request.post())
+        await self.config.delay()
+        if method.lower() == "getme":
+            return web.json_response({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Bench",
+                                                             "username": "bench_bot"}})
+        if self.config.failed():
+            self.counters["errors"] += 1
+            return web.json_response({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1",
+                                      "parameters": {"retry_after": 1}}, status=429)
+        self._message_id += 1
+        return web.json_response({"ok": True, "result": {
+            "message_id": self._message_id, "date": int(time.time()),
+            "chat": {"id": -100, "type": "channel", "title": str(data.get("chat_id"))},
+            "text": str(data.get("text", "")),
+        }})
+
+    # --- запуск ---
+
+    def base_url(self, name):
+        return f"http://{self.host}:{self.ports[name]}"
+
+    @property
+    def env(self):
+        """Переменные окружения, направляющие приложение на заглушки"""
+        return {
+            "NEWS_API_BASE_URL": f"{self.base_url('news')}/api/1/news",
+            "OPENROUTER_BASE_URL": f"{self.base_url('llm')}/v1",
+            "TELEGRAM_API_BASE_URL": self.base_url("telegram"),
+        }
+
+    async def _start_app(self, name, routes):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.add_routes(routes)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, self.host, 0)
+        await site.start()
+        self._runners.append(runner)
+        self.ports[name] = runner.addresses[0][1]
+
+    async def _start_all(self):
+        await self._start_app("news", [web.get("/api/1/news", self.news_handler)])
+        await self._start_app("articles", [web.get("/articles/{article_id}", self.article_handler)])
+        await self._start_app("llm", [web.post("/v1/chat/completions", self.llm_handler)])
+        await self._start_app("telegram", [web.post("/bot{token}/{method}", self.telegram_handler)])
+
+    def start(self):
+        """Запуск всех заглушек в фоновом потоке"""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            try:
+                self._loop.run_until_complete(self._start_all())
+            except Exception as e:
+                errors.append(e)
+                ready.set()
+                self._loop.close()
+                return
+            ready.set()
+            try:
+                self._loop.run_forever()
+            finally:
+                self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="bench-stubs", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    def stop(self):
+        """Остановка заглушек"""
+        if self._loop is None:
+            return
+
+        async def cleanup():
+            for runner in self._runners:
+                await runner.cleanup()
+
+        asyncio.run_coroutine_threadsafe(cleanup(), self._loop).result(timeout=10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -1,43 +1,27 @@
 import os
 import logging
 import asyncio
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram import Dispatcher, Router
 from aiogram.filters import Command, CommandStart
 from aiogram.types import Message
 from dotenv import load_dotenv
 from database import Database
 from admin_panel import AdminPanel
+from fsm_storage import create_fsm_storage
+from telegram_governor import create_bot
+from logging_config import setup_logging
+from metrics import start_metrics_server
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("bot.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
-# Инициализация бота и диспетчера
-bot = Bot(token=os.getenv('TELEGRAM_BOT_TOKEN'))
-dp = Dispatcher(storage=MemoryStorage())
-
-# Инициализация базы данных
-db = Database()
-
-# Инициализация админ-панели
-admin_panel = AdminPanel(bot, db)
-
-# Регистрация роутера админ-панели
-dp.include_router(admin_panel.router)
+# Общие команды бота (админ-панель подключается в create_dispatcher)
+router = Router()
 
 # Обработчик команды /start
-@dp.message(CommandStart())
+@router.message(CommandStart())
 async def cmd_start(message: Message):
     await message.answer(
         "👋 Привет! Я бот для управления каналом @async_news_bot.\n\n"
@@ -47,7 +31,7 @@ async def cmd_start(message: Message):
     )
 
 # Обработчик команды /help
-@dp.message(Command(commands=["help"]))
+@router.message(Command(commands=["help"]))
 async def cmd_help(message: Message):
     await message.answer(
         "🔍 Справка по боту @async_news_bot\n\n"
@@ -63,7 +47,22 @@ async def cmd_help(message: Message):
         "- Просмотр графика публикаций"
     )
 
+def create_dispatcher(bot, db, news_api=None, ai_worker=None, http_session=None):
+    """Диспетчер бота с админ-панелью; состояния диалогов хранятся в базе данных.
+
+    news_api, ai_worker и http_session передаются, когда бот работает в одном процессе с планировщиком.
+    """
+    dp = Dispatcher(storage=create_fsm_storage(db))
+    admin_panel = AdminPanel(bot, db, news_api, ai_worker, http_session)
+    dp.include_router(router)
+    dp.include_router(admin_panel.router)
+    return dp, admin_panel
+
 async def main():
+    db = Database()
+    bot = create_bot(os.getenv('TELEGRAM_BOT_TOKEN'))
+    dp, admin_panel = create_dispatcher(bot, db)
+    
     logger.info("Запуск бота @async_news_bot")
     try:
         # Запуск бота
@@ -72,9 +71,12 @@ async def main():
         logger.error(f"Ошибка при запуске бота: {e}")
     finally:
         # Закрытие соединений при завершении работы
+        await admin_panel.close()
         await bot.session.close()
         db.close()
         logger.info("Бот остановлен")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    setup_logging("bot")
+    start_metrics_server()
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+import io
+import json
+import asyncio
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+def chart_fingerprint(kind, dates, counts):
+    """Отпечаток данных графика: одинаковые данные дают одинаковую картинку"""
+    payload = json.dumps([kind, [str(d) for d in dates], list(counts)])
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+def draw_publications_chart(dates, counts):
+    """PNG-график публикаций по дням (объектный API matplotlib, без глобального состояния pyplot)"""
+    # matplotlib загружается только при первом построении графика
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    import matplotlib.dates as mdates
+
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.plot(dates, counts, marker='o', linestyle='-', color='#1e88e5')
+
+    # Настройка графика
+    ax.set_title('График публикаций за последние 30 дней')
+    ax.set_xlabel('Дата')
+    ax.set_ylabel('Количество публикаций')
+    ax.grid(True, linestyle='--', alpha=0.7)
+
+    # Форматирование оси X для отображения дат
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%d.%m'))
+    ax.xaxis.set_major_locator(mdates.DayLocator(interval=5))
+    fig.autofmt_xdate()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', dpi=100)
+    return buf.getvalue()
+
+async def render_publications_chart(dates, counts):
+    """Построение графика в отдельном потоке, чтобы не блокировать обработку обновлений бота"""
+    return await asyncio.to_thread(draw_publications_chart, dates, counts)
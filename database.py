@@ -1,29 +1,82 @@
 import os
+import re
+import time
 import logging
+import asyncio
+import functools
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 import psycopg2
+import psycopg2.extensions
 from psycopg2 import sql
 from psycopg2.extras import DictCursor
 from dotenv import load_dotenv
+import metrics
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("database.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+SCHEMA_VERSION = 17  # Версия схемы: увеличивается при каждом изменении create_tables
+SCHEMA_LOCK_ID = 770046  # Ключ advisory-блокировки: схему обновляет только один процесс
+
+SQL_TARGET_RE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE|VIEW)\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+|CONCURRENTLY\s+)?([\w.]+)", re.IGNORECASE)
+
+@functools.lru_cache(maxsize=512)
+def query_labels(query):
+    """Метки метрики SQL-запроса: вид операции и основная таблица"""
+    text = query.decode('utf-8', 'replace') if isinstance(query, bytes) else query
+    words = text.split(None, 1)
+    operation = words[0].upper() if words else "UNKNOWN"
+    if operation == "WITH":
+        # Для CTE значима итоговая операция, а не подзапросы
+        match = re.search(r"\)\s*(SELECT|INSERT|UPDATE|DELETE)\b", text, re.IGNORECASE)
+        operation = match.group(1).upper() if match else operation
+    target = SQL_TARGET_RE.search(text)
+    return operation, target.group(1).lower() if target else "-"
+
+class TimedCursorMixin:
+    """Замер длительности запросов курсора для метрики db_query_seconds"""
+
+    def execute(self, query, vars=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self._observe(query, started)
+
+    def executemany(self, query, vars_list):
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self._observe(query, started)
+
+    def _observe(self, query, started):
+        operation, table = query_labels(query) if isinstance(query, (str, bytes)) else ("COMPOSED", "-")
+        metrics.DB_QUERY_SECONDS.observe(time.perf_counter() - started, operation=operation, table=table)
+
+@functools.lru_cache(maxsize=None)
+def timed_cursor_class(cursor_factory):
+    """Класс курсора с замером запросов поверх запрошенного (обычного, DictCursor и т.д.)"""
+    return type(f"Timed{cursor_factory.__name__}", (TimedCursorMixin, cursor_factory), {})
+
+class TimedConnection(psycopg2.extensions.connection):
+    """Соединение, все курсоры которого замеряют длительность запросов"""
+
+    def cursor(self, *args, **kwargs):
+        factory = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = timed_cursor_class(factory)
+        return super().cursor(*args, **kwargs)
+
 class Database:
+    _schema_ready = False  # Схема уже проверена в этом процессе
+    
     def __init__(self):
         self.conn = None
         self.connect()
-        self.create_tables()
+        self.ensure_schema()
     
     def connect(self):
         """Установка соединения с базой данных PostgreSQL"""
@@ -33,13 +86,77 @@ class Database:
                 port=os.getenv('DB_PORT'),
                 database=os.getenv('DB_NAME'),
                 user=os.getenv('DB_USER'),
-                password=os.getenv('DB_PASSWORD')
+                password=os.getenv('DB_PASSWORD'),
+                connection_factory=TimedConnection
             )
             logger.info("Успешное подключение к базе данных PostgreSQL")
         except Exception as e:
             logger.error(f"Ошибка подключения к базе данных: {e}")
             raise
     
+    def _schema_version(self, cursor):
+        """Версия схемы, записанная в базе данных (0, если схема еще не создавалась)"""
+        # Запрос к каталогу, а не to_regclass: кэш каталога не обновляется при ожидании advisory-блокировки
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM pg_catalog.pg_tables
+                WHERE schemaname = current_schema() AND tablename = 'schema_version'
+            )
+        """)
+        if not cursor.fetchone()[0]:
+            return 0
+        cursor.execute("SELECT version FROM schema_version WHERE id = 1")
+        row = cursor.fetchone()
+        return row[0] if row else 0
+    
+    def ensure_schema(self):
+        """Создание таблиц один раз на версию схемы, а не при каждом подключении"""
+        if Database._schema_ready:
+            return
+        try:
+            with self.conn.cursor() as cursor:
+                current = self._schema_version(cursor)
+                self.conn.commit()
+                if current != SCHEMA_VERSION:
+                    # Одновременно запущенные процессы не выполняют DDL параллельно
+                    cursor.execute("SELECT pg_advisory_lock(%s)", (SCHEMA_LOCK_ID,))
+                    try:
+                        current = self._schema_version(cursor)
+                        self.conn.commit()
+                        if current != SCHEMA_VERSION:
+                            self.create_tables()
+                            cursor.execute("""
+                                CREATE TABLE IF NOT EXISTS schema_version (
+                                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                                    version INTEGER NOT NULL,
+                                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                                )
+                            """)
+                            cursor.execute("""
+                                INSERT INTO schema_version (id, version) VALUES (1, %s)
+                                ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version, applied_at = CURRENT_TIMESTAMP
+                            """, (SCHEMA_VERSION,))
+                            self.conn.commit()
+                            logger.info(f"Схема базы данных обновлена до версии {SCHEMA_VERSION}")
+                    finally:
+                        cursor.execute("SELECT pg_advisory_unlock(%s)", (SCHEMA_LOCK_ID,))
+                        self.conn.commit()
+                
+                # Канал из переменных окружения регистрируется автоматически
+                default_channel = os.getenv('TELEGRAM_CHANNEL_ID')
+                if default_channel:
+                    cursor.execute("""
+                        INSERT INTO channels (chat_id, title)
+                        VALUES (%s, %s)
+                        ON CONFLICT (chat_id) DO NOTHING
+                    """, (default_channel, default_channel))
+                self.conn.commit()
+            Database._schema_ready = True
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при проверке схемы базы данных: {e}")
+            raise
+    
     def create_tables(self):
         """Создание необходимых таблиц, если они не существуют"""
         try:
@@ -69,6 +186,16 @@ class Database:
                         processed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                     )
                 """)
+                # Один результат обработки на новость; из накопившихся дубликатов остается последний
+                cursor.execute("""
+                    DELETE FROM processed_news p
+                    USING processed_news newer
+                    WHERE newer.news_id = p.news_id AND newer.id > p.id
+                """)
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_processed_news_news_id
+                    ON processed_news (news_id)
+                """)
                 
                 # Таблица для отслеживания запросов к API
                 cursor.execute("""
@@ -104,6 +231,11 @@ class Database:
                         UNIQUE(news_id)
                     )
                 """)
+                # Постраничный просмотр очереди в админ-панели (ключ страницы - время и ID новости)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_scheduled_posts_page
+                    ON scheduled_posts (scheduled_date, news_id)
+                """)
                 
                 # Таблица для хранения уведомлений администраторов
                 cursor.execute("""
@@ -116,6 +248,149 @@ class Database:
                     )
                 """)
                 
+                # Таблица для кэширования ответов LLM (ключ - хэш параметров запроса)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS llm_cache (
+                        cache_key CHAR(64) PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        completion TEXT NOT NULL,
+                        prompt_tokens INTEGER,
+                        completion_tokens INTEGER,
+                        total_tokens INTEGER,
+                        hits INTEGER DEFAULT 0,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        last_hit_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_llm_cache_last_hit
+                    ON llm_cache (last_hit_at)
+                """)
+                
+                # Очередь задач AI-обработки новостей
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS ai_jobs (
+                        id SERIAL PRIMARY KEY,
+                        news_id INTEGER UNIQUE REFERENCES news(id) ON DELETE CASCADE,
+                        state VARCHAR(20) DEFAULT 'queued',
+                        attempts INTEGER DEFAULT 0,
+                        available_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        lease_expires_at TIMESTAMP,
+                        locked_by TEXT,
+                        last_error TEXT,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_ai_jobs_ready
+                    ON ai_jobs (available_at) WHERE state IN ('queued', 'running')
+                """)
+                
+                # Задачи для новостей, сохраненных до появления очереди
+                cursor.execute("""
+                    INSERT INTO ai_jobs (news_id)
+                    SELECT id FROM news WHERE processed = FALSE
+                    ON CONFLICT (news_id) DO NOTHING
+                """)
+                
+                # Реестр каналов для публикации
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS channels (
+                        id SERIAL PRIMARY KEY,
+                        chat_id TEXT UNIQUE NOT NULL,
+                        title TEXT,
+                        hashtags TEXT DEFAULT '',
+                        publish_times TEXT,
+                        enabled BOOLEAN DEFAULT TRUE,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
+                # Доставки постов в каналы (одна строка на пару новость-канал)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS deliveries (
+                        id SERIAL PRIMARY KEY,
+                        news_id INTEGER REFERENCES news(id) ON DELETE CASCADE,
+                        channel_id INTEGER REFERENCES channels(id) ON DELETE CASCADE,
+                        scheduled_date TIMESTAMP NOT NULL,
+                        status VARCHAR(20) DEFAULT 'pending',
+                        attempts INTEGER DEFAULT 0,
+                        message_id BIGINT,
+                        last_error TEXT,
+                        sent_at TIMESTAMP,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE(news_id, channel_id)
+                    )
+                """)
+                # Доставки служат outbox: текст сообщения и время захвата отправителем
+                cursor.execute("ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS payload TEXT")
+                cursor.execute("ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS claimed_at TIMESTAMP")
+                # Ход отправки многочастного сообщения: повтор продолжается с первой неотправленной части
+                cursor.execute("ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS sent_parts INTEGER DEFAULT 0")
+                cursor.execute("ALTER TABLE deliveries ADD COLUMN IF NOT EXISTS message_ids TEXT")
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_deliveries_due
+                    ON deliveries (scheduled_date) WHERE status = 'pending'
+                """)
+                
+                # Сообщения, подготовленные к отправке при планировании поста
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS rendered_messages (
+                        news_id INTEGER REFERENCES news(id) ON DELETE CASCADE,
+                        channel_id INTEGER REFERENCES channels(id) ON DELETE CASCADE,
+                        parts TEXT NOT NULL,
+                        rendered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (news_id, channel_id)
+                    )
+                """)
+                
+                # Оценка приоритета новости и ключ кластера дубликатов (см. ranking.py)
+                cursor.execute("ALTER TABLE news ADD COLUMN IF NOT EXISTS rank_score DOUBLE PRECISION")
+                cursor.execute("ALTER TABLE news ADD COLUMN IF NOT EXISTS cluster_key TEXT")
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_news_rank_ready
+                    ON news (rank_score DESC NULLS LAST) WHERE processed = TRUE AND published = FALSE
+                """)
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_news_cluster_key ON news (cluster_key)")
+                # Поиск кластера дубликатов читает только новости из окна вокруг даты публикации
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_news_published_date ON news (published_date DESC)")
+                # Новости, сохраненные до появления оценки, досчитываются перед планированием
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_news_unscored
+                    ON news (published_date DESC) WHERE rank_score IS NULL AND published = FALSE
+                """)
+                
+                # Идентификатор трассировки связывает этапы обработки новости (tracing.py)
+                cursor.execute("ALTER TABLE news ADD COLUMN IF NOT EXISTS trace_id TEXT")
+                
+                # Сводная статистика по категориям: один проход по news при обновлении
+                cursor.execute("""
+                    CREATE MATERIALIZED VIEW IF NOT EXISTS news_category_stats AS
+                    SELECT category,
+                           COUNT(*) AS total,
+                           COUNT(*) FILTER (WHERE published) AS published,
+                           COUNT(*) FILTER (WHERE processed AND NOT published) AS scheduled,
+                           COUNT(*) FILTER (WHERE processed) AS processed,
+                           NOW() AS refreshed_at
+                    FROM news
+                    GROUP BY category
+                """)
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_news_category_stats
+                    ON news_category_stats (category)
+                """)
+                
+                # Состояния диалогов админ-панели (FSM aiogram)
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS fsm_states (
+                        key TEXT PRIMARY KEY,
+                        state TEXT,
+                        data TEXT NOT NULL DEFAULT '{}',
+                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                """)
+                
                 # Добавление настроек часового пояса и времени публикации, если их нет
                 cursor.execute("""
                     INSERT INTO schedule_settings (name, value, description)
@@ -140,7 +415,7 @@ class Database:
             logger.error(f"Ошибка при создании таблиц: {e}")
             raise
     
-    def save_news(self, title, content, url, published_date, category):
+    def save_news(self, title, content, url, published_date, category, trace_id=None):
         """Сохранение новости в базу данных"""
         try:
             # Проверяем соединение перед выполнением запроса
@@ -152,26 +427,32 @@ class Database:
                 # Проверка, существует ли уже новость с таким URL
                 cursor.execute("SELECT id FROM news WHERE url = %s", (url,))
                 if cursor.fetchone() is not None:
-                    logger.info(f"Новость с URL {url} уже существует в базе данных")
+                    logger.debug(f"Новость с URL {url} уже существует в базе данных")
                     return False
                 
                 # Вставка новой новости
                 cursor.execute("""
-                    INSERT INTO news (title, content, url, published_date, category)
-                    VALUES (%s, %s, %s, %s, %s)
+                    INSERT INTO news (title, content, url, published_date, category, trace_id)
+                    VALUES (%s, %s, %s, %s, %s, %s)
                     RETURNING id
-                """, (title, content, url, published_date, category))
+                """, (title, content, url, published_date, category, trace_id))
                 news_id = cursor.fetchone()[0]
+                
+                # Постановка новости в очередь AI-обработки в той же транзакции
+                cursor.execute("""
+                    INSERT INTO ai_jobs (news_id) VALUES (%s)
+                    ON CONFLICT (news_id) DO NOTHING
+                """, (news_id,))
                 self.conn.commit()
-                logger.info(f"Новость с ID {news_id} успешно сохранена")
+                logger.debug(f"Новость с ID {news_id} успешно сохранена")
                 return news_id
         except Exception as e:
             self.conn.rollback()
             logger.error(f"Ошибка при сохранении новости: {e}")
             return False
     
-    def save_processed_news(self, news_id, processed_title, processed_content):
-        """Сохранение обработанной новости"""
+    def save_processed_news(self, news_id, processed_title, processed_content, job_id=None, worker_id=None):
+        """Сохранение обработанной новости; None, если задача AI-обработки уже не принадлежит воркеру"""
         try:
             # Проверяем соединение перед выполнением запроса
             if not self.ensure_connection():
@@ -179,12 +460,44 @@ class Database:
                 return False
                 
             with self.conn.cursor() as cursor:
+                # Завершение задачи AI-обработки в той же транзакции
+                if job_id is not None:
+                    # Результат принимается, только если аренда задачи не истекла и ее не захватил другой воркер
+                    cursor.execute("""
+                        UPDATE ai_jobs
+                        SET state = 'done', lease_expires_at = NULL, last_error = NULL,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE id = %s AND locked_by = %s AND state = 'running'
+                    """, (job_id, worker_id))
+                    if cursor.rowcount == 0:
+                        self.conn.rollback()
+                        logger.warning(f"Задача AI-обработки #{job_id} больше не принадлежит воркеру {worker_id}, "
+                                       f"результат для новости {news_id} отброшен")
+                        return None
+                else:
+                    cursor.execute("""
+                        UPDATE ai_jobs
+                        SET state = 'done', lease_expires_at = NULL, last_error = NULL,
+                            updated_at = CURRENT_TIMESTAMP
+                        WHERE news_id = %s
+                    """, (news_id,))
+                
                 cursor.execute("""
                     INSERT INTO processed_news (news_id, processed_title, processed_content)
                     VALUES (%s, %s, %s)
+                    ON CONFLICT (news_id) DO NOTHING
                     RETURNING id
                 """, (news_id, processed_title, processed_content))
-                processed_id = cursor.fetchone()[0]
+                row = cursor.fetchone()
+                if row is None:
+                    # Новость уже обработана - остается сохраненный ранее результат
+                    cursor.execute("SELECT id FROM processed_news WHERE news_id = %s", (news_id,))
+                    processed_id = cursor.fetchone()[0]
+                    logger.debug(f"Новость {news_id} уже обработана, повторный результат не сохранен")
+                else:
+                    processed_id = row[0]
+                    # Подготовленные ранее сообщения больше не соответствуют тексту
+                    cursor.execute("DELETE FROM rendered_messages WHERE news_id = %s", (news_id,))
                 
                 # Обновление статуса обработки в таблице news
                 cursor.execute("""
@@ -193,7 +506,7 @@ class Database:
                 """, (news_id,))
                 
                 self.conn.commit()
-                logger.info(f"Обработанная новость с ID {processed_id} успешно сохранена")
+                logger.debug(f"Обработанная новость с ID {processed_id} успешно сохранена")
                 return processed_id
         except Exception as e:
             self.conn.rollback()
@@ -231,7 +544,10 @@ class Database:
                     FROM news n
                     JOIN processed_news p ON n.id = p.news_id
                     WHERE n.processed = TRUE AND n.published = FALSE
-                    ORDER BY n.published_date DESC
+                      AND NOT EXISTS (
+                          SELECT 1 FROM scheduled_posts s WHERE s.news_id = n.id AND s.status = 'cancelled'
+                      )
+                    ORDER BY n.rank_score DESC NULLS LAST, n.published_date DESC
                     LIMIT %s
                 """, (limit,))
                 return cursor.fetchall()
@@ -248,7 +564,7 @@ class Database:
                     VALUES (%s, %s)
                 """, (api_name, success))
                 self.conn.commit()
-                logger.info(f"Запрос к API {api_name} успешно залогирован")
+                logger.debug(f"Запрос к API {api_name} успешно залогирован")
         except Exception as e:
             self.conn.rollback()
             logger.error(f"Ошибка при логировании запроса к API: {e}")
@@ -383,13 +699,62 @@ class Database:
                 """, (news_id, scheduled_date))
                 post_id = cursor.fetchone()[0]
                 self.conn.commit()
-                logger.info(f"Пост с ID {news_id} запланирован на {scheduled_date}")
+                logger.debug(f"Пост с ID {news_id} запланирован на {scheduled_date}")
                 return post_id
         except Exception as e:
             self.conn.rollback()
             logger.error(f"Ошибка при планировании поста: {e}")
             return False
     
+    def shift_pending_posts(self, hours):
+        """Сдвиг всех ожидающих публикации постов на заданное число часов одним запросом"""
+        try:
+            # Проверяем соединение перед выполнением запроса
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return None
+                
+            with self.conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE scheduled_posts
+                    SET scheduled_date = scheduled_date + make_interval(hours => %s)
+                    WHERE status = 'pending'
+                """, (hours,))
+                shifted = cursor.rowcount
+                self.conn.commit()
+                logger.info(f"Сдвинуто {shifted} запланированных постов на {hours} ч")
+                return shifted
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при сдвиге запланированных постов: {e}")
+            return None
+    
+    def cancel_pending_posts_by_category(self, category):
+        """Снятие с публикации всех ожидающих постов категории одним запросом"""
+        try:
+            # Проверяем соединение перед выполнением запроса
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return None
+                
+            with self.conn.cursor() as cursor:
+                # Статус cancelled, а не удаление: иначе автопланирование сразу вернет посты в очередь
+                cursor.execute("""
+                    UPDATE scheduled_posts s
+                    SET status = 'cancelled'
+                    FROM news n
+                    WHERE n.id = s.news_id AND LOWER(n.category) = LOWER(%s)
+                      AND s.status IN ('pending', 'error')
+                """, (category,))
+                cancelled = cursor.rowcount
+                self.conn.commit()
+                logger.info(f"Снято с публикации {cancelled} постов категории {category}")
+                return cancelled
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при снятии с публикации постов категории {category}: {e}")
+            return None
+    
     def get_scheduled_posts(self, limit=10):
         """Получение запланированных постов"""
         try:
@@ -429,7 +794,7 @@ class Database:
                 result = cursor.fetchone()
                 self.conn.commit()
                 if result:
-                    logger.info(f"Статус поста с ID {post_id} обновлен на {status}")
+                    logger.debug(f"Статус поста с ID {post_id} обновлен на {status}")
                     return True
                 return False
         except Exception as e:
@@ -437,8 +802,274 @@ class Database:
             logger.error(f"Ошибка при обновлении статуса поста: {e}")
             return False
     
+    def get_llm_cache_entries(self, cache_keys, max_age_days):
+        """Получение ответов LLM из кэша по списку ключей с обновлением статистики обращений"""
+        try:
+            # Проверяем соединение перед выполнением запроса
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return {}
+                
+            with self.conn.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute("""
+                    UPDATE llm_cache
+                    SET hits = hits + 1, last_hit_at = CURRENT_TIMESTAMP
+                    WHERE cache_key = ANY(%s)
+                      AND created_at > NOW() - make_interval(days => %s)
+                    RETURNING cache_key, model, completion, prompt_tokens, completion_tokens, total_tokens
+                """, (list(cache_keys), max_age_days))
+                result = {row['cache_key']: dict(row) for row in cursor.fetchall()}
+                self.conn.commit()
+                return result
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при получении ответа LLM из кэша: {e}")
+            return {}
+    
+    def save_llm_cache_entry(self, cache_key, model, completion, prompt_tokens=None,
+                             completion_tokens=None, total_tokens=None):
+        """Сохранение ответа LLM в кэш"""
+        try:
+            # Проверяем соединение перед выполнением запроса
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return False
+                
+            with self.conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO llm_cache (cache_key, model, completion, prompt_tokens,
+                                           completion_tokens, total_tokens)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (cache_key) DO UPDATE
+                    SET completion = EXCLUDED.completion,
+                        prompt_tokens = EXCLUDED.prompt_tokens,
+                        completion_tokens = EXCLUDED.completion_tokens,
+                        total_tokens = EXCLUDED.total_tokens,
+                        created_at = CURRENT_TIMESTAMP,
+                        last_hit_at = CURRENT_TIMESTAMP
+                """, (cache_key, model, completion, prompt_tokens, completion_tokens, total_tokens))
+                self.conn.commit()
+                return True
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при сохранении ответа LLM в кэш: {e}")
+            return False
+    
+    def evict_llm_cache(self, max_entries, max_age_days):
+        """Удаление устаревших записей кэша LLM и записей сверх лимита размера"""
+        try:
+            # Проверяем соединение перед выполнением запроса
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return 0
+                
+            with self.conn.cursor() as cursor:
+                # Удаление записей старше max_age_days
+                cursor.execute("""
+                    DELETE FROM llm_cache
+                    WHERE created_at <= NOW() - make_interval(days => %s)
+                """, (max_age_days,))
+                deleted = cursor.rowcount
+                
+                # Удаление давно не использовавшихся записей сверх лимита
+                cursor.execute("""
+                    DELETE FROM llm_cache
+                    WHERE cache_key IN (
+                        SELECT cache_key FROM llm_cache
+                        ORDER BY last_hit_at DESC
+                        OFFSET %s
+                    )
+                """, (max_entries,))
+                deleted += cursor.rowcount
+                self.conn.commit()
+                if deleted:
+                    logger.info(f"Из кэша LLM удалено {deleted} записей")
+                return deleted
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при очистке кэша LLM: {e}")
+            return 0
+    
+    def get_channels(self, enabled_only=True):
+        """Получение каналов для публикации"""
+        try:
+            # Проверяем соединение перед выполнением запроса
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return []
+                
+            with self.conn.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute("""
+                    SELECT id, chat_id, title, hashtags, publish_times, enabled
+                    FROM channels
+                    WHERE enabled = TRUE OR NOT %s
+                    ORDER BY id
+                """, (enabled_only,))
+                return cursor.fetchall()
+        except Exception as e:
+            logger.error(f"Ошибка при получении списка каналов: {e}")
+            return []
+    
+    def save_channel(self, chat_id, title=None, hashtags='', publish_times=None, enabled=True):
+        """Добавление канала или обновление его настроек"""
+        try:
+            # Проверяем соединение перед выполнением запроса
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return False
+                
+            with self.conn.cursor() as cursor:
+                cursor.execute("""
+                    INSERT INTO channels (chat_id, title, hashtags, publish_times, enabled)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (chat_id) DO UPDATE
+                    SET title = EXCLUDED.title,
+                        hashtags = EXCLUDED.hashtags,
+                        publish_times = EXCLUDED.publish_times,
+                        enabled = EXCLUDED.enabled
+                    RETURNING id
+                """, (chat_id, title or chat_id, hashtags, publish_times, enabled))
+                channel_id = cursor.fetchone()[0]
+                # Хэштеги канала могли измениться - сообщения будут подготовлены заново
+                cursor.execute("DELETE FROM rendered_messages WHERE channel_id = %s", (channel_id,))
+                self.conn.commit()
+                logger.info(f"Канал {chat_id} сохранен")
+                return channel_id
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при сохранении канала {chat_id}: {e}")
+            return False
+    
+    def refresh_news_stats(self):
+        """Обновление сводной статистики по категориям без блокировки чтения"""
+        try:
+            # Проверяем соединение перед выполнением запроса
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return False
+                
+            with self.conn.cursor() as cursor:
+                cursor.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY news_category_stats")
+                self.conn.commit()
+                return True
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при обновлении статистики новостей: {e}")
+            return False
+    
+    def get_news_stats(self):
+        """Статистика новостей из сводной таблицы как есть, с временем ее обновления (без пересчета)"""
+        try:
+            # Проверяем соединение перед выполнением запроса
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return None
+                
+            # REFRESH выполняется фоновой задачей (планировщик, админ-панель), здесь только чтение
+            with self.conn.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute("""
+                    SELECT category, total, published, scheduled, processed, refreshed_at,
+                           EXTRACT(EPOCH FROM NOW() - refreshed_at) AS age_seconds
+                    FROM news_category_stats
+                    ORDER BY total DESC
+                """)
+                rows = cursor.fetchall()
+                self.conn.commit()
+            
+            return {
+                'refreshed_at': rows[0]['refreshed_at'] if rows else None,
+                'age_seconds': float(rows[0]['age_seconds']) if rows else None,
+                'total_news': sum(row['total'] for row in rows),
+                'published': sum(row['published'] for row in rows),
+                'scheduled': sum(row['scheduled'] for row in rows),
+                'processed': sum(row['processed'] for row in rows),
+                'categories': {row['category']: row['total'] for row in rows}
+            }
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при получении статистики новостей: {e}")
+            return None
+    
+    def get_trace_ids(self, news_ids):
+        """Идентификаторы трассировки новостей: {id: trace_id}"""
+        if not news_ids:
+            return {}
+        try:
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return {}
+            
+            with self.conn.cursor() as cursor:
+                cursor.execute("SELECT id, trace_id FROM news WHERE id = ANY(%s)", (list(news_ids),))
+                trace_ids = dict(cursor.fetchall())
+                self.conn.commit()
+                return trace_ids
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при получении идентификаторов трассировки: {e}")
+            return {}
+    
+    def update_queue_metrics(self):
+        """Обновление метрик глубины очереди публикаций"""
+        try:
+            if not self.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return
+            
+            with self.conn.cursor() as cursor:
+                cursor.execute("SELECT status, COUNT(*) FROM scheduled_posts GROUP BY status")
+                depths = cursor.fetchall()
+                cursor.execute("""
+                    SELECT COUNT(*) FROM scheduled_posts
+                    WHERE status = 'pending' AND scheduled_date <= %s
+                """, (datetime.now(),))
+                overdue = cursor.fetchone()[0]
+                self.conn.commit()
+            
+            metrics.SCHEDULED_POSTS.clear()
+            for status, count in depths:
+                metrics.SCHEDULED_POSTS.set(count, status=status)
+            metrics.SCHEDULED_POSTS_OVERDUE.set(overdue)
+        except Exception as e:
+            self.conn.rollback()
+            logger.error(f"Ошибка при обновлении метрик очереди публикаций: {e}")
+    
     def close(self):
         """Закрытие соединения с базой данных"""
         if self.conn is not None:
             self.conn.close()
-            logger.info("Соединение с базой данных закрыто")
\ No newline at end of file
+            logger.info("Соединение с базой данных закрыто")
+
+class DatabaseThread:
+    """Отдельное соединение с базой данных, которое используется только из собственного потока.
+
+    Запросы из event loop не блокируют его и не смешиваются с транзакциями общего соединения.
+    """
+
+    def __init__(self, name):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+        self._db = None  # Создается в потоке при первом запросе
+        self._closed = False
+
+    def _call(self, func, args):
+        if self._db is None:
+            self._db = Database()
+        return func(self._db, *args)
+
+    async def run(self, func, *args):
+        """Выполнение func(db, *args) в потоке соединения"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+
+    def close(self):
+        """Закрытие соединения и остановка потока"""
+        if self._closed:
+            return
+        self._closed = True
+
+        def close_db():
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+        self._executor.submit(close_db).result()
+        self._executor.shutdown()
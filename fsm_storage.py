@@ -0,0 +1,98 @@
+import os
+import json
+import logging
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from aiogram.fsm.storage.memory import MemoryStorage
+from ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+class PostgresStorage(BaseStorage):
+    """Хранилище состояний FSM в PostgreSQL с локальным кэшем чтения.
+
+    Диалоги админ-панели переживают перезапуск бота и доступны всем процессам;
+    повторные чтения в пределах FSM_CACHE_SECONDS обслуживаются из памяти.
+    """
+
+    def __init__(self, db, cache_ttl=None):
+        self.db = db
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv('FSM_CACHE_SECONDS', '5'))  # Время жизни записи в локальном кэше
+        self.cache = TTLCache(cache_ttl, max_entries=1024)
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_business_connection_id=True, with_destiny=True)
+
+    def _load(self, key):
+        """Состояние и данные ключа: из кэша или из базы данных"""
+        record = self.cache.get(key)
+        if record is not None:
+            return record
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return None, {}
+
+            with self.db.conn.cursor() as cursor:
+                cursor.execute("SELECT state, data FROM fsm_states WHERE key = %s", (key,))
+                row = cursor.fetchone()
+                self.db.conn.commit()
+            record = (row[0], json.loads(row[1])) if row else (None, {})
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при чтении состояния FSM {key}: {e}")
+            return None, {}
+        self.cache.set(key, record)
+        return record
+
+    def _save(self, key, state, data):
+        """Запись состояния и данных ключа; пустая запись удаляется"""
+        self.cache.set(key, (state, dict(data)))
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return
+
+            with self.db.conn.cursor() as cursor:
+                if state is None and not data:
+                    cursor.execute("DELETE FROM fsm_states WHERE key = %s", (key,))
+                else:
+                    cursor.execute("""
+                        INSERT INTO fsm_states (key, state, data, updated_at)
+                        VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+                        ON CONFLICT (key) DO UPDATE
+                        SET state = EXCLUDED.state, data = EXCLUDED.data, updated_at = CURRENT_TIMESTAMP
+                    """, (key, state, json.dumps(data, ensure_ascii=False)))
+                self.db.conn.commit()
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при сохранении состояния FSM {key}: {e}")
+
+    async def set_state(self, key, state=None):
+        storage_key = self.key_builder.build(key)
+        _, data = self._load(storage_key)
+        self._save(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key):
+        state, _ = self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key, data):
+        storage_key = self.key_builder.build(key)
+        state, _ = self._load(storage_key)
+        self._save(storage_key, state, dict(data))
+
+    async def get_data(self, key):
+        _, data = self._load(self.key_builder.build(key))
+        return dict(data)
+
+    async def close(self):
+        self.cache.invalidate()
+
+def create_fsm_storage(db):
+    """Хранилище FSM по переменной FSM_STORAGE: postgres (по умолчанию) или memory"""
+    backend = os.getenv('FSM_STORAGE', 'postgres').lower()
+    if backend == 'memory':
+        return MemoryStorage()
+    if backend != 'postgres':
+        logger.warning(f"Неизвестное хранилище FSM: {backend}, используется postgres")
+    return PostgresStorage(db)
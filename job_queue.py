@@ -0,0 +1,236 @@
+import os
+import socket
+import asyncio
+import logging
+import argparse
+from psycopg2.extras import DictCursor
+from logging_config import setup_logging
+from metrics import start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+class AIJobQueue:
+    """Очередь задач AI-обработки с арендой задач через FOR UPDATE SKIP LOCKED"""
+
+    def __init__(self, db):
+        self.db = db
+        self.lease_seconds = int(os.getenv('AI_JOB_LEASE_SECONDS', '300'))  # Время аренды задачи воркером
+        self.max_attempts = int(os.getenv('AI_JOB_MAX_ATTEMPTS', '5'))  # Попыток до окончательной ошибки
+        self.base_backoff = int(os.getenv('AI_JOB_BACKOFF_SECONDS', '300'))  # Базовая задержка повтора
+        self.max_backoff = 6 * 3600  # Максимальная задержка повтора (в секундах)
+
+    def claim(self, worker_id, limit=5, db=None):
+        """Захват готовых задач (новых, отложенных или с истекшей арендой) без дублирования между воркерами"""
+        db = db or self.db
+        try:
+            if not db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return []
+
+            with db.conn.cursor(cursor_factory=DictCursor) as cursor:
+                # Аренда истекла на последней попытке: повторять больше нельзя, задача завершается ошибкой
+                cursor.execute("""
+                    UPDATE ai_jobs
+                    SET state = 'failed', lease_expires_at = NULL, locked_by = NULL,
+                        last_error = 'Аренда задачи истекла на последней попытке',
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE state = 'running' AND lease_expires_at < NOW() AND attempts >= %s
+                """, (self.max_attempts,))
+                if cursor.rowcount:
+                    logger.error(f"{cursor.rowcount} задач AI-обработки завершены ошибкой: аренда истекла на последней попытке")
+                cursor.execute("""
+                    WITH picked AS (
+                        SELECT j.id
+                        FROM ai_jobs j
+                        JOIN news n ON n.id = j.news_id
+                        WHERE j.attempts < %s
+                          AND ((j.state = 'queued' AND j.available_at <= NOW())
+                               OR (j.state = 'running' AND j.lease_expires_at < NOW()))
+                        ORDER BY n.published_date DESC
+                        LIMIT %s
+                        FOR UPDATE OF j SKIP LOCKED
+                    )
+                    UPDATE ai_jobs j
+                    SET state = 'running',
+                        attempts = j.attempts + 1,
+                        locked_by = %s,
+                        lease_expires_at = NOW() + make_interval(secs => %s),
+                        updated_at = CURRENT_TIMESTAMP
+                    FROM picked, news n
+                    WHERE j.id = picked.id AND n.id = j.news_id
+                    RETURNING j.id AS job_id, j.attempts, j.locked_by AS worker_id,
+                              n.id, n.title, n.content, n.url, n.category, n.trace_id
+                """, (self.max_attempts, limit, worker_id, self.lease_seconds))
+                jobs = [dict(row) for row in cursor.fetchall()]
+                db.conn.commit()
+
+            if jobs:
+                logger.info(f"Воркер {worker_id} захватил {len(jobs)} задач AI-обработки")
+            return jobs
+        except Exception as e:
+            db.conn.rollback()
+            logger.error(f"Ошибка при захвате задач AI-обработки: {e}")
+            return []
+
+    def claim_news(self, news_id, worker_id, db=None):
+        """Захват задачи конкретной новости, если ее еще не взял другой воркер"""
+        db = db or self.db
+        try:
+            if not db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return None
+
+            with db.conn.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute("""
+                    WITH picked AS (
+                        SELECT id FROM ai_jobs
+                        WHERE news_id = %s AND state = 'queued'
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    UPDATE ai_jobs j
+                    SET state = 'running',
+                        attempts = j.attempts + 1,
+                        locked_by = %s,
+                        lease_expires_at = NOW() + make_interval(secs => %s),
+                        updated_at = CURRENT_TIMESTAMP
+                    FROM picked, news n
+                    WHERE j.id = picked.id AND n.id = j.news_id
+                    RETURNING j.id AS job_id, j.attempts, j.locked_by AS worker_id,
+                              n.id, n.title, n.content, n.url, n.category, n.trace_id
+                """, (news_id, worker_id, self.lease_seconds))
+                row = cursor.fetchone()
+                db.conn.commit()
+            return dict(row) if row else None
+        except Exception as e:
+            db.conn.rollback()
+            logger.error(f"Ошибка при захвате задачи AI-обработки новости #{news_id}: {e}")
+            return None
+
+    def fail(self, job_id, worker_id, error, retry=True, db=None):
+        """Возврат задачи в очередь с экспоненциальной задержкой или окончательная ошибка (только своей задачи)"""
+        db = db or self.db
+        try:
+            with db.conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE ai_jobs
+                    SET state = CASE WHEN %s AND attempts < %s THEN 'queued' ELSE 'failed' END,
+                        available_at = NOW() + make_interval(secs => LEAST(%s * POWER(2, attempts - 1), %s)),
+                        lease_expires_at = NULL,
+                        locked_by = NULL,
+                        last_error = %s,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s AND locked_by = %s AND state = 'running'
+                    RETURNING state, available_at
+                """, (retry, self.max_attempts, self.base_backoff, self.max_backoff, str(error)[:1000],
+                      job_id, worker_id))
+                result = cursor.fetchone()
+                db.conn.commit()
+                if result:
+                    if result[0] == 'failed':
+                        logger.error(f"Задача AI-обработки #{job_id} окончательно завершилась ошибкой: {error}")
+                    else:
+                        logger.warning(f"Задача AI-обработки #{job_id} будет повторена после {result[1]}: {error}")
+        except Exception as e:
+            db.conn.rollback()
+            logger.error(f"Ошибка при обновлении задачи AI-обработки #{job_id}: {e}")
+
+    def get_counts(self):
+        """Количество задач по состояниям"""
+        try:
+            with self.db.conn.cursor() as cursor:
+                cursor.execute("SELECT state, COUNT(*) FROM ai_jobs GROUP BY state")
+                return dict(cursor.fetchall())
+        except Exception as e:
+            logger.error(f"Ошибка при получении состояния очереди AI-обработки: {e}")
+            return {}
+
+class AIWorker:
+    """Воркер, обрабатывающий задачи из очереди AI-обработки"""
+
+    def __init__(self, db, ai_processor, worker_id=None):
+        self.db = db
+        self.ai_processor = ai_processor
+        self.queue = AIJobQueue(db)
+        # Очередь работает через соединение потока AI-обработки: откат в одной корутине
+        # не затрагивает транзакции других пользователей общего соединения
+        self.db_thread = ai_processor.db_thread
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.poll_interval = float(os.getenv('AI_WORKER_POLL_INTERVAL', '30'))  # Пауза при пустой очереди
+
+    async def _process_job(self, job):
+        """Обработка одной задачи; завершение задачи записывается вместе с результатом"""
+        skip_result = self.ai_processor.check_content(job)
+        if skip_result:
+            # Повтор не поможет - контент не изменится
+            await self.db_thread.run(lambda db: self.queue.fail(job['job_id'], self.worker_id, skip_result['error'],
+                                                                retry=False, db=db))
+            return skip_result
+
+        result = await self.ai_processor.process_news_async(job)
+        if not result.get("success") and not result.get("lease_lost"):
+            error = result.get("error", "Неизвестная ошибка")
+            await self.db_thread.run(lambda db: self.queue.fail(job['job_id'], self.worker_id, error, db=db))
+        result.setdefault("id", job['id'])
+        return result
+
+    async def process_news_id(self, news_id):
+        """Обработка только что сохраненной новости; None, если задачу уже взял другой воркер"""
+        job = await self.db_thread.run(lambda db: self.queue.claim_news(news_id, self.worker_id, db))
+        if not job:
+            return None
+        return await self._process_job(job)
+
+    async def run_once(self, limit=5):
+        """Захват и параллельная обработка до limit задач, возвращает результаты"""
+        jobs = await self.db_thread.run(lambda db: self.queue.claim(self.worker_id, limit, db))
+        if not jobs:
+            return []
+        results = await asyncio.gather(*(self._process_job(job) for job in jobs))
+        success_count = sum(1 for result in results if result.get("success"))
+        logger.info(f"Воркер {self.worker_id}: обработано {success_count} из {len(jobs)} задач")
+        return list(results)
+
+    async def run(self, limit=5, stop_event=None):
+        """Непрерывная обработка очереди до установки stop_event"""
+        logger.info(f"Запуск воркера AI-обработки {self.worker_id}")
+        while stop_event is None or not stop_event.is_set():
+            try:
+                results = await self.run_once(limit)
+            except Exception as e:
+                logger.error(f"Ошибка в воркере AI-обработки {self.worker_id}: {e}")
+                results = []
+            if not results:
+                if stop_event is None:
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                # Пауза прерывается остановкой, чтобы не задерживать завершение процесса
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+async def run_workers(workers_count, limit):
+    """Запуск нескольких воркеров в одном процессе"""
+    from database import Database
+    from ai_processor import AIProcessor
+
+    db = Database()
+    ai_processor = AIProcessor(db)
+    base_id = f"{socket.gethostname()}:{os.getpid()}"
+    try:
+        await asyncio.gather(*(
+            AIWorker(db, ai_processor, f"{base_id}:{i}").run(limit)
+            for i in range(workers_count)
+        ))
+    finally:
+        ai_processor.close()
+        db.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Воркеры AI-обработки новостей")
+    parser.add_argument("--workers", type=int, default=int(os.getenv('AI_WORKERS', '2')), help="Количество воркеров в процессе")
+    parser.add_argument("--limit", type=int, default=5, help="Задач, захватываемых воркером за раз")
+    args = parser.parse_args()
+    setup_logging("ai_worker")
+    start_metrics_server()
+    asyncio.run(run_workers(args.workers, args.limit))
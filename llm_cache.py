@@ -0,0 +1,81 @@
+import os
+import re
+import json
+import html
+import hashlib
+import logging
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# Невидимые символы, которые часто появляются при повторном скрапинге одной и той же статьи
+ZERO_WIDTH_RE = re.compile('[\u200b\u200c\u200d\u2060\ufeff\u00ad]')
+WHITESPACE_RE = re.compile(r'\s+')
+
+class LLMCache:
+    """Постоянный кэш ответов LLM с адресацией по содержимому запроса"""
+
+    def __init__(self, db):
+        self.db = db  # Соединение по умолчанию; методы принимают и другое (например, из отдельного потока)
+        self.enabled = os.getenv('LLM_CACHE_ENABLED', '1') == '1'
+        self.max_entries = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '5000'))  # Максимальное количество записей
+        self.max_age_days = int(os.getenv('LLM_CACHE_MAX_AGE_DAYS', '30'))  # Срок хранения записи (в днях)
+        self.evict_every = 100  # Очистка кэша после каждых N сохранений
+        self._writes = 0
+
+    @staticmethod
+    def normalize_text(text):
+        """Нормализация текста, чтобы почти одинаковые промты давали один ключ"""
+        if not text:
+            return ""
+        text = html.unescape(text)
+        text = unicodedata.normalize('NFKC', text)
+        text = ZERO_WIDTH_RE.sub('', text)
+        return WHITESPACE_RE.sub(' ', text).strip()
+
+    def make_key(self, model, system_prompt, prompt, temperature, max_tokens):
+        """Вычисление ключа кэша по параметрам запроса"""
+        payload = json.dumps([
+            model,
+            self.normalize_text(system_prompt),
+            self.normalize_text(prompt),
+            round(float(temperature), 3),
+            int(max_tokens)
+        ], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, cache_keys, db=None):
+        """Получение ответа из кэша по ключам в порядке приоритета, None при промахе"""
+        if not self.enabled:
+            return None
+        entries = (db or self.db).get_llm_cache_entries(cache_keys, self.max_age_days)
+        for cache_key in cache_keys:
+            entry = entries.get(cache_key)
+            if entry:
+                logger.debug(f"Ответ LLM найден в кэше (модель {entry['model']}, сэкономлено токенов: {entry['total_tokens'] or 0})")
+                return entry
+        return None
+
+    def set(self, cache_key, model, completion, usage=None, db=None):
+        """Сохранение ответа в кэш вместе с расходом токенов"""
+        if not self.enabled or not completion:
+            return False
+
+        saved = (db or self.db).save_llm_cache_entry(
+            cache_key,
+            model,
+            completion,
+            getattr(usage, 'prompt_tokens', None),
+            getattr(usage, 'completion_tokens', None),
+            getattr(usage, 'total_tokens', None)
+        )
+
+        # Периодическая очистка по возрасту и размеру
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self.evict(db)
+        return saved
+
+    def evict(self, db=None):
+        """Удаление устаревших записей и записей сверх лимита"""
+        return (db or self.db).evict_llm_cache(self.max_entries, self.max_age_days)
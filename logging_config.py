@@ -0,0 +1,104 @@
+import os
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener = None  # Поток записи логов текущего процесса
+
+def parse_levels(value):
+    """Уровни логгеров из строки вида 'database=WARNING,web_scraper=DEBUG'"""
+    levels = {}
+    for item in (value or "").split(','):
+        name, _, level = item.strip().partition('=')
+        if name and level:
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+class RepeatFilter(logging.Filter):
+    """Подавление одинаковых предупреждений и ошибок: одна запись за окно, затем сводка с числом повторов"""
+
+    def __init__(self, window_seconds, min_level=logging.WARNING, max_keys=1000):
+        super().__init__()
+        self.window = window_seconds
+        self.min_level = min_level
+        self.max_keys = max_keys
+        self._seen = {}  # (логгер, уровень, сообщение) -> [начало окна, подавлено записей]
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.window <= 0 or record.levelno < self.min_level:
+            return True
+        key = (record.name, record.levelno, record.getMessage())
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.window:
+                entry[1] += 1
+                return False
+            suppressed = entry[1] if entry is not None else 0
+            self._seen[key] = [now, 0]
+            if len(self._seen) > self.max_keys:
+                # Окна, которые уже закрылись, больше не нужны
+                self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window}
+        if suppressed:
+            record.msg = f"{record.getMessage()} (повторялось еще {suppressed} раз)"
+            record.args = None
+        return True
+
+def setup_logging(name):
+    """Единая настройка логирования процесса: запись в файл и консоль в отдельном потоке.
+
+    Обработчики вызываются из кода только через очередь, поэтому запись на диск не блокирует
+    event loop. Повторный вызов ничего не меняет: настраивает логирование точка входа.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    level = os.getenv('LOG_LEVEL', 'INFO').upper()  # Уровень логирования по умолчанию
+    levels = parse_levels(os.getenv('LOG_LEVELS', 'httpx=WARNING'))  # Уровни отдельных модулей
+    log_dir = os.getenv('LOG_DIR', '.')  # Каталог файлов логов
+    max_bytes = int(float(os.getenv('LOG_MAX_MB', '10')) * 1024 * 1024)  # Размер файла до ротации
+    backups = int(os.getenv('LOG_BACKUP_COUNT', '5'))  # Сколько старых файлов хранить
+    repeat_window = float(os.getenv('LOG_REPEAT_SECONDS', '60'))  # Окно подавления одинаковых ошибок (сек)
+
+    os.makedirs(log_dir, exist_ok=True)
+    formatter = logging.Formatter(LOG_FORMAT)
+    file_handler = RotatingFileHandler(
+        os.path.join(log_dir, f"{name}.log"), maxBytes=max_bytes, backupCount=backups, encoding='utf-8'
+    )
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RepeatFilter(repeat_window))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    for logger_name, logger_level in levels.items():
+        logging.getLogger(logger_name).setLevel(logger_level)
+
+    _listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Запись оставшихся в очереди сообщений и остановка потока логирования"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,24 +1,13 @@
 import os
 import logging
-import asyncio
 from dotenv import load_dotenv
 from scheduler import Scheduler
-from news_api import NewsAPI
-from ai_processor import AIProcessor
-from database import Database
+from logging_config import setup_logging
+from metrics import start_metrics_server
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("main.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 def check_environment():
@@ -44,15 +33,14 @@ def check_environment():
     logger.info("Все необходимые переменные окружения найдены")
     return True
 
-async def publish_news_on_startup():
+async def publish_news_on_startup(scheduler):
     """Функция для немедленной публикации новости при запуске"""
     try:
         logger.info("Запуск процесса немедленной публикации новости")
         
-        # Инициализация компонентов
-        db = Database()
-        news_api = NewsAPI(db)
-        ai_processor = AIProcessor(db)
+        # Компоненты планировщика: одно соединение с БД и одна сессия Telegram на процесс
+        db = scheduler.db
+        news_api = scheduler.news_api
         
         # Сбор новостей
         logger.info("Сбор новостей для немедленной публикации")
@@ -71,31 +59,14 @@ async def publish_news_on_startup():
         saved_count = news_api.save_news_to_db(filtered_articles)
         logger.info(f"Сохранено {saved_count} новостей для немедленной публикации")
         
-        # Получение сохраненных новостей из базы данных
-        with db.conn.cursor() as cursor:
-            cursor.execute("""
-                SELECT id, title, content, url, category
-                FROM news
-                WHERE processed = FALSE
-                ORDER BY published_date DESC
-                LIMIT 1
-            """)
-            news_items = [{
-                'id': row[0],
-                'title': row[1],
-                'content': row[2],
-                'url': row[3],
-                'category': row[4]
-            } for row in cursor.fetchall()]
+        # Захват задачи из очереди AI-обработки (без дублирования с планировщиком и админ-панелью)
+        results = await scheduler.ai_worker.run_once(limit=1)
         
-        if not news_items:
+        if not results:
             logger.warning("Не найдено новостей в базе данных для обработки")
             return False
         
-        # Обработка новости через AI
-        logger.info(f"Обработка новости '{news_items[0]['title']}' с помощью AI")
-        processed_result = ai_processor.process_news(news_items[0])
-        
+        processed_result = results[0]
         if not processed_result.get("success", False):
             logger.error(f"Не удалось обработать новость: {processed_result.get('error', 'Неизвестная ошибка')}")
             return False
@@ -108,7 +79,7 @@ async def publish_news_on_startup():
                 FROM news n
                 JOIN processed_news p ON n.id = p.news_id
                 WHERE n.id = %s
-            """, (news_items[0]['id'],))
+            """, (processed_result['id'],))
             row = cursor.fetchone()
             
             if not row:
@@ -128,7 +99,6 @@ async def publish_news_on_startup():
         
         # Публикация новости в Telegram
         logger.info("Публикация обработанной новости в Telegram-канал")
-        scheduler = Scheduler()
         published = await scheduler.publisher.publish_news(news_to_publish)
         
         if published:
@@ -144,6 +114,8 @@ async def publish_news_on_startup():
 
 def main():
     """Основная функция приложения"""
+    setup_logging("main")
+    start_metrics_server()
     logger.info("Запуск приложения Telegram-бота для публикации IT-новостей")
     
     # Проверка переменных окружения
@@ -155,12 +127,13 @@ def main():
         # Создание планировщика
         scheduler = Scheduler()
         
+        # Все асинхронные вызовы идут в одном event loop планировщика: сессия Telegram создается один раз
         # Отправка тестового сообщения при запуске
-        asyncio.run(scheduler.publisher.publish_test_message())
+        scheduler.run_until_complete(scheduler.publisher.publish_test_message())
         logger.info("Тестовое сообщение отправлено при запуске")
         
         # Немедленная публикация новости при запуске
-        result = asyncio.run(publish_news_on_startup())
+        result = scheduler.run_until_complete(publish_news_on_startup(scheduler))
         if result:
             logger.info("Немедленная публикация новости при запуске выполнена успешно")
         else:
@@ -0,0 +1,178 @@
+import re
+import json
+import html
+import logging
+from psycopg2.extras import DictCursor
+
+logger = logging.getLogger(__name__)
+
+TEXT_LIMIT = 4096  # Максимальная длина текста сообщения Telegram
+PARAGRAPH_SPLIT_RE = re.compile(r'\n\s*\n')
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?…])\s+')
+
+class MessageRenderError(Exception):
+    """Пост невозможно отправить в Telegram в текущем виде"""
+
+def telegram_length(text):
+    """Длина текста так, как ее считает Telegram (в кодовых единицах UTF-16)"""
+    return len(text.encode('utf-16-le')) // 2
+
+def escaped_length(text):
+    """Длина текста после экранирования для HTML (так текст будет занимать место в сообщении)"""
+    return telegram_length(html.escape(text, quote=False))
+
+def build_hashtags(category, channel_hashtags=""):
+    """Хэштеги поста по категории и дополнительные хэштеги канала"""
+    category = (category or "").lower()
+    hashtags = "#ITNews"
+    if "ai" in category or "artificial intelligence" in category:
+        hashtags += " #AI"
+    if "web3" in category:
+        hashtags += " #Web3"
+    if "cybersecurity" in category:
+        hashtags += " #Cybersecurity"
+    if "ux" in category or "ui" in category:
+        hashtags += " #UXUI"
+    if channel_hashtags:
+        hashtags += f" {channel_hashtags}"
+    return hashtags
+
+def load_parts(payload):
+    """Части сообщения из сохраненного payload; None для payload старого формата (Markdown-текст)"""
+    try:
+        parts = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    return parts if isinstance(parts, list) else None
+
+class MessageRenderer:
+    """Подготовка постов к отправке: экранирование для HTML, проверка и разбиение по длине"""
+
+    def __init__(self, db=None):
+        self.db = db
+
+    @staticmethod
+    def _fit(word, limit):
+        """Число первых символов слова, которые после экранирования укладываются в limit"""
+        used = 0
+        for index, char in enumerate(word):
+            used += escaped_length(char)
+            if used > limit:
+                return index
+        return len(word)
+
+    def _split_block(self, block, limit):
+        """Разбиение слишком длинного абзаца (неэкранированного) по предложениям, а при необходимости - по словам"""
+        pieces = []
+        current = ""
+        for unit in SENTENCE_SPLIT_RE.split(block):
+            words = [unit] if escaped_length(unit) <= limit else unit.split(' ')
+            for word in words:
+                if escaped_length(word) > limit:
+                    # Слово без пробелов длиннее лимита (например, ссылка) - режем по символам исходного текста,
+                    # чтобы разрез не попал внутрь HTML-сущности
+                    if current:
+                        pieces.append(current)
+                        current = ""
+                    while escaped_length(word) > limit:
+                        cut = self._fit(word, limit)
+                        pieces.append(word[:cut])
+                        word = word[cut:]
+                candidate = f"{current} {word}" if current else word
+                if escaped_length(candidate) <= limit:
+                    current = candidate
+                else:
+                    pieces.append(current)
+                    current = word
+        if current:
+            pieces.append(current)
+        return pieces
+
+    def _pack(self, blocks, limit):
+        """Сборка неэкранированных блоков в сообщения не длиннее limit после экранирования, с разрывами между абзацами"""
+        parts = []
+        current = ""
+        for block in blocks:
+            chunks = [block] if escaped_length(block) <= limit else self._split_block(block, limit)
+            for chunk in chunks:
+                candidate = f"{current}\n\n{chunk}" if current else chunk
+                if escaped_length(candidate) <= limit:
+                    current = candidate
+                else:
+                    parts.append(current)
+                    current = chunk
+        if current:
+            parts.append(current)
+        return parts
+
+    def render(self, news_item, channel_hashtags="", limit=TEXT_LIMIT):
+        """Части сообщения (HTML) для публикации поста; поднимает MessageRenderError"""
+        title = (news_item.get('processed_title') or "").strip()
+        content = (news_item.get('processed_content') or "").strip()
+        if not title and not content:
+            raise MessageRenderError(f"Пустой текст поста для новости {news_item.get('id')}")
+
+        blocks = [title] if title else []
+        blocks += [p.strip() for p in PARAGRAPH_SPLIT_RE.split(content) if p.strip()]
+
+        footer = []
+        url = news_item.get('url')
+        if url:
+            footer.append(f'<a href="{html.escape(url, quote=True)}">Подробнее</a>')
+        footer.append(html.escape(build_hashtags(news_item.get('category'), channel_hashtags), quote=False))
+        footer = "\n\n".join(footer)
+
+        # Ссылка и хэштеги не отрываются друг от друга и всегда идут в конце
+        # Текст модели разбивается до экранирования и экранируется целиком: разметка в сообщении только наша
+        parts = [html.escape(part, quote=False) for part in self._pack(blocks, limit)]
+        if parts and telegram_length(f"{parts[-1]}\n\n{footer}") <= limit:
+            parts[-1] = f"{parts[-1]}\n\n{footer}"
+        else:
+            parts.append(footer)
+
+        if len(parts) > 1:
+            logger.info(f"Пост новости {news_item.get('id')} разбит на {len(parts)} сообщения")
+        return parts
+
+    def prerender(self, news_ids):
+        """Подготовка и сохранение сообщений запланированных постов для всех включенных каналов"""
+        if not news_ids or self.db is None:
+            return 0
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return 0
+
+            with self.db.conn.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute("""
+                    SELECT DISTINCT ON (n.id) n.id, n.url, n.category, p.processed_title, p.processed_content
+                    FROM news n
+                    JOIN processed_news p ON p.news_id = n.id
+                    WHERE n.id = ANY(%s)
+                    ORDER BY n.id, p.processed_at DESC
+                """, (list(news_ids),))
+                posts = cursor.fetchall()
+                cursor.execute("SELECT id, hashtags FROM channels WHERE enabled = TRUE")
+                channels = cursor.fetchall()
+
+                rendered = 0
+                for post in posts:
+                    for channel in channels:
+                        try:
+                            parts = self.render(post, channel['hashtags'])
+                        except MessageRenderError as e:
+                            logger.error(str(e))
+                            continue
+                        cursor.execute("""
+                            INSERT INTO rendered_messages (news_id, channel_id, parts)
+                            VALUES (%s, %s, %s)
+                            ON CONFLICT (news_id, channel_id) DO UPDATE
+                            SET parts = EXCLUDED.parts, rendered_at = CURRENT_TIMESTAMP
+                        """, (post['id'], channel['id'], json.dumps(parts, ensure_ascii=False)))
+                        rendered += 1
+                self.db.conn.commit()
+            return rendered
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при подготовке сообщений для публикации: {e}")
+            return 0
@@ -0,0 +1,243 @@
+import os
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм по умолчанию (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value):
+    """Экранирование значения метки для текстового формата Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """Метрика с набором меток; значения хранятся по кортежу значений меток"""
+
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Метрика {self.name} ожидает метки {self.labelnames}, получены {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        """Удаление всех значений (например, перед полным обновлением показаний)"""
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """Строки текстового формата Prometheus для всех значений метрики"""
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+    def render(self):
+        return "\n".join([f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self.samples())
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """Текущее значение, которое может расти и уменьшаться"""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Histogram(Metric):
+    """Распределение значений по корзинам с суммой и количеством наблюдений"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Замер длительности блока кода"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+REGISTRY = Registry()
+
+# API новостей
+NEWS_API_REQUESTS = REGISTRY.counter("news_api_requests_total", "Запросы к API новостей", ("source", "status"))
+NEWS_API_SECONDS = REGISTRY.histogram("news_api_request_seconds", "Длительность запроса к API новостей", ("source",))
+NEWS_API_ARTICLES = REGISTRY.counter("news_api_articles_total", "Новости, полученные от API", ("source",))
+NEWS_API_QUOTA_USED = REGISTRY.gauge("news_api_quota_used", "Запросов к API за последние 24 часа", ("source",))
+NEWS_API_QUOTA_LIMIT = REGISTRY.gauge("news_api_quota_limit", "Дневной лимит запросов к API", ("source",))
+
+# Загрузка статей
+SCRAPE_REQUESTS = REGISTRY.counter("scrape_requests_total", "Запросы страниц статей", ("domain", "status"))
+SCRAPE_SECONDS = REGISTRY.histogram("scrape_request_seconds", "Длительность загрузки страницы статьи", ("domain",))
+SCRAPE_BYTES = REGISTRY.counter("scrape_bytes_total", "Загружено байт страниц статей", ("domain",))
+
+# Обработка с помощью AI
+LLM_REQUESTS = REGISTRY.counter("llm_requests_total", "Запросы к языковой модели", ("model", "status"))
+LLM_SECONDS = REGISTRY.histogram("llm_request_seconds", "Длительность ответа языковой модели", ("model",))
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Токены, израсходованные языковой моделью", ("model", "kind"))
+
+# Отправка в Telegram
+TELEGRAM_REQUESTS = REGISTRY.counter("telegram_requests_total", "Вызовы Bot API", ("method", "status"))
+TELEGRAM_SECONDS = REGISTRY.histogram("telegram_request_seconds", "Длительность вызова Bot API", ("method",))
+TELEGRAM_RETRIES = REGISTRY.counter("telegram_retries_total", "Повторы вызовов Bot API", ("method", "reason"))
+
+# База данных
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "db_query_seconds", "Длительность SQL-запроса", ("operation", "table"),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+
+# Очередь публикаций
+SCHEDULED_POSTS = REGISTRY.gauge("scheduled_posts", "Записи очереди публикаций по статусам", ("status",))
+SCHEDULED_POSTS_OVERDUE = REGISTRY.gauge("scheduled_posts_overdue", "Посты в очереди, время публикации которых прошло")
+
+@contextmanager
+def track(histogram, counter, **labels):
+    """Замер длительности вызова и подсчет успешных и неудачных вызовов"""
+    started = time.perf_counter()
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    finally:
+        histogram.observe(time.perf_counter() - started, **labels)
+        counter.inc(status=status, **labels)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Опросы метрик не засоряют лог
+        pass
+
+_server = None  # HTTP-сервер метрик текущего процесса
+
+def start_metrics_server(port=None, host=None):
+    """Запуск HTTP-сервера /metrics в фоновом потоке; порт 0 отключает сервер"""
+    global _server
+    if _server is not None:
+        return _server
+    if port is None:
+        port = int(os.getenv('METRICS_PORT', '0'))  # Порт эндпоинта /metrics (0 - отключен)
+    if host is None:
+        host = os.getenv('METRICS_HOST', '127.0.0.1')  # Адрес эндпоинта /metrics
+    if not port:
+        return None
+    try:
+        _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.warning(f"Не удалось запустить сервер метрик на {host}:{port}: {e}")
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Метрики доступны по адресу http://{host}:{_server.server_port}/metrics")
+    return _server
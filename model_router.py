@@ -0,0 +1,184 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODELS = (
+    "google/gemma-3-27b-it:free,"
+    "meta-llama/llama-3.3-70b-instruct:free,"
+    "mistralai/mistral-small-3.1-24b-instruct:free"
+)
+
+class ModelUnavailableError(Exception):
+    """Все модели цепочки недоступны или вернули ошибку"""
+
+class CircuitBreaker:
+    """Автоматический выключатель: временно исключает модель после серии ошибок"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=3, recovery_timeout=120.0, probe_timeout=180.0):
+        self.failure_threshold = failure_threshold  # Ошибок подряд до размыкания
+        self.recovery_timeout = recovery_timeout  # Время до пробного запроса (в секундах)
+        self.probe_timeout = probe_timeout  # Пробный запрос без результата дольше этого считается потерянным
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started = 0.0
+
+    def allow_request(self):
+        """Можно ли отправить запрос к модели (в полуоткрытом состоянии - один пробный)"""
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            self.probe_started = now
+            return True
+        if self.state == self.HALF_OPEN and now - self.probe_started >= self.probe_timeout:
+            # Результат пробного запроса так и не был учтен - разрешаем новый
+            logger.warning(f"Пробный запрос не завершился за {self.probe_timeout:.0f} с, отправляется новый")
+            self.probe_started = now
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self):
+        """Запрос отменен без результата: прерванный пробный запрос возвращает выключатель в OPEN"""
+        if self.state == self.HALF_OPEN:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+class ModelStats:
+    """Скользящая статистика задержек и ошибок модели"""
+
+    def __init__(self, window=50):
+        self.latencies = deque(maxlen=window)  # Задержки успешных запросов
+        self.outcomes = deque(maxlen=window)  # True - успех, False - ошибка
+
+    def record(self, latency, success):
+        self.outcomes.append(success)
+        if success:
+            self.latencies.append(latency)
+
+    def p95(self, min_samples=5):
+        """95-й перцентиль задержки или None, если данных недостаточно"""
+        if len(self.latencies) < min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def error_rate(self):
+        if not self.outcomes:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+class ModelRouter:
+    """Маршрутизация запросов по упорядоченному списку моделей с резервированием"""
+
+    def __init__(self, models=None):
+        models = models or os.getenv('AI_MODELS', DEFAULT_MODELS).split(',')
+        self.models = [m.strip() for m in models if m.strip()]
+        self.hedge_enabled = os.getenv('AI_HEDGE_REQUESTS', '1') == '1'
+        self.hedge_min_delay = float(os.getenv('AI_HEDGE_MIN_DELAY', '3'))  # Минимальная задержка перед дублирующим запросом
+        failure_threshold = int(os.getenv('AI_BREAKER_FAILURES', '3'))
+        recovery_timeout = float(os.getenv('AI_BREAKER_RECOVERY', '120'))
+        probe_timeout = float(os.getenv('AI_BREAKER_PROBE_TIMEOUT', '180'))  # Ожидание результата пробного запроса
+        self.breakers = {m: CircuitBreaker(failure_threshold, recovery_timeout, probe_timeout) for m in self.models}
+        self.stats = {m: ModelStats() for m in self.models}
+
+    def _record(self, model, latency, error=None):
+        """Учет результата запроса в статистике и выключателе модели"""
+        self.stats[model].record(latency, error is None)
+        breaker = self.breakers[model]
+        if error is None:
+            breaker.record_success()
+            return
+        breaker.record_failure()
+        logger.warning(f"Ошибка модели {model} за {latency:.1f} с: {error}")
+        if breaker.state == CircuitBreaker.OPEN:
+            logger.warning(f"Модель {model} временно отключена (ошибок подряд: {breaker.failures}, "
+                           f"доля ошибок: {self.stats[model].error_rate():.0%})")
+
+    async def complete_async(self, call):
+        """Асинхронный запрос с резервированием и дублирующим запросом после p95 задержки"""
+        tasks = {}  # Задача -> (модель, время запуска)
+        remaining = iter(self.models)
+        last_error = None
+
+        def start_next():
+            for model in remaining:
+                if self.breakers[model].allow_request():
+                    tasks[asyncio.ensure_future(call(model))] = (model, time.monotonic())
+                    return model
+            return None
+
+        if start_next() is None:
+            raise ModelUnavailableError("Все модели временно отключены")
+
+        try:
+            while tasks:
+                # Если текущая модель отвечает дольше своего p95, параллельно запускаем следующую
+                timeout = None
+                if self.hedge_enabled and len(tasks) == 1:
+                    model, started = next(iter(tasks.values()))
+                    p95 = self.stats[model].p95()
+                    if p95 is not None:
+                        timeout = max(max(p95, self.hedge_min_delay) - (time.monotonic() - started), 0)
+
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedge_model = start_next()
+                    if hedge_model:
+                        logger.info(f"Модель {model} отвечает дольше p95, дублирующий запрос к {hedge_model}")
+                    else:
+                        # Резервных моделей нет, дальше просто ждем текущий запрос
+                        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        continue
+
+                for task in done:
+                    model, started = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        self._record(model, time.monotonic() - started, e)
+                        last_error = e
+                        continue
+                    self._record(model, time.monotonic() - started)
+                    return model, result
+
+                # Все завершившиеся запросы неудачны - переходим к следующей модели
+                if not tasks:
+                    start_next()
+        finally:
+            # Отмена проигравших дублирующих запросов (и всех запросов при отмене вызова);
+            # их модели без результата не должны остаться в полуоткрытом состоянии навсегда
+            for task, (model, _) in tasks.items():
+                task.cancel()
+                self.breakers[model].record_cancelled()
+
+        raise ModelUnavailableError(f"Нет доступных моделей: {last_error}")
+
+    def get_status(self):
+        """Текущее состояние моделей для логов и админ-панели"""
+        return [{
+            "model": m,
+            "state": self.breakers[m].state,
+            "p95": self.stats[m].p95(),
+            "error_rate": self.stats[m].error_rate()
+        } for m in self.models]
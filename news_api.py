@@ -7,25 +7,20 @@ from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from database import Database
 from web_scraper import WebScraper
+from slot_allocator import SlotAllocator
+from ranking import NewsRanker
+import metrics
+import tracing
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("news_api.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 class NewsAPI:
     def __init__(self, db):
         self.api_key = os.getenv('NEWS_API_KEY')
-        self.base_url = "https://newsdata.io/api/1/news"
+        self.base_url = os.getenv('NEWS_API_BASE_URL', "https://newsdata.io/api/1/news")  # Адрес API новостей
         self.db = db
         self.daily_limit = 1000  # Увеличенный лимит запросов в сутки (было 200)
         self.categories = ["technology"]  # Категория для поиска IT-новостей
@@ -34,6 +29,8 @@ class NewsAPI:
     "machine learning", "UX", "UI", "frontend", "backend", "fullstack",
     "artificial intelligence", "tech industry", "startups"]
         self.scraper = WebScraper(db)  # Инициализация скрапера для получения полного текста статей
+        self.allocator = SlotAllocator(db)  # Распределение постов по слотам публикации
+        self.ranker = NewsRanker(db, self.keywords + self.scraper.it_keywords)  # Оценка приоритета новостей
         self.min_content_length = 200  # Минимальная длина контента для обработки (в символах)
         self.hourly_search_limit = 20  # Лимит новостей для поиска каждый час
         self.last_notification_time = datetime.now()  # Время последнего уведомления
@@ -41,6 +38,8 @@ class NewsAPI:
     def check_api_limit(self):
         """Проверка лимита запросов к API"""
         current_count = self.db.get_api_requests_count("newsdata.io", 24)
+        metrics.NEWS_API_QUOTA_USED.set(current_count, source="newsdata.io")
+        metrics.NEWS_API_QUOTA_LIMIT.set(self.daily_limit, source="newsdata.io")
         logger.info(f"Текущее количество запросов к API: {current_count}/{self.daily_limit}")
         # Убираем проверку лимита, чтобы всегда возвращать True
         # return current_count < self.daily_limit
@@ -52,6 +51,48 @@ class NewsAPI:
             logger.warning("Достигнут дневной лимит запросов к API")
             return []
         
+        params = self._build_params(category, keyword, max_results)
+        
+        try:
+            logger.info(f"Отправка запроса к API с параметрами: {params}")
+            started = time.time()
+            with metrics.NEWS_API_SECONDS.time(source="newsdata.io"):
+                response = requests.get(self.base_url, params=params)
+            metrics.NEWS_API_REQUESTS.inc(source="newsdata.io", status=str(response.status_code))
+            self.db.log_api_request("newsdata.io", response.status_code == 200)
+            
+            if response.status_code != 200:
+                logger.error(f"Ошибка API: {response.status_code} - {response.text}")
+                return []
+            
+            data = response.json()
+            if data.get("status") != "success":
+                logger.error(f"Ошибка в ответе API: {data}")
+                return []
+            
+            articles = data.get("results", [])
+            metrics.NEWS_API_ARTICLES.inc(len(articles), source="newsdata.io")
+            self._trace_fetch(articles, started, category, keyword)
+            logger.info(f"Получено {len(articles)} новостей")
+            return articles
+        
+        except Exception as e:
+            logger.error(f"Ошибка при получении новостей: {e}")
+            metrics.NEWS_API_REQUESTS.inc(source="newsdata.io", status="error")
+            self.db.log_api_request("newsdata.io", False)
+            return []
+    
+    def _trace_fetch(self, articles, started, category, keyword):
+        """Общий запрос к API записывается первым этапом трассировки каждой полученной статьи"""
+        finished = time.time()
+        tracer = tracing.get_tracer()
+        for article in articles:
+            tracer.record("news.fetch", tracing.article_trace_id(article), started, finished,
+                          source="newsdata.io", category=category, keyword=keyword,
+                          url=article.get("link"), batch_size=len(articles))
+    
+    def _build_params(self, category=None, keyword=None, max_results=10):
+        """Параметры запроса к API новостей"""
         params = {
             "apikey": self.api_key,
             "language": "en",  # Английский язык
@@ -64,29 +105,63 @@ class NewsAPI:
         if keyword:
             params["q"] = keyword
         
+        return params
+    
+    async def fetch_news_async(self, session, category=None, keyword=None, max_results=10):
+        """Асинхронное получение новостей по категории или ключевому слову"""
+        if not self.check_api_limit():
+            logger.warning("Достигнут дневной лимит запросов к API")
+            return []
+        
+        params = self._build_params(category, keyword, max_results)
+        
         try:
-            logger.info(f"Отправка запроса к API с параметрами: {params}")
-            response = requests.get(self.base_url, params=params)
-            self.db.log_api_request("newsdata.io", response.status_code == 200)
-            
-            if response.status_code != 200:
-                logger.error(f"Ошибка API: {response.status_code} - {response.text}")
-                return []
+            logger.info(f"Отправка асинхронного запроса к API (категория: {category}, ключевое слово: {keyword})")
+            started = time.time()
+            with metrics.NEWS_API_SECONDS.time(source="newsdata.io"):
+                async with session.get(self.base_url, params=params) as response:
+                    metrics.NEWS_API_REQUESTS.inc(source="newsdata.io", status=str(response.status))
+                    self.db.log_api_request("newsdata.io", response.status == 200)
+                    
+                    if response.status != 200:
+                        logger.error(f"Ошибка API: {response.status} - {await response.text()}")
+                        return []
+                    
+                    data = await response.json(content_type=None)
             
-            data = response.json()
             if data.get("status") != "success":
                 logger.error(f"Ошибка в ответе API: {data}")
                 return []
             
             articles = data.get("results", [])
+            metrics.NEWS_API_ARTICLES.inc(len(articles), source="newsdata.io")
+            self._trace_fetch(articles, started, category, keyword)
             logger.info(f"Получено {len(articles)} новостей")
             return articles
         
         except Exception as e:
             logger.error(f"Ошибка при получении новостей: {e}")
+            metrics.NEWS_API_REQUESTS.inc(source="newsdata.io", status="error")
             self.db.log_api_request("newsdata.io", False)
             return []
     
+    def classify_article(self, title, content):
+        """Определение категории новости по ключевым словам"""
+        title_lower = (title or "").lower()
+        content_lower = (content or "").lower()
+        for keyword in self.keywords:
+            if keyword.lower() in title_lower or keyword.lower() in content_lower:
+                return keyword.lower()
+        return "technology"  # По умолчанию технологии
+    
+    @staticmethod
+    def parse_pub_date(pub_date_str):
+        """Преобразование даты публикации из ответа API"""
+        try:
+            return datetime.strptime(pub_date_str or "", "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return datetime.now()
+    
     def filter_news(self, articles):
         """Фильтрация новостей по качеству и обогащение контента"""
         filtered_articles = []
@@ -104,7 +179,9 @@ class NewsAPI:
             # Если контент отсутствует или слишком короткий, пытаемся получить полный текст
             if not content or len(content) < self.min_content_length:
                 logger.info(f"Контент статьи '{article.get('title')}' слишком короткий ({len(content)} символов). Пытаемся получить полный текст.")
-                full_content = self.scraper.get_full_article_content(url)
+                with tracing.span("news.scrape", tracing.article_trace_id(article), url=url) as span:
+                    full_content = self.scraper.get_full_article_content(url)
+                    span.set(chars=len(full_content or ""))
                 
                 if full_content and len(full_content) > len(content):
                     logger.info(f"Успешно получен полный текст статьи ({len(full_content)} символов)")
@@ -129,26 +206,22 @@ class NewsAPI:
             url = article.get("link", "")
             
             # Преобразование даты публикации
-            pub_date_str = article.get("pubDate", "")
-            try:
-                pub_date = datetime.strptime(pub_date_str, "%Y-%m-%d %H:%M:%S")
-            except ValueError:
-                pub_date = datetime.now()
+            pub_date = self.parse_pub_date(article.get("pubDate", ""))
             
             # Определение категории
-            category = "technology"  # По умолчанию технологии
-            for keyword in self.keywords:
-                if keyword.lower() in title.lower() or keyword.lower() in content.lower():
-                    category = keyword.lower()
-                    break
+            category = self.classify_article(title, content)
             
             # Логирование информации о длине контента
             logger.info(f"Сохранение новости '{title}' с контентом длиной {len(content)} символов")
             
-            # Сохранение в базу данных
-            news_id = self.db.save_news(title, content, url, pub_date, category)
-            if news_id:
-                saved_count += 1
+            # Сохранение в базу данных; трассировка статьи продолжается под ID новости
+            with tracing.span("news.store", tracing.article_trace_id(article), url=url, category=category) as span:
+                news_id = self.db.save_news(title, content, url, pub_date, category, trace_id=span.trace_id)
+                if news_id:
+                    span.set(news_id=news_id, rank_score=self.ranker.rank(news_id, title, content, url, pub_date))
+                    saved_count += 1
+                else:
+                    span.set(duplicate=True)
         
         logger.info(f"Сохранено {saved_count} новостей в базу данных")
         return saved_count
@@ -242,62 +315,10 @@ class NewsAPI:
         return saved_count
         
     def schedule_new_posts(self):
-        """Автоматическое планирование новых постов"""
-        try:
-            # Получение необработанных новостей
-            with self.db.conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT n.id
-                    FROM news n
-                    LEFT JOIN scheduled_posts sp ON n.id = sp.news_id
-                    WHERE n.processed = TRUE AND sp.id IS NULL
-                    ORDER BY n.published_date DESC
-                    LIMIT 10
-                """)
-                news_ids = [row[0] for row in cursor.fetchall()]
-            
-            if not news_ids:
-                logger.info("Нет новых обработанных новостей для планирования")
-                return 0
-            
-            # Получение настроек времени публикации
-            timezone_name = self.db.get_schedule_setting('timezone') or 'Europe/Moscow'
-            
-            # Получение следующих доступных слотов для публикации
-            now = datetime.now()
-            scheduled_count = 0
-            
-            for news_id in news_ids:
-                # Определение следующего доступного времени публикации
-                # Начинаем с текущего времени + 1 час и округляем до следующего часа
-                next_hour = now + timedelta(hours=1)
-                scheduled_time = datetime(next_hour.year, next_hour.month, next_hour.day, 
-                                         next_hour.hour, 0, 0)
-                
-                # Планирование публикации
-                with self.db.conn.cursor() as cursor:
-                    cursor.execute("""
-                        INSERT INTO scheduled_posts (news_id, scheduled_date, status)
-                        VALUES (%s, %s, 'pending')
-                        ON CONFLICT (news_id) DO NOTHING
-                        RETURNING id
-                    """, (news_id, scheduled_time))
-                    result = cursor.fetchone()
-                    
-                    if result:
-                        scheduled_count += 1
-                        # Увеличиваем время для следующего поста на 1 час
-                        now = scheduled_time
-                
-                self.db.conn.commit()
-            
-            logger.info(f"Запланировано {scheduled_count} новых постов")
-            return scheduled_count
-            
-        except Exception as e:
-            logger.error(f"Ошибка при планировании новых постов: {e}")
-            self.db.conn.rollback()
-            return 0
+        """Автоматическое планирование новых постов по свободным слотам расписания"""
+        # Новости без оценки иначе уходили бы в конец очереди независимо от свежести
+        self.ranker.rank_unscored()
+        return len(self.allocator.schedule_pending(limit=10))
             
     def send_admin_notification(self, count):
         """Отправка уведомления администраторам о новых постах"""
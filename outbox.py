@@ -0,0 +1,292 @@
+import os
+import json
+import logging
+from datetime import timedelta
+from psycopg2.extras import DictCursor
+
+logger = logging.getLogger(__name__)
+
+class PublishOutbox:
+    """Исходящие доставки постов в каналы: постановка в той же транзакции, что и захват поста"""
+
+    def __init__(self, db, render, channel_slot):
+        self.db = db
+        self.render = render  # (пост, канал) -> список частей сообщения
+        self.channel_slot = channel_slot  # (канал, текущее время) -> время публикации в канале
+        self.lease_seconds = int(os.getenv('OUTBOX_LEASE_SECONDS', '300'))  # После этого отправка считается прерванной
+        self.retry_delay = int(os.getenv('OUTBOX_RETRY_SECONDS', '60'))  # Пауза перед повторной доставкой
+        self.max_attempts = 3  # Попыток доставки в канал до окончательной ошибки
+
+    def _enqueue(self, cursor, posts, now):
+        """Создание доставок постов во все включенные каналы в текущей транзакции"""
+        cursor.execute("""
+            SELECT id, chat_id, hashtags, publish_times
+            FROM channels
+            WHERE enabled = TRUE
+            ORDER BY id
+        """)
+        channels = cursor.fetchall()
+        if not channels:
+            logger.error("Нет включенных каналов для публикации")
+            return
+
+        # Сообщения, подготовленные при планировании
+        cursor.execute("""
+            SELECT news_id, channel_id, parts FROM rendered_messages
+            WHERE news_id = ANY(%s)
+        """, ([post['id'] for post in posts],))
+        rendered = {(row['news_id'], row['channel_id']): row['parts'] for row in cursor.fetchall()}
+
+        for post in posts:
+            for channel in channels:
+                status, error = 'pending', None
+                payload = rendered.get((post['id'], channel['id']))
+                if payload is None:
+                    try:
+                        payload = json.dumps(self.render(post, channel), ensure_ascii=False)
+                    except Exception as e:
+                        # Пост, который Telegram заведомо отклонит, не расходует попытки отправки
+                        status, error = 'failed', str(e)[:1000]
+                        logger.error(f"Не удалось подготовить сообщение новости {post['id']} для канала {channel['chat_id']}: {e}")
+                cursor.execute("""
+                    INSERT INTO deliveries (news_id, channel_id, scheduled_date, payload, status, last_error)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (news_id, channel_id) DO NOTHING
+                """, (post['id'], channel['id'], self.channel_slot(channel, now), payload, status, error))
+            self._finalize_post(cursor, post['id'])
+
+    def claim_due_posts(self, now, limit=5):
+        """Захват наступивших запланированных постов и постановка их доставок одной транзакцией"""
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return []
+
+            with self.db.conn.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute("""
+                    WITH due AS (
+                        SELECT s.id
+                        FROM scheduled_posts s
+                        JOIN news n ON n.id = s.news_id
+                        WHERE s.status = 'pending' AND s.scheduled_date <= %s
+                          AND n.processed = TRUE AND n.published = FALSE
+                        ORDER BY s.scheduled_date ASC, n.rank_score DESC NULLS LAST
+                        LIMIT %s
+                        FOR UPDATE OF s SKIP LOCKED
+                    ),
+                    claimed AS (
+                        UPDATE scheduled_posts s
+                        SET status = 'publishing', attempts = s.attempts + 1, last_attempt = CURRENT_TIMESTAMP
+                        FROM due
+                        WHERE s.id = due.id
+                        RETURNING s.news_id
+                    )
+                    UPDATE news n
+                    SET published = TRUE
+                    FROM claimed, processed_news p
+                    WHERE n.id = claimed.news_id AND p.news_id = n.id
+                    RETURNING n.id, n.title, n.url, n.category, p.processed_title, p.processed_content
+                """, (now, limit))
+                posts = cursor.fetchall()
+                self._enqueue(cursor, posts, now)
+                self.db.conn.commit()
+
+            if posts:
+                logger.info(f"В очередь отправки поставлено {len(posts)} запланированных постов")
+            return posts
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при захвате запланированных постов: {e}")
+            return []
+
+    def enqueue_news(self, news_id, now):
+        """Немедленная постановка новости в очередь отправки (вне расписания)"""
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return False
+
+            with self.db.conn.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute("""
+                    UPDATE news n
+                    SET published = TRUE
+                    FROM processed_news p
+                    WHERE n.id = %s AND p.news_id = n.id
+                    RETURNING n.id, n.title, n.url, n.category, p.processed_title, p.processed_content
+                """, (news_id,))
+                posts = cursor.fetchall()
+                if not posts:
+                    self.db.conn.rollback()
+                    logger.error(f"Новость {news_id} не найдена или еще не обработана")
+                    return False
+
+                cursor.execute("""
+                    UPDATE scheduled_posts
+                    SET status = 'publishing', attempts = attempts + 1, last_attempt = CURRENT_TIMESTAMP
+                    WHERE news_id = %s AND status IN ('pending', 'error')
+                """, (news_id,))
+                self._enqueue(cursor, posts, now)
+                self.db.conn.commit()
+                return True
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при постановке новости {news_id} в очередь отправки: {e}")
+            return False
+
+    def claim_deliveries(self, now, limit=20, news_id=None):
+        """Захват доставок к отправке, включая прерванные (например, перезапуском процесса)"""
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return []
+
+            with self.db.conn.cursor(cursor_factory=DictCursor) as cursor:
+                cursor.execute("""
+                    WITH picked AS (
+                        SELECT d.id
+                        FROM deliveries d
+                        JOIN channels c ON c.id = d.channel_id
+                        WHERE c.enabled = TRUE
+                          AND ((d.status = 'pending' AND d.scheduled_date <= %s)
+                               OR (d.status = 'sending' AND d.claimed_at < NOW() - make_interval(secs => %s)))
+                          AND (%s::integer IS NULL OR d.news_id = %s)
+                        ORDER BY d.scheduled_date ASC, d.id ASC
+                        LIMIT %s
+                        FOR UPDATE OF d SKIP LOCKED
+                    )
+                    UPDATE deliveries d
+                    SET status = 'sending', attempts = d.attempts + 1, claimed_at = NOW()
+                    FROM picked, channels c, news n
+                    WHERE d.id = picked.id AND c.id = d.channel_id AND n.id = d.news_id
+                    RETURNING d.id, d.news_id, d.attempts, d.payload, d.scheduled_date, d.sent_parts, d.message_ids,
+                              c.chat_id, n.trace_id
+                """, (now, self.lease_seconds, news_id, news_id, limit))
+                deliveries = cursor.fetchall()
+                self.db.conn.commit()
+                return deliveries
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при захвате доставок: {e}")
+            return []
+
+    def _finalize_post(self, cursor, news_id):
+        """Итоговый статус запланированного поста, когда все его доставки завершены"""
+        cursor.execute("""
+            UPDATE scheduled_posts s
+            SET status = CASE WHEN EXISTS (
+                    SELECT 1 FROM deliveries WHERE news_id = %s AND status = 'sent'
+                ) THEN 'published' ELSE 'failed' END
+            WHERE s.news_id = %s AND s.status = 'publishing'
+              AND NOT EXISTS (
+                  SELECT 1 FROM deliveries WHERE news_id = %s AND status IN ('pending', 'sending')
+              )
+        """, (news_id, news_id, news_id))
+
+    def record_part(self, delivery, sent_parts, message_ids):
+        """Сохранение хода отправки после каждой части сообщения (заодно продлевает аренду доставки)"""
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return False
+
+            with self.db.conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE deliveries
+                    SET sent_parts = %s, message_ids = %s, claimed_at = NOW()
+                    WHERE id = %s AND status = 'sending' AND attempts = %s
+                """, (sent_parts, json.dumps(message_ids), delivery['id'], delivery['attempts']))
+                self.db.conn.commit()
+                return True
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при сохранении хода отправки доставки #{delivery['id']}: {e}")
+            return False
+
+    def extend_lease(self, delivery):
+        """Продление аренды доставки, которая еще отправляется"""
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return False
+
+            with self.db.conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE deliveries SET claimed_at = NOW()
+                    WHERE id = %s AND status = 'sending' AND attempts = %s
+                """, (delivery['id'], delivery['attempts']))
+                self.db.conn.commit()
+                return True
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при продлении аренды доставки #{delivery['id']}: {e}")
+            return False
+
+    def complete(self, delivery, message_ids):
+        """Отметка доставки как отправленной с сохранением message_id всех частей (только текущим владельцем)"""
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return False
+
+            with self.db.conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE deliveries
+                    SET status = 'sent', message_id = %s, message_ids = %s, sent_parts = %s,
+                        sent_at = CURRENT_TIMESTAMP, last_error = NULL
+                    WHERE id = %s AND status = 'sending' AND attempts = %s
+                """, (message_ids[0] if message_ids else None, json.dumps(message_ids), len(message_ids),
+                      delivery['id'], delivery['attempts']))
+                if cursor.rowcount == 0:
+                    # Аренда истекла и доставку захватил другой отправитель: его результат не перезаписываем
+                    self.db.conn.rollback()
+                    logger.warning(f"Доставка #{delivery['id']} больше не принадлежит отправителю, результат не сохранен")
+                    return False
+                self._finalize_post(cursor, delivery['news_id'])
+                self.db.conn.commit()
+                return True
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при сохранении результата доставки #{delivery['id']}: {e}")
+            return False
+
+    def fail(self, delivery, error, now):
+        """Возврат доставки в очередь с задержкой или окончательная ошибка (только текущим владельцем)"""
+        final = delivery['attempts'] >= self.max_attempts
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return
+
+            with self.db.conn.cursor() as cursor:
+                cursor.execute("""
+                    UPDATE deliveries
+                    SET status = %s, scheduled_date = %s, last_error = %s
+                    WHERE id = %s AND status = 'sending' AND attempts = %s
+                """, ('failed' if final else 'pending', now + timedelta(seconds=self.retry_delay),
+                      str(error)[:1000], delivery['id'], delivery['attempts']))
+                if cursor.rowcount == 0:
+                    # Поздняя ошибка не должна вернуть в очередь доставку, которую уже отправил другой отправитель
+                    self.db.conn.rollback()
+                    logger.warning(f"Доставка #{delivery['id']} больше не принадлежит отправителю, ошибка не сохранена")
+                    return
+                self._finalize_post(cursor, delivery['news_id'])
+                self.db.conn.commit()
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при сохранении результата доставки #{delivery['id']}: {e}")
+
+    def is_delivered(self, news_id, now):
+        """Все наступившие доставки новости отправлены"""
+        try:
+            with self.db.conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT NOT EXISTS (
+                        SELECT 1 FROM deliveries
+                        WHERE news_id = %s
+                          AND (status = 'failed' OR (status IN ('pending', 'sending') AND scheduled_date <= %s))
+                    )
+                """, (news_id, now))
+                return cursor.fetchone()[0]
+        except Exception as e:
+            logger.error(f"Ошибка при проверке доставок новости {news_id}: {e}")
+            return False
@@ -0,0 +1,194 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import aiohttp
+import contextlib
+import tracing
+from database import DatabaseThread
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+class NewsPipeline:
+    """Потоковый конвейер: получение → скрапинг → классификация → сохранение → AI → планирование"""
+
+    def __init__(self, db, news_api, ai_worker, http_session=None):
+        self.db = db
+        self.http_session = http_session  # Общая сессия aiohttp процесса; без нее создается на время запуска
+        self.news_api = news_api
+        self.scraper = news_api.scraper
+        self.ai_worker = ai_worker
+        # Ограниченные очереди между стадиями: быстрая стадия ждет медленную, а не копит статьи в памяти
+        self.queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', '10'))
+        self.workers = {
+            "scrape": int(os.getenv('PIPELINE_SCRAPE_WORKERS', '5')),
+            "classify": 1,
+            "store": 1,
+            "ai": int(os.getenv('PIPELINE_AI_WORKERS', str(ai_worker.ai_processor.max_concurrent))),
+            "schedule": 1
+        }
+        self.schedule_batch = int(os.getenv('PIPELINE_SCHEDULE_BATCH', '1'))  # Готовых новостей до планирования
+        self.keywords_per_run = 5  # Ключевых слов за один запуск, чтобы не превышать лимиты API
+        self.fetch_delay = 1  # Пауза между запросами к API новостей (в секундах)
+        self.stats = Counter()
+        self.pending_schedule = 0
+        self.db_thread = None  # Соединение стадии сохранения, открытое на время запуска
+
+    def _session(self):
+        """Сессия для запросов к API новостей: общая (не закрывается здесь) или новая"""
+        if self.http_session is not None:
+            return contextlib.nullcontext(self.http_session)
+        return aiohttp.ClientSession()
+
+    async def _fetch(self, out_queue, keywords, categories, max_results):
+        """Получение новостей по категориям и ключевым словам и передача новых URL на скрапинг"""
+        seen_urls = set()
+        queries = [(category, None) for category in categories] + [(None, keyword) for keyword in keywords]
+        async with self._session() as session:
+            for category, keyword in queries:
+                articles = await self.news_api.fetch_news_async(session, category=category, keyword=keyword,
+                                                                max_results=max_results)
+                for article in articles:
+                    url = article.get("link", "")
+                    if not url or url in seen_urls:
+                        continue
+                    seen_urls.add(url)
+                    self.stats["fetched"] += 1
+                    # Если скрапинг не успевает, получение новостей приостанавливается
+                    await out_queue.put(article)
+                await asyncio.sleep(self.fetch_delay)
+
+    async def _scrape(self, article):
+        """Получение полного текста статьи"""
+        if not article.get("title"):
+            logger.warning(f"Пропуск статьи без заголовка: {article.get('link')}")
+            return None
+
+        content = article.get("content") or ""
+        with tracing.span("news.scrape", tracing.article_trace_id(article), url=article["link"]) as span:
+            full_content = await self.scraper.get_full_article_content_async(article["link"])
+            span.set(chars=len(full_content or ""))
+        if full_content and len(full_content) > len(content):
+            article["content"] = full_content
+        elif not content:
+            logger.warning(f"Не удалось получить контент для статьи: {article.get('title')}")
+            return None
+        return article
+
+    async def _classify(self, article):
+        """Определение категории и даты публикации"""
+        article["category"] = self.news_api.classify_article(article["title"], article["content"])
+        article["published_date"] = self.news_api.parse_pub_date(article.get("pubDate", ""))
+        return article
+
+    async def _store(self, article):
+        """Сохранение новости и расчет ее оценки; задача AI-обработки ставится в очередь той же транзакцией"""
+        with tracing.span("news.store", tracing.article_trace_id(article),
+                          url=article["link"], category=article["category"]) as span:
+            # Запись и поиск кластера идут в своем потоке: остальные стадии и бот не ждут базу
+            news_id, score = await self.db_thread.run(self._save_and_rank, article, span.trace_id)
+            if not news_id:
+                span.set(duplicate=True)
+                return None
+            span.set(news_id=news_id, rank_score=score)
+        return news_id
+
+    def _save_and_rank(self, db, article, trace_id):
+        """Сохранение новости и расчет ее оценки (выполняется в потоке db_thread)"""
+        news_id = db.save_news(article["title"], article["content"], article["link"],
+                               article["published_date"], article["category"], trace_id=trace_id)
+        if not news_id:
+            return None, None
+        score = self.news_api.ranker.rank(news_id, article["title"], article["content"], article["link"],
+                                          article["published_date"], db=db)
+        return news_id, score
+
+    async def _process(self, news_id):
+        """AI-обработка сохраненной новости"""
+        result = await self.ai_worker.process_news_id(news_id)
+        if not result or not result.get("success"):
+            # Неудачная задача остается в очереди и будет повторена плановой обработкой
+            return None
+        return result
+
+    async def _schedule(self, result):
+        """Планирование готовых постов пакетами"""
+        self.pending_schedule += 1
+        if self.pending_schedule >= self.schedule_batch:
+            self._flush_schedule()
+        return result
+
+    def _flush_schedule(self):
+        """Планирование накопленных готовых постов"""
+        if self.pending_schedule:
+            self.stats["scheduled"] += self.news_api.schedule_new_posts()
+            self.pending_schedule = 0
+
+    async def _worker(self, name, handler, in_queue, out_queue):
+        """Воркер стадии: берет элемент из входной очереди и передает результат в следующую"""
+        while True:
+            item = await in_queue.get()
+            try:
+                result = await handler(item)
+                if result is not None:
+                    self.stats[name] += 1
+                    if out_queue is not None:
+                        await out_queue.put(result)
+            except Exception as e:
+                logger.error(f"Ошибка на стадии {name} конвейера: {e}")
+            finally:
+                in_queue.task_done()
+
+    async def run(self, keywords=None, categories=(), max_results=5):
+        """Запуск конвейера по ключевым словам (по умолчанию - случайным) и категориям, возвращает количество сохраненных новостей"""
+        if keywords is None:
+            keywords = random.sample(self.news_api.keywords, min(self.keywords_per_run, len(self.news_api.keywords)))
+
+        started = time.monotonic()
+        self.stats = Counter()
+        self.pending_schedule = 0
+
+        stages = [
+            ("scrape", self._scrape),
+            ("classify", self._classify),
+            ("store", self._store),
+            ("ai", self._process),
+            ("schedule", self._schedule)
+        ]
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in stages]
+        self.db_thread = DatabaseThread("pipeline-db")
+        tasks = []
+        for i, (name, handler) in enumerate(stages):
+            out_queue = queues[i + 1] if i + 1 < len(queues) else None
+            for _ in range(self.workers[name]):
+                tasks.append(asyncio.create_task(self._worker(name, handler, queues[i], out_queue)))
+
+        logger.info(f"Запуск конвейера новостей по категориям: {', '.join(categories) or '-'}, "
+                    f"ключевым словам: {', '.join(keywords)}")
+        try:
+            await self._fetch(queues[0], keywords, categories, max_results)
+            # Стадии завершаются по порядку: следующая очередь пополняется только предыдущей
+            for queue in queues:
+                await queue.join()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.db_thread.close()
+            if self.http_session is None:
+                # С общей сессией скрапер общий для нескольких конвейеров и закрывается владельцем процесса
+                await self.scraper.close()
+
+        self._flush_schedule()
+        saved_count = self.stats["store"]
+        if saved_count > 0:
+            self.news_api.send_admin_notification(saved_count)
+
+        logger.info(
+            f"Конвейер новостей завершен за {time.monotonic() - started:.1f} с: получено {self.stats['fetched']}, "
+            f"со скрапингом {self.stats['scrape']}, сохранено {saved_count}, "
+            f"обработано AI {self.stats['ai']}"
+        )
+        return saved_count
@@ -0,0 +1,92 @@
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Основные диапазоны эмодзи и пиктограмм
+EMOJI_RE = re.compile('[\U0001F000-\U0001FAFF\u2600-\u27BF\u2B00-\u2BFF\u2300-\u23FF\u3030\u303D\u3297\u3299]')
+PARAGRAPH_SPLIT_RE = re.compile(r'\n\s*\n')
+WORD_RE = re.compile(r'[A-Za-zА-Яа-яЁё0-9][\w\-]*')
+URL_RE = re.compile(r'https?://\S+')
+HASHTAG_RE = re.compile(r'#\w+')
+
+class PostFormatError(Exception):
+    """Ответ модели явно не соответствует формату поста"""
+
+class StreamingPostValidator:
+    """Проверка формата поста по мере получения токенов"""
+
+    def __init__(self, min_words=100, max_words=150):
+        self.min_words = min_words
+        self.max_words = max_words
+        # Допуск: модели редко попадают в объем точно, отменяем только явные нарушения
+        self.tolerance = float(os.getenv('AI_STREAM_WORD_TOLERANCE', '0.25'))
+        self.max_title_chars = 150  # Заголовок без перевода строки длиннее этого - ошибка формата
+        self.text = ""
+        self.title_checked = False
+        self.checked_paragraphs = 0
+
+    @staticmethod
+    def _count_words(text):
+        """Количество слов без ссылок и хэштегов"""
+        text = HASHTAG_RE.sub(' ', URL_RE.sub(' ', text))
+        return len(WORD_RE.findall(text))
+
+    @staticmethod
+    def _is_service_paragraph(paragraph):
+        """Абзац только со ссылкой и/или хэштегами не обязан содержать эмодзи"""
+        rest = HASHTAG_RE.sub(' ', URL_RE.sub(' ', paragraph))
+        return len(WORD_RE.findall(rest)) < 4
+
+    def _check_title(self, title):
+        letters = [ch for ch in title if ch.isalpha()]
+        if not letters:
+            raise PostFormatError("Первая строка не содержит заголовка")
+        upper_ratio = sum(1 for ch in letters if ch.isupper()) / len(letters)
+        if upper_ratio < 0.8:
+            raise PostFormatError(f"Заголовок не заглавными буквами: '{title[:60]}'")
+
+    def feed(self, chunk):
+        """Добавление очередного фрагмента ответа и проверка уже полученной части"""
+        if not chunk:
+            return
+        self.text += chunk
+        text = self.text.lstrip()
+
+        # Заголовок проверяем, как только получена вся первая строка
+        if not self.title_checked:
+            if '\n' in text:
+                self._check_title(text.split('\n', 1)[0])
+                self.title_checked = True
+            elif len(text) > self.max_title_chars:
+                raise PostFormatError("Первая строка слишком длинная для заголовка")
+            else:
+                return
+
+        body = text.split('\n', 1)[1] if '\n' in text else ""
+
+        # Превышение объема видно задолго до окончания генерации
+        words = self._count_words(body)
+        if words > self.max_words * (1 + self.tolerance):
+            raise PostFormatError(f"Превышен объем поста: {words} слов")
+
+        # Проверяем только завершенные абзацы (за которыми уже начался следующий)
+        parts = PARAGRAPH_SPLIT_RE.split(body.lstrip())
+        completed = [p for p in parts[:-1] if p.strip()]
+        for paragraph in completed[self.checked_paragraphs:]:
+            if not EMOJI_RE.search(paragraph) and not self._is_service_paragraph(paragraph):
+                raise PostFormatError(f"Абзац без эмодзи: '{paragraph[:60]}'")
+        self.checked_paragraphs = max(self.checked_paragraphs, len(completed))
+
+    def finish(self):
+        """Итоговая проверка полного ответа"""
+        text = self.text.strip()
+        if not text:
+            raise PostFormatError("Пустой ответ модели")
+        if not self.title_checked:
+            raise PostFormatError("Ответ не содержит текста поста после заголовка")
+        words = self._count_words(text.split('\n', 1)[1])
+        if words < self.min_words * (1 - self.tolerance):
+            raise PostFormatError(f"Слишком короткий пост: {words} слов")
+        return text
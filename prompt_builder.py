@@ -0,0 +1,145 @@
+import os
+import re
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Разделение текста на предложения по завершающей пунктуации
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?…])\s+(?=["«(\[]?[A-ZА-ЯЁ0-9])')
+WORD_RE = re.compile(r'[A-Za-zА-Яа-яЁё0-9][A-Za-zА-Яа-яЁё0-9\-+#.]*')
+TOKEN_PIECE_RE = re.compile(r'[A-Za-z]+|[0-9]+|[^\sA-Za-z0-9]+')
+
+# Частые слова, не несущие смысла для оценки важности предложения
+STOP_WORDS = {
+    "the", "and", "for", "that", "with", "this", "from", "are", "was", "were", "has", "have",
+    "had", "but", "not", "you", "its", "it's", "they", "their", "will", "would", "can", "could",
+    "been", "also", "into", "than", "then", "there", "which", "who", "what", "when", "where",
+    "about", "more", "some", "such", "our", "your", "his", "her", "she", "him", "them", "these",
+    "those", "said", "says", "one", "all", "any", "how", "new", "just", "like", "over", "out",
+    "как", "что", "это", "для", "или", "так", "его", "она", "они", "уже", "при", "был", "была"
+}
+
+class PromptBuilder:
+    """Сборка промта с ограничением количества входных токенов"""
+
+    def __init__(self, template, token_budget=None):
+        self.template = template
+        # Бюджет токенов на весь промт (шаблон + заголовок + контент)
+        self.token_budget = token_budget or int(os.getenv('AI_PROMPT_TOKEN_BUDGET', '1500'))
+        self.title_weight = 2.0  # Дополнительный вес слов из заголовка
+        self.lead_bonus = 0.5  # Бонус первым предложениям (в новостях главное обычно в начале)
+
+    @staticmethod
+    def estimate_tokens(text):
+        """Локальная оценка количества токенов без обращения к токенизатору модели"""
+        if not text:
+            return 0
+        tokens = 0
+        for piece in TOKEN_PIECE_RE.findall(text):
+            if piece.isascii():
+                # Латиница и цифры: в среднем около 4 символов на токен
+                tokens += math.ceil(len(piece) / 4)
+            else:
+                # Кириллица, эмодзи и пунктуация разбиваются BPE-токенизаторами мельче
+                tokens += math.ceil(len(piece) / 2)
+        return tokens
+
+    @staticmethod
+    def split_sentences(text):
+        """Разбиение текста на предложения"""
+        return [s.strip() for s in SENTENCE_SPLIT_RE.split(text) if s.strip()]
+
+    @staticmethod
+    def _words(text):
+        """Нормализованные значимые слова текста"""
+        return [
+            w for w in (m.lower().strip('.-') for m in WORD_RE.findall(text))
+            if len(w) > 2 and w not in STOP_WORDS
+        ]
+
+    def score_sentences(self, sentences, title=""):
+        """Оценка информативности предложений по TF-IDF с учетом слов заголовка"""
+        import numpy as np  # Загружается при первой оценке, а не при импорте модуля
+        tokenized = [self._words(s) for s in sentences]
+        vocabulary = {}
+        for words in tokenized:
+            for word in words:
+                vocabulary.setdefault(word, len(vocabulary))
+
+        if not vocabulary:
+            return np.zeros(len(sentences))
+
+        # Матрица частот слов (предложения x словарь)
+        rows = np.fromiter((i for i, words in enumerate(tokenized) for _ in words), dtype=np.int64)
+        cols = np.fromiter((vocabulary[w] for words in tokenized for w in words), dtype=np.int64)
+        tf = np.zeros((len(sentences), len(vocabulary)))
+        np.add.at(tf, (rows, cols), 1.0)
+
+        # Сглаженный IDF: слова, встречающиеся почти везде, почти не влияют на оценку
+        df = np.count_nonzero(tf, axis=0)
+        idf = np.log((1 + len(sentences)) / (1 + df)) + 1.0
+
+        # Слова заголовка считаются ключевыми
+        weights = idf.copy()
+        title_ids = [vocabulary[w] for w in set(self._words(title)) if w in vocabulary]
+        if title_ids:
+            weights[title_ids] *= self.title_weight
+
+        lengths = np.maximum(tf.sum(axis=1), 1.0)
+        scores = (np.log1p(tf) @ weights) / np.sqrt(lengths)
+
+        # Бонус за позицию в тексте
+        positions = np.arange(len(sentences))
+        scores *= 1.0 + self.lead_bonus / (1.0 + positions)
+        return scores
+
+    def summarize(self, text, max_tokens, title=""):
+        """Экстрактивное сокращение текста до max_tokens с сохранением порядка предложений"""
+        import numpy as np
+        if self.estimate_tokens(text) <= max_tokens:
+            return text
+
+        sentences = self.split_sentences(text)
+        if not sentences:
+            return ""
+
+        scores = self.score_sentences(sentences, title)
+        costs = np.array([self.estimate_tokens(s) + 1 for s in sentences])
+
+        # Жадный выбор самых информативных предложений, помещающихся в бюджет
+        selected = []
+        seen = set()
+        used = 0
+        for idx in np.argsort(-scores, kind='stable'):
+            # Повторяющиеся предложения (подписи, врезки) берем только один раз
+            key = sentences[idx].lower()
+            if key in seen:
+                continue
+            if used + costs[idx] <= max_tokens:
+                selected.append(idx)
+                seen.add(key)
+                used += costs[idx]
+
+        if not selected:
+            # Даже самое важное предложение не помещается - обрезаем его по символам
+            best = sentences[int(np.argmax(scores))]
+            return best[:max_tokens * 2]
+
+        return ' '.join(sentences[i] for i in sorted(selected))
+
+    def build(self, news_item):
+        """Формирование промта для новости в рамках бюджета токенов"""
+        title = news_item.get('title', '') or ''
+        content = news_item.get('content', '') or ''
+
+        # Бюджет на контент - все, что остается после шаблона и заголовка
+        overhead = self.estimate_tokens(self.template.format(original_title=title, original_content=""))
+        content_budget = max(self.token_budget - overhead, 0)
+
+        original_tokens = self.estimate_tokens(content)
+        if original_tokens > content_budget:
+            content = self.summarize(content, content_budget, title)
+            logger.info(f"Контент новости '{title}' сокращен с ~{original_tokens} до ~{self.estimate_tokens(content)} токенов")
+
+        return self.template.format(original_title=title, original_content=content)
@@ -0,0 +1,162 @@
+import os
+import re
+import math
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"[a-zа-яё0-9]+")
+STOP_WORDS = {
+    "the", "and", "for", "with", "from", "that", "this", "are", "was", "its", "into", "over",
+    "new", "how", "why", "what", "will", "has", "have", "about", "after", "says", "your", "you",
+}
+DEFAULT_DOMAIN_WEIGHTS = {
+    "techcrunch.com": 1.3, "theverge.com": 1.2, "arstechnica.com": 1.2, "wired.com": 1.2,
+    "venturebeat.com": 1.1, "zdnet.com": 1.1, "engadget.com": 1.1, "thenextweb.com": 1.1,
+}
+
+def parse_domain_weights(value):
+    """Веса источников из строки вида 'domain:weight,domain:weight'"""
+    weights = {}
+    for item in (value or "").split(','):
+        domain, _, weight = item.strip().partition(':')
+        try:
+            weights[domain.lower()] = float(weight)
+        except ValueError:
+            if item.strip():
+                logger.warning(f"Некорректный вес источника: {item}")
+    return weights
+
+def title_words(title):
+    """Значимые слова заголовка для поиска дубликатов"""
+    return {w for w in WORD_RE.findall((title or "").lower()) if len(w) > 2 and w not in STOP_WORDS}
+
+class NewsRanker:
+    """Оценка приоритета новости: свежесть, ключевые слова, источник и размер кластера дубликатов.
+
+    Свежесть учитывается без пересчета во времени: score(t) = S * exp(-(t - published) / tau)
+    при любом t упорядочен так же, как ln(S) + published / tau, поэтому в news.rank_score
+    хранится именно эта величина и по ней строится индекс.
+    """
+
+    def __init__(self, db, keywords):
+        self.db = db
+        self.decay_seconds = float(os.getenv('RANK_DECAY_HOURS', '24')) * 3600  # Время затухания свежести в e раз
+        self.cluster_window = timedelta(hours=int(os.getenv('RANK_CLUSTER_HOURS', '48')))  # Окно поиска дубликатов
+        self.cluster_similarity = float(os.getenv('RANK_CLUSTER_SIMILARITY', '0.5'))  # Порог сходства заголовков
+        self.cluster_weight = float(os.getenv('RANK_CLUSTER_WEIGHT', '0.3'))  # Вклад размера кластера (степень)
+        self.cluster_scan_limit = int(os.getenv('RANK_CLUSTER_SCAN', '500'))  # Максимум заголовков для сравнения
+        self.domain_weights = dict(DEFAULT_DOMAIN_WEIGHTS)
+        self.domain_weights.update(parse_domain_weights(os.getenv('RANK_DOMAIN_WEIGHTS', '')))
+        # Все ключевые слова ищутся одним регулярным выражением
+        alternatives = sorted({k.lower() for k in keywords}, key=len, reverse=True)
+        self.keyword_re = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in alternatives) + r")\b")
+
+    def keyword_strength(self, title, content):
+        """Сила совпадения с ключевыми словами: совпадения в заголовке весят вдвое больше"""
+        title_hits = set(self.keyword_re.findall((title or "").lower()))
+        content_hits = set(self.keyword_re.findall((content or "").lower()))
+        return 1.0 + math.log1p(2 * len(title_hits) + len(content_hits - title_hits))
+
+    def domain_weight(self, url):
+        """Вес источника по домену ссылки (поддомены наследуют вес домена)"""
+        host = (urlparse(url or "").hostname or "").lower()
+        if host.startswith("www."):
+            host = host[4:]
+        while host:
+            if host in self.domain_weights:
+                return self.domain_weights[host]
+            _, _, host = host.partition('.')
+        return 1.0
+
+    def base_score(self, title, content, url, published_date):
+        """Оценка новости без учета кластера: ln(статический вес) + свежесть"""
+        static = self.keyword_strength(title, content) * self.domain_weight(url)
+        return math.log(static) + published_date.timestamp() / self.decay_seconds
+
+    def _find_cluster(self, cursor, news_id, title, published_date):
+        """Ключ кластера самой похожей недавней новости или новый ключ"""
+        words = title_words(title)
+        if not words:
+            return str(news_id)
+        # Сравниваются только ближайшие по дате заголовки окна (индекс idx_news_published_date)
+        cursor.execute("""
+            SELECT id, title, cluster_key FROM news
+            WHERE id <> %s AND published_date BETWEEN %s AND %s
+            ORDER BY published_date DESC
+            LIMIT %s
+        """, (news_id, published_date - self.cluster_window, published_date + self.cluster_window,
+              self.cluster_scan_limit))
+        best_key, best_similarity = None, self.cluster_similarity
+        for other_id, other_title, cluster_key in cursor.fetchall():
+            other = title_words(other_title)
+            if not other:
+                continue
+            similarity = len(words & other) / len(words | other)
+            if similarity >= best_similarity:
+                best_key, best_similarity = cluster_key or str(other_id), similarity
+        return best_key or str(news_id)
+
+    def rank(self, news_id, title, content, url, published_date, db=None):
+        """Расчет оценки сохраненной новости и обновление оценок ее кластера"""
+        db = db or self.db
+        if not isinstance(published_date, datetime):
+            published_date = datetime.now()
+        base = self.base_score(title, content, url, published_date)
+        try:
+            if not db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return None
+
+            with db.conn.cursor() as cursor:
+                cluster_key = self._find_cluster(cursor, news_id, title, published_date)
+                cursor.execute("""
+                    UPDATE news SET cluster_key = %s WHERE id = %s
+                """, (cluster_key, news_id))
+                cursor.execute("SELECT COUNT(*) FROM news WHERE cluster_key = %s", (cluster_key,))
+                size = cursor.fetchone()[0]
+
+                score = base + self.cluster_weight * math.log(size)
+                cursor.execute("UPDATE news SET rank_score = %s WHERE id = %s", (score, news_id))
+                if size > 1:
+                    # Рост кластера поднимает еще не опубликованные новости той же истории
+                    cursor.execute("""
+                        UPDATE news SET rank_score = rank_score + %s
+                        WHERE cluster_key = %s AND id <> %s AND published = FALSE AND rank_score IS NOT NULL
+                    """, (self.cluster_weight * math.log(size / (size - 1)), cluster_key, news_id))
+                db.conn.commit()
+
+            logger.info(f"Оценка новости {news_id}: {score:.3f} (кластер {cluster_key}, размер {size})")
+            return score
+        except Exception as e:
+            db.conn.rollback()
+            logger.error(f"Ошибка при расчете оценки новости {news_id}: {e}")
+            return None
+
+    def rank_unscored(self, limit=100):
+        """Расчет оценок неопубликованных новостей без rank_score (сохраненных до появления ранжирования)"""
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return 0
+
+            with self.db.conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT id, title, content, url, published_date FROM news
+                    WHERE rank_score IS NULL AND published = FALSE
+                    ORDER BY published_date DESC
+                    LIMIT %s
+                """, (limit,))
+                rows = cursor.fetchall()
+                self.db.conn.commit()
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при получении новостей без оценки: {e}")
+            return 0
+
+        scored = sum(1 for row in rows if self.rank(*row) is not None)
+        if rows:
+            logger.info(f"Рассчитаны оценки {scored} из {len(rows)} новостей без rank_score")
+        return scored
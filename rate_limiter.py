@@ -0,0 +1,90 @@
+import time
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Асинхронный ограничитель частоты запросов со скользящим окном"""
+
+    def __init__(self, max_requests, period=60.0):
+        self.max_requests = max(1, int(max_requests))
+        self.period = float(period)
+        self._timestamps = deque()  # Время отправки последних запросов (monotonic)
+        self._lock = None
+        self._loop = None
+
+    def _get_lock(self):
+        """Получение блокировки для текущего event loop"""
+        loop = asyncio.get_running_loop()
+        # Планировщик создает новый event loop на каждый запуск задачи,
+        # поэтому блокировку пересоздаем, сохраняя историю запросов
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    async def acquire(self):
+        """Ожидание свободного места в окне и резервирование запроса"""
+        async with self._get_lock():
+            while True:
+                now = time.monotonic()
+                while self._timestamps and now - self._timestamps[0] >= self.period:
+                    self._timestamps.popleft()
+
+                if len(self._timestamps) < self.max_requests:
+                    self._timestamps.append(now)
+                    return
+
+                wait_time = self.period - (now - self._timestamps[0])
+                logger.debug(f"Достигнут лимит {self.max_requests} запросов за {self.period} с, ожидание {wait_time:.2f} с")
+                await asyncio.sleep(wait_time)
+
+class TokenBucket:
+    """Асинхронное ведро токенов: средняя скорость rate в секунду с допустимым всплеском capacity"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = float(rate)
+        self.capacity = max(1.0, float(capacity))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0  # Время, до которого отправка запрещена (retry_after)
+        self._lock = None
+        self._loop = None
+
+    def _get_lock(self):
+        """Получение блокировки для текущего event loop"""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    def _refill(self, now):
+        """Пополнение запаса токенов за прошедшее время"""
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def block_for(self, seconds):
+        """Запрет выдачи токенов на заданное время; после него доступен ровно один токен"""
+        now = time.monotonic()
+        self._blocked_until = max(self._blocked_until, now + seconds)
+        self._tokens = 1.0
+        self._updated = max(self._updated, self._blocked_until)
+
+    async def acquire(self):
+        """Ожидание и получение одного токена (ожидающие обслуживаются по очереди)"""
+        async with self._get_lock():
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
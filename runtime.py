@@ -0,0 +1,138 @@
+from startup import StartupTimer
+import os
+import signal
+import socket
+import asyncio
+import logging
+import aiohttp
+from telegram_governor import create_bot
+from dotenv import load_dotenv
+from database import Database
+from telegram_publisher import TelegramPublisher
+from scheduler import Scheduler
+from job_queue import AIWorker
+from bot import create_dispatcher
+from logging_config import setup_logging
+from metrics import start_metrics_server
+
+# Загрузка переменных окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+class Runtime:
+    """Бот, планировщик и воркеры AI-обработки в одном процессе: общие соединение с БД, бот и HTTP-сессия"""
+
+    def __init__(self):
+        self.ai_workers = int(os.getenv('RUNTIME_AI_WORKERS', '1'))  # Воркеров AI-обработки в процессе
+        self.restart_delay = int(os.getenv('RUNTIME_RESTART_DELAY', '5'))  # Пауза перед перезапуском упавшего компонента (сек)
+        self.shutdown_timeout = int(os.getenv('RUNTIME_SHUTDOWN_TIMEOUT', '30'))  # Ожидание завершения компонентов (сек)
+        self.stop_event = None
+        self.timer = StartupTimer()
+
+    async def _wait_stop(self, timeout):
+        """Ожидание остановки не дольше timeout секунд; True, если остановка запрошена"""
+        try:
+            await asyncio.wait_for(self.stop_event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.stop_event.is_set()
+
+    async def _supervise(self, name, factory):
+        """Выполнение компонента с перезапуском после сбоя, пока не запрошена остановка"""
+        while not self.stop_event.is_set():
+            try:
+                await factory()
+                if self.stop_event.is_set():
+                    break
+                logger.warning(f"Компонент {name} неожиданно завершился, перезапуск через {self.restart_delay} с")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Сбой компонента {name}: {e}. Перезапуск через {self.restart_delay} с")
+            if await self._wait_stop(self.restart_delay):
+                break
+        logger.info(f"Компонент {name} остановлен")
+
+    def _install_signal_handlers(self):
+        """Остановка по SIGINT/SIGTERM через stop_event"""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop_event.set)
+            except NotImplementedError:
+                # Windows: остановка по KeyboardInterrupt
+                pass
+
+    async def run(self):
+        """Запуск всех компонентов и согласованная остановка"""
+        self.timer.mark("импорт модулей")
+        self.stop_event = asyncio.Event()
+        self._install_signal_handlers()
+
+        db = Database()
+        self.timer.mark("база данных")
+        bot = create_bot(os.getenv('TELEGRAM_BOT_TOKEN'))
+        http_session = aiohttp.ClientSession()
+        publisher = TelegramPublisher(db, bot)
+        scheduler = Scheduler(db, publisher, http_session)
+        dp, admin_panel = create_dispatcher(bot, db, scheduler.news_api, scheduler.ai_worker, http_session)
+        self.timer.mark("компоненты")
+
+        tasks = []
+        try:
+            # Отправка тестового сообщения при запуске
+            await publisher.publish_test_message()
+            self.timer.mark("тестовое сообщение")
+
+            tasks.append(asyncio.create_task(self._supervise(
+                "bot", lambda: dp.start_polling(bot, handle_signals=False, close_bot_session=False)
+            )))
+            tasks.append(asyncio.create_task(self._supervise(
+                "scheduler", lambda: scheduler.run_async(self.stop_event)
+            )))
+            base_id = f"{socket.gethostname()}:{os.getpid()}"
+            for i in range(self.ai_workers):
+                worker = AIWorker(db, scheduler.ai_processor, f"{base_id}:{i}")
+                tasks.append(asyncio.create_task(self._supervise(
+                    f"ai_worker_{i}", lambda worker=worker: worker.run(stop_event=self.stop_event)
+                )))
+            logger.info(f"Приложение запущено: бот, планировщик и {self.ai_workers} воркер(ов) AI-обработки")
+            self.timer.report()
+
+            await self.stop_event.wait()
+            logger.info("Получен сигнал остановки, завершение компонентов")
+        finally:
+            self.stop_event.set()
+            try:
+                await dp.stop_polling()
+            except RuntimeError:
+                # Polling не был запущен
+                pass
+            if tasks:
+                _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+                for task in pending:
+                    logger.warning("Компонент не завершился вовремя и будет прерван")
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+            # Ресурсы закрываются после остановки всех компонентов, которые ими пользуются
+            await admin_panel.close()
+            await scheduler.news_api.scraper.close()
+            await http_session.close()
+            await bot.session.close()
+            scheduler.close()
+            db.close()
+            logger.info("Приложение завершило работу")
+
+def main():
+    """Точка входа: бот, планировщик и AI-обработка в одном event loop"""
+    setup_logging("runtime")
+    start_metrics_server()
+    try:
+        asyncio.run(Runtime().run())
+    except KeyboardInterrupt:
+        logger.info("Приложение остановлено пользователем")
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,34 @@
+import os
 import time
 import logging
 import schedule
 import asyncio
 import pytz
-import psycopg2.extras
 from datetime import datetime, timedelta
-from database import Database
+from database import Database, DatabaseThread
 from news_api import NewsAPI
 from ai_processor import AIProcessor
 from telegram_publisher import TelegramPublisher
+from job_queue import AIWorker
+from pipeline import NewsPipeline
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("scheduler.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 class Scheduler:
-    def __init__(self):
-        self.db = Database()
+    def __init__(self, db=None, publisher=None, http_session=None):
+        # Компоненты могут быть общими с ботом при запуске в одном процессе (runtime.py)
+        self.db = db or Database()
         self.news_api = NewsAPI(self.db)
         self.ai_processor = AIProcessor(self.db)
-        self.publisher = TelegramPublisher(self.db)
+        self.ai_worker = AIWorker(self.db, self.ai_processor)
+        self.pipeline = NewsPipeline(self.db, self.news_api, self.ai_worker, http_session)
+        # Ежедневный сбор идет своим экземпляром конвейера: его счетчики не смешиваются с часовым сбором
+        self.daily_pipeline = NewsPipeline(self.db, self.news_api, self.ai_worker, http_session)
+        self.publisher = publisher or TelegramPublisher(self.db)
+        self.stats_thread = DatabaseThread("stats")  # REFRESH сводной статистики не занимает общий event loop
+        self.loop = None  # Общий event loop при асинхронном запуске (run_async)
+        self.sync_loop = None  # Собственный event loop синхронного режима: один на процесс, сессии переиспользуются
+        self.running_jobs = {}  # Имя задачи -> выполняющаяся asyncio-задача
         
         # Настройка расписания
         self.setup_schedule()
@@ -43,7 +45,7 @@ class Scheduler:
             tz = pytz.UTC
         
         # Сбор новостей каждый день в 6:00
-        schedule.every().day.at("06:00").do(self.collect_news)
+        schedule.every().day.at("06:00").do(self.collect_news_job)
         
         # Обработка новостей каждый день в 7:00
         schedule.every().day.at("07:00").do(self.process_news)
@@ -73,48 +75,81 @@ class Scheduler:
         schedule.every(1).hour.do(self.collect_hourly_news_wrapper)
         logger.info("Настроен часовой сбор новостей")
         
+        # Обновление сводной статистики для админ-панели
+        stats_minutes = int(os.getenv('STATS_REFRESH_MINUTES', '5'))
+        schedule.every(stats_minutes).minutes.do(self.refresh_news_stats_job)
+        logger.info(f"Настроено обновление статистики каждые {stats_minutes} минут")
+        
+        # Метрики глубины очереди публикаций для эндпоинта /metrics
+        schedule.every(1).minutes.do(self.update_queue_metrics_job)
+        
         logger.info("Расписание задач настроено")
     
-    def collect_news(self):
-        """Задача сбора новостей"""
+    def _run_async(self, name, coro_func):
+        """Запуск асинхронной задачи: в общем event loop или в собственном loop синхронного режима"""
+        if self.loop is not None:
+            running = self.running_jobs.get(name)
+            if running is not None and not running.done():
+                logger.warning(f"Задача {name} еще выполняется, очередной запуск пропущен")
+                return None
+            self.running_jobs[name] = self.loop.create_task(coro_func())
+            return self.running_jobs[name]
+        
+        return self.run_until_complete(coro_func())
+    
+    def run_until_complete(self, coro):
+        """Выполнение корутины в event loop синхронного режима (создается один раз и живет до остановки)"""
+        if self.sync_loop is None or self.sync_loop.is_closed():
+            self.sync_loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.sync_loop)
+        return self.sync_loop.run_until_complete(coro)
+    
+    def refresh_news_stats_job(self):
+        """Обновление сводной статистики (в общем event loop - на отдельном соединении в своем потоке)"""
+        if self.loop is None:
+            return self.db.refresh_news_stats()
+        return self._run_async("refresh_news_stats", lambda: self.stats_thread.run(Database.refresh_news_stats))
+    
+    def update_queue_metrics_job(self):
+        """Обновление метрик очереди публикаций (в общем event loop - на отдельном соединении в своем потоке)"""
+        if self.loop is None:
+            return self.db.update_queue_metrics()
+        return self._run_async("queue_metrics", lambda: self.stats_thread.run(Database.update_queue_metrics))
+    
+    def collect_news_job(self):
+        """Обертка для запуска асинхронной задачи ежедневного сбора новостей"""
+        try:
+            return self._run_async("collect_news", self.collect_news_async)
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении задачи сбора новостей: {e}")
+            return 0
+    
+    async def collect_news_async(self):
+        """Задача ежедневного сбора новостей по всем категориям и ключевым словам"""
         try:
             logger.info("Запуск задачи сбора новостей")
-            saved_count = self.news_api.collect_daily_news()
+            # Конвейер работает в event loop и пользуется общими соединением и сессией, а не отдельным потоком
+            saved_count = await self.daily_pipeline.run(
+                keywords=self.news_api.keywords, categories=self.news_api.categories, max_results=10
+            )
             logger.info(f"Задача сбора новостей завершена, сохранено {saved_count} новостей")
             return saved_count
         except Exception as e:
             logger.error(f"Ошибка при выполнении задачи сбора новостей: {e}")
             return 0
     
-    def process_news(self):
-        """Задача обработки новостей"""
+    async def process_news_async(self):
+        """Асинхронная задача обработки новостей"""
         try:
             logger.info("Запуск задачи обработки новостей")
             
-            # Получение необработанных новостей из базы данных
-            with self.db.conn.cursor() as cursor:
-                cursor.execute("""
-                    SELECT id, title, content, url, category
-                    FROM news
-                    WHERE processed = FALSE
-                    ORDER BY published_date DESC
-                    LIMIT 10
-                """)
-                news_items = [{
-                    'id': row[0],
-                    'title': row[1],
-                    'content': row[2],
-                    'url': row[3],
-                    'category': row[4]
-                } for row in cursor.fetchall()]
+            # Захват задач из очереди AI-обработки и их параллельная обработка
+            results = await self.ai_worker.run_once(limit=5)
             
-            if not news_items:
+            if not results:
                 logger.info("Нет новостей для обработки")
                 return 0
             
-            # Обработка новостей через AI
-            results = self.ai_processor.process_batch(news_items, batch_size=5)
-            
             # Подсчет успешно обработанных новостей
             success_count = sum(1 for result in results if result.get("success", False))
             
@@ -125,6 +160,14 @@ class Scheduler:
             logger.error(f"Ошибка при выполнении задачи обработки новостей: {e}")
             return 0
     
+    def process_news(self):
+        """Обертка для запуска асинхронной задачи обработки новостей"""
+        try:
+            return self._run_async("process_news", self.process_news_async)
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении задачи обработки новостей: {e}")
+            return 0
+    
     async def publish_news_async(self):
         """Асинхронная задача публикации новостей с учетом московского времени"""
         try:
@@ -150,12 +193,7 @@ class Scheduler:
     def publish_news(self):
         """Обертка для запуска асинхронной задачи публикации"""
         try:
-            # Создаем новый event loop для каждого вызова
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(self.publish_news_async())
-            loop.close()
-            return result
+            return self._run_async("publish_news", self.publish_news_async)
         except Exception as e:
             logger.error(f"Ошибка при выполнении задачи публикации новостей: {e}")
             return 0
@@ -175,65 +213,13 @@ class Scheduler:
             now = datetime.now(tz)
             logger.info(f"Проверка запланированных постов (текущее время {timezone_name}: {now.strftime('%Y-%m-%d %H:%M:%S')})")
             
-            # Получение запланированных постов, время публикации которых уже наступило
-            with self.db.conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
-                cursor.execute("""
-                    SELECT n.id, n.title, n.content, n.url, n.published_date, n.category,
-                           p.processed_title, p.processed_content, 
-                           s.id as schedule_id, s.scheduled_date, s.status, s.attempts
-                    FROM news n
-                    JOIN processed_news p ON n.id = p.news_id
-                    JOIN scheduled_posts s ON n.id = s.news_id
-                    WHERE n.processed = TRUE AND n.published = FALSE
-                      AND s.status = 'pending'
-                      AND s.scheduled_date <= %s
-                    ORDER BY s.scheduled_date ASC
-                    LIMIT 5
-                """, (now,))
-                scheduled_posts = cursor.fetchall()
-            
-            if not scheduled_posts:
+            # Захват наступивших постов вместе с постановкой доставок (одна транзакция) и отправка outbox.
+            # Доставки, прерванные перезапуском, и отложенные по расписанию каналов отправляются здесь же
+            published_count = await self.publisher.publish_due_posts(limit=5)
+            if published_count:
+                logger.info(f"Отправлено {published_count} сообщений с запланированными постами")
+            else:
                 logger.debug("Нет запланированных постов для публикации в данный момент")
-                return 0
-            
-            logger.info(f"Найдено {len(scheduled_posts)} запланированных постов для публикации")
-            
-            # Публикация найденных постов
-            published_count = 0
-            for post in scheduled_posts:
-                logger.info(f"Публикация запланированного поста #{post['id']} (запланирован на {post['scheduled_date']})")
-                
-                # Обновление статуса поста на 'publishing'
-                self.db.update_post_status(post['schedule_id'], 'publishing')
-                
-                try:
-                    # Правильный вызов асинхронной функции с await
-                    success = await self.publisher.publish_news(post)
-                    
-                    if success:
-                        # Отметка поста как опубликованного
-                        self.db.mark_as_published(post['id'])
-                        # Обновление статуса в таблице scheduled_posts
-                        self.db.update_post_status(post['schedule_id'], 'published', increment_attempts=False)
-                        published_count += 1
-                        # Логируем успешную публикацию только при успехе
-                        logger.info(f"Пост #{post['id']} успешно опубликован")
-                    else:
-                        # Если публикация не удалась, обновляем статус
-                        if post['attempts'] >= 3:
-                            self.db.update_post_status(post['schedule_id'], 'failed')
-                            logger.error(f"Пост #{post['id']} не удалось опубликовать после {post['attempts']+1} попыток")
-                        else:
-                            self.db.update_post_status(post['schedule_id'], 'pending')
-                            logger.warning(f"Не удалось опубликовать пост #{post['id']}, попытка {post['attempts']+1}")
-                except Exception as e:
-                    logger.error(f"Ошибка при публикации поста #{post['id']}: {e}")
-                    # Обновление статуса и увеличение счетчика попыток
-                    self.db.update_post_status(post['schedule_id'], 'error', increment_attempts=True)
-                
-                # Пауза между публикациями
-                await asyncio.sleep(1)
-            
             return published_count
             
         except Exception as e:
@@ -243,31 +229,31 @@ class Scheduler:
     def check_scheduled_posts_wrapper(self):
         """Обертка для запуска асинхронной задачи проверки запланированных постов"""
         try:
-            # Создаем новый event loop для каждого вызова
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(self.check_scheduled_posts())
-            loop.close()
-            return result
+            return self._run_async("check_scheduled_posts", self.check_scheduled_posts)
         except Exception as e:
             logger.error(f"Ошибка при проверке запланированных постов: {e}")
             return 0
     
-    def collect_hourly_news_wrapper(self):
-        """Обертка для запуска асинхронной задачи часового сбора новостей"""
+    async def collect_hourly_news_async(self):
+        """Асинхронная задача часового сбора новостей"""
         try:
             logger.info("Запуск задачи часового сбора новостей")
-            # Создаем новый event loop для каждого вызова
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(self.news_api.collect_hourly_news())
-            loop.close()
+            # Каждая статья проходит путь от получения до планирования, не дожидаясь остальных
+            result = await self.pipeline.run()
             logger.info(f"Задача часового сбора новостей завершена, сохранено {result} новостей")
             return result
         except Exception as e:
             logger.error(f"Ошибка при выполнении задачи часового сбора новостей: {e}")
             return 0
     
+    def collect_hourly_news_wrapper(self):
+        """Обертка для запуска асинхронной задачи часового сбора новостей"""
+        try:
+            return self._run_async("collect_hourly_news", self.collect_hourly_news_async)
+        except Exception as e:
+            logger.error(f"Ошибка при выполнении задачи часового сбора новостей: {e}")
+            return 0
+    
     def run(self):
         """Запуск планировщика задач"""
         logger.info("Запуск планировщика задач")
@@ -286,6 +272,38 @@ class Scheduler:
             logger.error(f"Ошибка в работе планировщика задач: {e}")
         finally:
             # Закрытие соединений
+            self.close()
             self.db.close()
-            asyncio.run(self.publisher.close())
-            logger.info("Планировщик задач завершил работу")
\ No newline at end of file
+            # Сессия Telegram закрывается в том же loop, в котором она работала
+            self.run_until_complete(self.publisher.close())
+            self.sync_loop.close()
+            logger.info("Планировщик задач завершил работу")
+    
+    def close(self):
+        """Закрытие собственных соединений планировщика (общее соединение закрывает его владелец)"""
+        self.ai_processor.close()
+        self.stats_thread.close()
+    
+    async def run_async(self, stop_event):
+        """Запуск планировщика в общем event loop до установки stop_event (задачи выполняются как asyncio-задачи)"""
+        logger.info("Запуск планировщика задач в общем event loop")
+        self.loop = asyncio.get_running_loop()
+        try:
+            # Проверяем запланированные посты при запуске
+            self.check_scheduled_posts_wrapper()
+            
+            while not stop_event.is_set():
+                schedule.run_pending()
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=1)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            # Выполняющиеся задачи завершаются вместе с планировщиком
+            jobs = [job for job in self.running_jobs.values() if not job.done()]
+            for job in jobs:
+                job.cancel()
+            await asyncio.gather(*jobs, return_exceptions=True)
+            self.running_jobs = {}
+            self.loop = None
+            logger.info("Планировщик задач остановлен")
@@ -0,0 +1,232 @@
+import os
+import time
+import pytz
+import logging
+from datetime import datetime, timedelta
+from psycopg2.extras import execute_values
+from message_renderer import MessageRenderer
+import tracing
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PUBLISH_TIMES = ["09:00", "12:00", "18:00"]
+ALLOCATOR_LOCK_ID = 770037  # Ключ advisory-блокировки: распределение слотов выполняется по одному
+
+class SlotCapacityError(Exception):
+    """В периоде меньше свободных слотов, чем постов для распределения"""
+
+    def __init__(self, available, needed):
+        super().__init__(f"Свободных слотов {available}, а постов {needed}")
+        self.available = available
+        self.needed = needed
+
+class SlotAllocator:
+    """Распределение постов по свободным слотам публикации из настроек расписания"""
+
+    def __init__(self, db):
+        self.db = db
+        self.renderer = MessageRenderer(db)
+        self.horizon_days = int(os.getenv('SCHEDULE_HORIZON_DAYS', '7'))  # На сколько дней вперед планировать
+        self.posts_per_slot = int(os.getenv('SCHEDULE_POSTS_PER_SLOT', '1'))  # Постов в одном слоте
+        self.min_lead = timedelta(minutes=int(os.getenv('SCHEDULE_MIN_LEAD_MINUTES', '10')))  # Минимальный запас до слота
+        self.slot_tolerance = timedelta(minutes=30)  # Пост в пределах этого интервала занимает слот
+
+    def _load_state(self, cursor):
+        """Часовой пояс, времена публикации и занятые слоты - одним запросом"""
+        cursor.execute("""
+            SELECT name, value, NULL::timestamp AS scheduled_date
+            FROM schedule_settings
+            WHERE name = 'timezone' OR name LIKE 'publish_time_%'
+            UNION ALL
+            SELECT NULL, NULL, scheduled_date
+            FROM scheduled_posts
+            WHERE status IN ('pending', 'publishing')
+              AND scheduled_date >= CURRENT_DATE - INTERVAL '1 day'
+        """)
+        settings = {}
+        occupied = []
+        for name, value, scheduled_date in cursor.fetchall():
+            if name is not None:
+                settings[name] = value
+            else:
+                occupied.append(scheduled_date)
+        return settings, occupied
+
+    @staticmethod
+    def _parse_times(settings):
+        """Времена публикации из настроек publish_time_N в порядке возрастания"""
+        times = []
+        for name in sorted(n for n in settings if n.startswith('publish_time_')):
+            try:
+                hour, minute = map(int, settings[name].split(':'))
+                times.append((hour, minute))
+            except ValueError:
+                logger.warning(f"Некорректное значение настройки {name}: {settings[name]}")
+        if not times:
+            logger.warning("Не найдены настройки времени публикации, используются значения по умолчанию")
+            times = [tuple(map(int, t.split(':'))) for t in DEFAULT_PUBLISH_TIMES]
+        return sorted(set(times))
+
+    def _free_slots(self, settings, occupied, now, last_day=None):
+        """Свободные слоты до last_day включительно или в пределах горизонта планирования (с учетом вместимости слота)"""
+        times = self._parse_times(settings)
+        occupied = sorted(occupied)
+        slots = []
+        days = self.horizon_days if last_day is None else (last_day - now.date()).days
+        for day in range(days + 1):
+            date = (now + timedelta(days=day)).date()
+            for hour, minute in times:
+                slot = datetime(date.year, date.month, date.day, hour, minute)
+                if slot < now + self.min_lead:
+                    continue
+                taken = sum(1 for s in occupied if abs(s - slot) <= self.slot_tolerance)
+                slots.extend([slot] * max(self.posts_per_slot - taken, 0))
+        return slots
+
+    def _local_now(self, settings):
+        """Текущее время в часовом поясе из настроек"""
+        timezone_name = settings.get('timezone') or 'Europe/Moscow'
+        try:
+            tz = pytz.timezone(timezone_name)
+        except pytz.exceptions.UnknownTimeZoneError:
+            logger.error(f"Неизвестный часовой пояс: {timezone_name}, используется UTC")
+            tz = pytz.UTC
+        return datetime.now(tz).replace(tzinfo=None)
+
+    def allocate(self, news_ids):
+        """Назначение слотов новостям (в порядке приоритета) одной пакетной вставкой, возвращает [(id, время)]"""
+        if not news_ids:
+            return []
+        started = time.time()
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return []
+
+            with self.db.conn.cursor() as cursor:
+                # Параллельный запуск (планировщик и админ-панель) не должен занять один слот дважды
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (ALLOCATOR_LOCK_ID,))
+                settings, occupied = self._load_state(cursor)
+                slots = self._free_slots(settings, occupied, self._local_now(settings))
+                if len(slots) < len(news_ids):
+                    logger.warning(f"Свободных слотов на {self.horizon_days} дн. меньше, чем постов: "
+                                   f"{len(slots)} из {len(news_ids)}")
+
+                assignments = list(zip(news_ids, slots))
+                if not assignments:
+                    # Завершение транзакции снимает advisory-блокировку для других процессов
+                    self.db.conn.rollback()
+                    return []
+
+                scheduled = execute_values(cursor, """
+                    INSERT INTO scheduled_posts (news_id, scheduled_date, status)
+                    VALUES %s
+                    ON CONFLICT (news_id) DO NOTHING
+                    RETURNING news_id, scheduled_date
+                """, assignments, template="(%s, %s, 'pending')", fetch=True)
+                self.db.conn.commit()
+
+            # Сообщения готовятся сейчас, чтобы в момент публикации осталась только отправка
+            self.renderer.prerender([news_id for news_id, _ in scheduled])
+            self._trace_scheduled(scheduled, started)
+            logger.info(f"Запланировано {len(scheduled)} постов")
+            return sorted(scheduled, key=lambda row: row[1])
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при распределении постов по слотам: {e}")
+            return []
+
+    def _trace_scheduled(self, scheduled, started):
+        """Этап планирования в трассировке каждой запланированной новости"""
+        tracer = tracing.get_tracer()
+        if not tracer.enabled or not scheduled:
+            return
+        trace_ids = self.db.get_trace_ids([news_id for news_id, _ in scheduled])
+        finished = time.time()
+        for news_id, scheduled_date in scheduled:
+            if trace_ids.get(news_id):
+                tracer.record("publish.schedule", trace_ids[news_id], started, finished,
+                              news_id=news_id, scheduled_date=scheduled_date.isoformat(), batch_size=len(scheduled))
+
+    def schedule_pending(self, limit=10):
+        """Планирование обработанных, но еще не запланированных новостей в порядке оценки приоритета"""
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return []
+
+            with self.db.conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT n.id
+                    FROM news n
+                    LEFT JOIN scheduled_posts sp ON n.id = sp.news_id
+                    WHERE n.processed = TRUE AND n.published = FALSE AND sp.id IS NULL
+                    ORDER BY n.rank_score DESC NULLS LAST, n.published_date DESC
+                    LIMIT %s
+                """, (limit,))
+                news_ids = [row[0] for row in cursor.fetchall()]
+        except Exception as e:
+            logger.error(f"Ошибка при получении новостей для планирования: {e}")
+            return []
+
+        if not news_ids:
+            logger.info("Нет новых обработанных новостей для планирования")
+            return []
+        return self.allocate(news_ids)
+
+    def respread(self, start_date, end_date):
+        """Перераспределение ожидающих постов за период по слотам этого же периода (в порядке оценки приоритета).
+
+        Поднимает SlotCapacityError, если все посты периода в нем не помещаются; расписание при этом не меняется.
+        """
+        try:
+            if not self.db.ensure_connection():
+                logger.error("Не удалось установить соединение с базой данных")
+                return None
+
+            with self.db.conn.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", (ALLOCATOR_LOCK_ID,))
+                settings, occupied = self._load_state(cursor)
+                cursor.execute("""
+                    SELECT s.news_id, s.scheduled_date
+                    FROM scheduled_posts s
+                    JOIN news n ON n.id = s.news_id
+                    WHERE s.status = 'pending'
+                      AND s.scheduled_date >= %s AND s.scheduled_date < %s
+                    ORDER BY n.rank_score DESC NULLS LAST, s.scheduled_date ASC
+                """, (start_date, end_date + timedelta(days=1)))
+                posts = cursor.fetchall()
+                if not posts:
+                    self.db.conn.rollback()
+                    return []
+
+                # Слоты самих перераспределяемых постов считаются свободными
+                for _, scheduled_date in posts:
+                    if scheduled_date in occupied:
+                        occupied.remove(scheduled_date)
+                start = max(self._local_now(settings), datetime.combine(start_date, datetime.min.time()))
+                slots = self._free_slots(settings, occupied, start, last_day=end_date)
+                if len(slots) < len(posts):
+                    # Частичное перераспределение оставило бы посты вне новой сетки слотов
+                    self.db.conn.rollback()
+                    logger.warning(f"Свободных слотов в периоде {start_date} - {end_date} меньше, чем постов: "
+                                   f"{len(slots)} из {len(posts)}, перераспределение отменено")
+                    raise SlotCapacityError(len(slots), len(posts))
+
+                assignments = [(news_id, slot) for (news_id, _), slot in zip(posts, slots)]
+                execute_values(cursor, """
+                    UPDATE scheduled_posts s
+                    SET scheduled_date = v.slot
+                    FROM (VALUES %s) AS v(news_id, slot)
+                    WHERE s.news_id = v.news_id
+                """, assignments, template="(%s, %s::timestamp)")
+                self.db.conn.commit()
+
+            logger.info(f"Перераспределено {len(assignments)} постов за период {start_date} - {end_date}")
+            return sorted(assignments, key=lambda row: row[1])
+        except SlotCapacityError:
+            raise
+        except Exception as e:
+            self.db.conn.rollback()
+            logger.error(f"Ошибка при перераспределении постов: {e}")
+            return None
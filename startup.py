@@ -0,0 +1,30 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Момент импорта модуля: точка входа импортирует его первым, до тяжелых зависимостей
+PROCESS_STARTED = time.perf_counter()
+
+class StartupTimer:
+    """Замер этапов холодного старта: импорт модулей, подключение к БД, создание компонентов"""
+
+    def __init__(self, started=PROCESS_STARTED):
+        self.started = started
+        self.last = started
+        self.phases = []  # (этап, длительность в секундах)
+
+    def mark(self, phase):
+        """Завершение этапа: длительность считается от предыдущей отметки"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+
+    @property
+    def total(self):
+        return self.last - self.started
+
+    def report(self):
+        """Запись в лог длительности всех этапов старта"""
+        details = ", ".join(f"{phase} {duration * 1000:.0f} мс" for phase, duration in self.phases)
+        logger.info(f"Старт за {self.total:.2f} с: {details}")
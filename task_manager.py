@@ -0,0 +1,122 @@
+import os
+import time
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class BackgroundJob:
+    """Длительная операция, выполняемая в фоне: состояние, результат и отчеты о ходе выполнения"""
+
+    def __init__(self, job_id, kind, on_progress=None, progress_interval=3.0):
+        self.id = job_id
+        self.kind = kind
+        self.status = 'running'  # running, done, failed, cancelled
+        self.result = None
+        self.error = None
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self.task = None
+        self.progress_text = None  # Последний отправленный отчет о ходе выполнения
+        self._on_progress = on_progress
+        self._progress_interval = progress_interval
+        self._last_report = 0.0
+
+    @property
+    def done(self):
+        return self.status != 'running'
+
+    @property
+    def elapsed(self):
+        """Время выполнения в секундах"""
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    async def report(self, text, force=False):
+        """Отчет о ходе выполнения; отправляется не чаще одного раза в progress_interval секунд"""
+        if text == self.progress_text:
+            return
+        now = time.monotonic()
+        if self._on_progress is None or (not force and now - self._last_report < self._progress_interval):
+            # Пропущенный отчет не запоминается: тот же текст позже должен быть показан
+            return
+        self.progress_text = text
+        self._last_report = now
+        try:
+            await self._on_progress(self, text)
+        except Exception as e:
+            # Ошибка отображения прогресса не должна прерывать саму операцию
+            logger.warning(f"Не удалось обновить прогресс задачи #{self.id}: {e}")
+
+class BackgroundTaskManager:
+    """Запуск длительных операций в фоне: не более одной задачи каждого вида, отмена по ID"""
+
+    def __init__(self):
+        self.progress_interval = float(os.getenv('TASK_PROGRESS_INTERVAL', '3'))  # Минимальная пауза между отчетами (сек)
+        self.max_history = 50  # Сколько завершенных задач хранить для просмотра
+        self.jobs = OrderedDict()
+        self._running = {}  # вид задачи -> выполняющаяся задача
+        self._ids = itertools.count(1)
+
+    def running(self, kind):
+        """Выполняющаяся задача указанного вида или None"""
+        return self._running.get(kind)
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def start(self, kind, func, on_progress=None, on_done=None):
+        """Запуск func(job) в фоне; None, если задача этого вида уже выполняется"""
+        if kind in self._running:
+            return None
+        job = BackgroundJob(next(self._ids), kind, on_progress, self.progress_interval)
+        self.jobs[job.id] = job
+        self._running[kind] = job
+        while len(self.jobs) > self.max_history:
+            oldest = next(iter(self.jobs))
+            if not self.jobs[oldest].done:
+                break
+            del self.jobs[oldest]
+        job.task = asyncio.create_task(self._run(job, func, on_done))
+        logger.info(f"Запущена фоновая задача #{job.id} ({kind})")
+        return job
+
+    async def _run(self, job, func, on_done):
+        """Выполнение задачи с фиксацией итогового состояния"""
+        try:
+            job.result = await func(job)
+            job.status = 'done'
+        except asyncio.CancelledError:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = e
+            logger.error(f"Ошибка в фоновой задаче #{job.id} ({job.kind}): {e}")
+        finally:
+            job.finished_at = time.monotonic()
+            self._running.pop(job.kind, None)
+            logger.info(f"Фоновая задача #{job.id} ({job.kind}) завершена со статусом {job.status} "
+                        f"за {job.elapsed:.1f} с")
+
+        if on_done is not None:
+            try:
+                await on_done(job)
+            except Exception as e:
+                logger.error(f"Ошибка при завершении фоновой задачи #{job.id}: {e}")
+
+    def cancel(self, job_id):
+        """Запрос отмены выполняющейся задачи"""
+        job = self.jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        job.task.cancel()
+        logger.info(f"Запрошена отмена фоновой задачи #{job_id} ({job.kind})")
+        return True
+
+    async def shutdown(self):
+        """Отмена всех выполняющихся задач и ожидание их завершения"""
+        tasks = [job.task for job in self._running.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,102 @@
+import os
+import asyncio
+import logging
+from rate_limiter import TokenBucket
+import metrics
+
+logger = logging.getLogger(__name__)
+
+def create_bot(token):
+    """Бот aiogram; TELEGRAM_API_BASE_URL направляет запросы на другой сервер Bot API (локальный или тестовый)"""
+    from aiogram import Bot
+    base_url = os.getenv('TELEGRAM_API_BASE_URL')
+    if not base_url:
+        return Bot(token=token)
+    from aiogram.client.session.aiohttp import AiohttpSession
+    from aiogram.client.telegram import TelegramAPIServer
+    return Bot(token=token, session=AiohttpSession(api=TelegramAPIServer.from_base(base_url)))
+
+class SendGovernor:
+    """Отправка сообщений в Telegram через одну сессию с соблюдением глобального и поканального лимитов"""
+
+    def __init__(self, bot_token, bot=None):
+        self.bot_token = bot_token
+        self.shared_bot = bot  # Бот, общий с другими компонентами процесса (сессией владеет его создатель)
+        self.global_rate = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))  # Сообщений в секунду на бота
+        self.chat_rate = float(os.getenv('TELEGRAM_CHAT_RATE', '20')) / 60  # Сообщений в секунду на чат
+        self.chat_burst = int(os.getenv('TELEGRAM_CHAT_BURST', '3'))  # Допустимый всплеск в один чат
+        self.max_retries = int(os.getenv('TELEGRAM_SEND_RETRIES', '3'))  # Попыток при сетевых ошибках
+        self.max_flood_waits = 5  # Максимум ожиданий retry_after для одного сообщения
+        self.global_bucket = TokenBucket(self.global_rate, self.global_rate)
+        self.chat_buckets = {}
+        self.chat_locks = {}
+        self._bot = None
+        self._loop = None
+
+    @property
+    def bot(self):
+        """Бот с сессией, привязанной к текущему event loop"""
+        if self.shared_bot is not None:
+            return self.shared_bot
+        loop = asyncio.get_running_loop()
+        # Сессия aiohttp живет столько же, сколько event loop; пока loop тот же - соединения переиспользуются
+        if self._bot is None or self._loop is not loop:
+            if self._bot is not None:
+                logger.info("Event loop сменился, создается новая сессия Telegram API")
+            # aiogram загружается при первой отправке, а не при импорте модуля
+            self._bot = create_bot(self.bot_token)
+            self._loop = loop
+            # Блокировки asyncio привязаны к loop
+            self.chat_locks = {}
+        return self._bot
+
+    def _chat_state(self, chat_id):
+        """Очередь (FIFO-блокировка) и ведро токенов чата"""
+        if chat_id not in self.chat_buckets:
+            self.chat_buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        if chat_id not in self.chat_locks:
+            self.chat_locks[chat_id] = asyncio.Lock()
+        return self.chat_locks[chat_id], self.chat_buckets[chat_id]
+
+    async def call(self, method, chat_id, **kwargs):
+        """Вызов метода Bot API для чата с ожиданием лимитов; сообщения в один чат уходят по очереди"""
+        from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError, TelegramServerError
+        bot = self.bot
+        lock, bucket = self._chat_state(chat_id)
+        async with lock:
+            attempts = 0
+            flood_waits = 0
+            while True:
+                await bucket.acquire()
+                await self.global_bucket.acquire()
+                try:
+                    with metrics.track(metrics.TELEGRAM_SECONDS, metrics.TELEGRAM_REQUESTS, method=method):
+                        return await getattr(bot, method)(chat_id=chat_id, **kwargs)
+                except TelegramRetryAfter as e:
+                    flood_waits += 1
+                    if flood_waits > self.max_flood_waits:
+                        raise
+                    metrics.TELEGRAM_RETRIES.inc(method=method, reason="flood")
+                    # Telegram сообщает точное время ожидания: чат блокируется ровно на него
+                    logger.warning(f"Превышен лимит Telegram для чата {chat_id}, ожидание {e.retry_after} с")
+                    bucket.block_for(e.retry_after)
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    attempts += 1
+                    if attempts >= self.max_retries:
+                        raise
+                    metrics.TELEGRAM_RETRIES.inc(method=method, reason="network")
+                    delay = min(2 ** attempts, 30)
+                    logger.warning(f"Ошибка Telegram API для чата {chat_id} (попытка {attempts}/{self.max_retries}): {e}. "
+                                   f"Повтор через {delay} с")
+                    await asyncio.sleep(delay)
+
+    async def send_message(self, chat_id, text, **kwargs):
+        """Отправка текстового сообщения"""
+        return await self.call("send_message", chat_id, text=text, **kwargs)
+
+    async def close(self):
+        """Закрытие сессии Telegram API"""
+        if self._bot is not None:
+            await self._bot.session.close()
+            self._bot = None
+            self._loop = None
@@ -1,101 +1,154 @@
 import os
+import json
+import pytz
 import logging
 import asyncio
-from datetime import datetime
-from aiogram import Bot, Dispatcher
-from aiogram.enums import ParseMode
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from database import Database
+from telegram_governor import SendGovernor
+from outbox import PublishOutbox
+from message_renderer import MessageRenderer, load_parts
+import tracing
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("telegram_publisher.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 class TelegramPublisher:
-    def __init__(self, db):
+    def __init__(self, db, bot=None):
         self.bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
         self.channel_id = os.getenv('TELEGRAM_CHANNEL_ID')
         self.db = db
-        self.bot = Bot(token=self.bot_token)
-        self.dp = Dispatcher()
+        self.governor = SendGovernor(self.bot_token, bot)  # Общая сессия и лимиты отправки
+        self.renderer = MessageRenderer(db)
+        self.outbox = PublishOutbox(db, self._render_for_channel, self._channel_slot)
     
-    async def format_message(self, news_item):
-        """Форматирование новости для публикации в Telegram"""
+    def _local_now(self):
+        """Текущее время в часовом поясе из настроек (без tzinfo, как в таблицах расписания)"""
+        timezone_name = self.db.get_schedule_setting('timezone') or 'Europe/Moscow'
         try:
-            # Получение обработанных данных
-            title = news_item['processed_title']
-            content = news_item['processed_content']
-            url = news_item['url']
-            category = news_item['category']
-            
-            # Формирование хэштегов
-            hashtags = "#ITNews"
-            if "ai" in category.lower() or "artificial intelligence" in category.lower():
-                hashtags += " #AI"
-            if "web3" in category.lower():
-                hashtags += " #Web3"
-            if "cybersecurity" in category.lower():
-                hashtags += " #Cybersecurity"
-            if "ux" in category.lower() or "ui" in category.lower():
-                hashtags += " #UXUI"
-            
-            # Формирование сообщения в формате Markdown
-            message = f"{title}\n\n{content}\n\n[Подробнее]({url})\n\n{hashtags}"
+            tz = pytz.timezone(timezone_name)
+        except pytz.exceptions.UnknownTimeZoneError:
+            tz = pytz.UTC
+        return datetime.now(tz).replace(tzinfo=None)
+    
+    @staticmethod
+    def _channel_slot(channel, now):
+        """Ближайшее время публикации по собственному расписанию канала (или сейчас)"""
+        if not channel['publish_times']:
+            return now
+        slots = []
+        for value in channel['publish_times'].split(','):
+            try:
+                hour, minute = map(int, value.strip().split(':'))
+            except ValueError:
+                logger.warning(f"Некорректное время публикации канала {channel['chat_id']}: {value}")
+                continue
+            slot = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            slots.append(slot if slot >= now else slot + timedelta(days=1))
+        return min(slots) if slots else now
+    
+    def _render_for_channel(self, post, channel):
+        """Части сообщения для канала, если они не были подготовлены при планировании"""
+        return self.renderer.render(post, channel['hashtags'])
+    
+    async def _deliver(self, delivery, now):
+        """Отправка одной доставки из outbox и запись результата"""
+        chat_id = delivery['chat_id']
+        with tracing.span("publish.send", delivery['trace_id'], news_id=delivery['news_id'],
+                          chat_id=chat_id, attempt=delivery['attempts']) as span:
+            if delivery['scheduled_date'] is not None:
+                # Задержка относительно запланированного времени: основная величина при разборе опозданий
+                span.set(delay_seconds=(now - delivery['scheduled_date']).total_seconds())
+            delivered = await self._send_delivery(delivery)
+            if not delivered:
+                span.status = "error"
+            return delivered
+    
+    async def _keep_lease(self, delivery):
+        """Продление аренды доставки, пока ее части ждут отправки (например, retry_after или очередь чата)"""
+        while True:
+            await asyncio.sleep(self.outbox.lease_seconds / 3)
+            self.outbox.extend_lease(delivery)
+    
+    async def _send_delivery(self, delivery):
+        """Отправка частей сообщения доставки в канал с продолжения после последней отправленной части"""
+        from aiogram.enums import ParseMode
+        chat_id = delivery['chat_id']
+        # Пока доставка отправляется, другой отправитель не должен счесть ее прерванной
+        heartbeat = asyncio.create_task(self._keep_lease(delivery))
+        try:
+            parts = load_parts(delivery['payload'])
+            if parts is None:
+                # Доставка, поставленная до перехода на HTML
+                parts, parse_mode = [delivery['payload']], ParseMode.MARKDOWN
+            else:
+                parse_mode = ParseMode.HTML
+            if not parts or not parts[0]:
+                raise ValueError("пустой текст сообщения")
             
-            return message
+            # Сообщение уже подготовлено и проверено - только отправка.
+            # Части, отправленные до сбоя, при повторе не отправляются еще раз
+            message_ids = json.loads(delivery['message_ids']) if delivery['message_ids'] else []
+            for index in range(delivery['sent_parts'] or 0, len(parts)):
+                sent = await self.governor.send_message(
+                    chat_id,
+                    parts[index],
+                    parse_mode=parse_mode,
+                    disable_web_page_preview=False
+                )
+                message_ids.append(sent.message_id)
+                self.outbox.record_part(delivery, index + 1, message_ids)
         except Exception as e:
-            logger.error(f"Ошибка при форматировании сообщения: {e}")
-            return None
+            logger.error(f"Не удалось опубликовать новость {delivery['news_id']} в канал {chat_id}: {e}")
+            self.outbox.fail(delivery, e, self._local_now())
+            return False
+        finally:
+            heartbeat.cancel()
+        
+        # Сообщение уже отправлено: дальше только фиксируем результат, без повторной отправки
+        self.outbox.complete(delivery, message_ids)
+        logger.info(f"Новость с ID {delivery['news_id']} успешно опубликована в канал {chat_id}")
+        return True
+    
+    async def dispatch(self, limit=20, news_id=None):
+        """Отправка доставок из outbox, время которых наступило; прерванные отправки возобновляются"""
+        now = self._local_now()
+        deliveries = self.outbox.claim_deliveries(now, limit=limit, news_id=news_id)
+        if not deliveries:
+            return 0
+        # Каналы обслуживаются параллельно через общий SendGovernor
+        results = await asyncio.gather(*(self._deliver(d, now) for d in deliveries))
+        sent_count = sum(1 for success in results if success)
+        logger.info(f"Отправлено {sent_count} из {len(deliveries)} сообщений")
+        return sent_count
+    
+    async def publish_due_posts(self, limit=5):
+        """Публикация наступивших запланированных постов через outbox"""
+        self.outbox.claim_due_posts(self._local_now(), limit=limit)
+        return await self.dispatch()
     
-    async def publish_news(self, news_item, max_retries=3):
-        """Публикация новости в Telegram-канал с поддержкой повторных попыток"""
-        retries = 0
-        while retries < max_retries:
+    async def publish_news(self, news_item):
+        """Немедленная публикация новости во все включенные каналы"""
+        trace_id = news_item.get('trace_id') or self.db.get_trace_ids([news_item['id']]).get(news_item['id'])
+        with tracing.span("publish.news", trace_id, news_id=news_item['id']) as span:
             try:
-                # Форматирование сообщения
-                message = await self.format_message(news_item)
-                if not message:
-                    logger.error(f"Не удалось сформировать сообщение для новости {news_item['id']}")
+                if not self.outbox.enqueue_news(news_item['id'], self._local_now()):
+                    span.status = "error"
                     return False
-                
-                # Отправка сообщения в канал
-                await self.bot.send_message(
-                    chat_id=self.channel_id,
-                    text=message,
-                    parse_mode=ParseMode.MARKDOWN,
-                    disable_web_page_preview=False
-                )
-                
-                # Отметка новости как опубликованной в базе данных
-                self.db.mark_as_published(news_item['id'])
-                
-                logger.info(f"Новость с ID {news_item['id']} успешно опубликована в канал {self.channel_id}")
-                return True
+                await self.dispatch(news_id=news_item['id'])
+                # Новость опубликована, если не осталось недоставленных сообщений, кроме отложенных по расписанию каналов
+                delivered = self.outbox.is_delivered(news_item['id'], self._local_now())
+                span.set(delivered=delivered)
+                return delivered
             
             except Exception as e:
-                retries += 1
-                logger.warning(f"Попытка {retries}/{max_retries} публикации новости {news_item['id']} не удалась: {e}")
-                
-                if "Event loop is closed" in str(e):
-                    logger.warning("Обнаружена ошибка закрытого event loop, пересоздаем соединение с Telegram API")
-                    # Пересоздаем бота при ошибке с event loop
-                    self.bot = Bot(token=self.bot_token)
-                
-                # Пауза перед следующей попыткой
-                await asyncio.sleep(2 * retries)  # Увеличиваем время ожидания с каждой попыткой
-        
-        logger.error(f"Не удалось опубликовать новость {news_item['id']} после {max_retries} попыток")
-        return False
+                logger.error(f"Не удалось опубликовать новость {news_item['id']}: {e}")
+                span.status = "error"
+                span.error = str(e)
+                return False
     
     async def publish_batch(self, limit=5):
         """Публикация пакета новостей"""
@@ -107,13 +160,9 @@ class TelegramPublisher:
                 logger.info("Нет новостей для публикации")
                 return 0
             
-            published_count = 0
-            for news_item in news_items:
-                success = await self.publish_news(news_item)
-                if success:
-                    published_count += 1
-                # Пауза между публикациями
-                await asyncio.sleep(1)
+            # Сообщения ставятся в очередь канала сразу, темп отправки задает SendGovernor
+            results = await asyncio.gather(*(self.publish_news(news_item) for news_item in news_items))
+            published_count = sum(1 for success in results if success)
             
             logger.info(f"Опубликовано {published_count} новостей из {len(news_items)}")
             return published_count
@@ -125,21 +174,26 @@ class TelegramPublisher:
     async def publish_test_message(self):
         """Публикация тестового сообщения при запуске бота"""
         try:
-            logger.info("Отправка тестового сообщения в Telegram-канал")
+            logger.info("Отправка тестового сообщения в Telegram-каналы")
+            from aiogram.enums import ParseMode
             
             # Формирование тестового сообщения
             current_time = datetime.now().strftime("%d.%m.%Y %H:%M:%S")
             message = f"🤖 Бот AsyncNews запущен и готов к работе!\n\n📅 Дата и время запуска: {current_time}\n\n#SystemMessage"
             
-            # Отправка сообщения в канал
-            await self.bot.send_message(
-                chat_id=self.channel_id,
-                text=message,
-                parse_mode=ParseMode.MARKDOWN,
-                disable_web_page_preview=True
-            )
+            # Отправка сообщения во все каналы
+            chat_ids = [c['chat_id'] for c in self.db.get_channels()] or [self.channel_id]
+            await asyncio.gather(*(
+                self.governor.send_message(
+                    chat_id,
+                    message,
+                    parse_mode=ParseMode.MARKDOWN,
+                    disable_web_page_preview=True
+                )
+                for chat_id in chat_ids
+            ))
             
-            logger.info(f"Тестовое сообщение успешно отправлено в канал {self.channel_id}")
+            logger.info(f"Тестовое сообщение успешно отправлено в каналы: {', '.join(chat_ids)}")
             return True
         
         except Exception as e:
@@ -148,5 +202,5 @@ class TelegramPublisher:
     
     async def close(self):
         """Закрытие соединения с Telegram API"""
-        await self.bot.session.close()
+        await self.governor.close()
         logger.info("Соединение с Telegram API закрыто")
\ No newline at end of file
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import queue
+import atexit
+import secrets
+import logging
+import threading
+import contextvars
+import urllib.request
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+# Загрузка переменных окружения
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+def new_trace_id():
+    """Идентификатор трассировки новости (32 hex-символа, совместим с OpenTelemetry)"""
+    return secrets.token_hex(16)
+
+def article_trace_id(article):
+    """Идентификатор трассировки статьи: создается при первом обращении и передается с ней дальше"""
+    return article.setdefault("trace_id", new_trace_id())
+
+class Span:
+    """Отрезок работы над новостью: этап, время начала и окончания, атрибуты и статус"""
+
+    def __init__(self, name, trace_id, parent_id=None, attributes=None, start=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start = time.time() if start is None else start
+        self.end = None
+        self.status = "ok"
+        self.error = None
+
+    def set(self, **attributes):
+        """Добавление атрибутов (None не записывается)"""
+        self.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round(self.duration * 1000, 3),
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+def _otlp_value(value):
+    """Значение атрибута в формате OTLP/JSON"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def _otlp_span(span):
+    data = {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": 1,
+        "startTimeUnixNano": str(int(span.start * 1e9)),
+        "endTimeUnixNano": str(int(span.end * 1e9)),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+        "status": {"code": 2, "message": span.error or ""} if span.status == "error" else {"code": 1},
+    }
+    if span.parent_id:
+        data["parentSpanId"] = span.parent_id
+    return data
+
+class Tracer:
+    """Запись отрезков трассировки и их выгрузка в фоновом потоке: в JSONL-файл или OTLP-коллектор"""
+
+    def __init__(self):
+        self.exporter = os.getenv('TRACE_EXPORT', 'file').lower()  # file, otlp или none
+        self.file_path = os.getenv('TRACE_FILE', 'traces.jsonl')  # Файл для экспорта file
+        self.otlp_endpoint = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318').rstrip('/') + '/v1/traces'
+        self.service_name = os.getenv('TRACE_SERVICE_NAME', 'async-news-bot')  # Имя сервиса в коллекторе
+        self.batch_size = 100  # Максимум отрезков в одной выгрузке
+        self.flush_interval = 2.0  # Максимальная задержка выгрузки (сек)
+        if self.exporter not in ('file', 'otlp', 'none'):
+            logger.warning(f"Неизвестный способ экспорта трассировок: {self.exporter}, используется file")
+            self.exporter = 'file'
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.exporter != 'none'
+
+    @contextmanager
+    def span(self, name, trace_id=None, **attributes):
+        """Замер этапа; без trace_id отрезок вкладывается в текущий или начинает новую трассировку"""
+        parent = _current_span.get()
+        if trace_id is None:
+            trace_id = parent.trace_id if parent is not None else new_trace_id()
+        parent_id = parent.span_id if parent is not None and parent.trace_id == trace_id else None
+        span = Span(name, trace_id, parent_id)
+        span.set(**attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.error = str(e) or type(e).__name__
+            raise
+        finally:
+            _current_span.reset(token)
+            self.finish(span)
+
+    def record(self, name, trace_id, start, end, **attributes):
+        """Запись уже завершившегося этапа (например, общего запроса к API для каждой из статей)"""
+        if not self.enabled:
+            return
+        span = Span(name, trace_id, start=start)
+        span.set(**attributes)
+        span.end = end
+        self._export(span)
+
+    def finish(self, span, status=None, error=None):
+        """Завершение отрезка; статус можно задать явно, если ошибка не выбрасывается исключением"""
+        span.end = time.time()
+        if status is not None:
+            span.status = status
+        if error is not None:
+            span.error = str(error)
+        self._export(span)
+
+    def _export(self, span):
+        if not self.enabled:
+            return
+        self._queue.put(span)
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                    self._thread.start()
+                    atexit.register(self.shutdown)
+
+    def _run(self):
+        """Поток выгрузки: отрезки собираются в пакеты, чтобы не писать по одному"""
+        while True:
+            span = self._queue.get()
+            if span is None:
+                return
+            batch = [span]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if span is None:
+                    stop = True
+                    break
+                batch.append(span)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        try:
+            if self.exporter == 'otlp':
+                payload = {"resourceSpans": [{
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                    "scopeSpans": [{"scope": {"name": "async_news"}, "spans": [_otlp_span(s) for s in batch]}],
+                }]}
+                request = urllib.request.Request(
+                    self.otlp_endpoint, data=json.dumps(payload).encode('utf-8'),
+                    headers={'Content-Type': 'application/json'}, method='POST'
+                )
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    response.read()
+            else:
+                with open(self.file_path, 'a', encoding='utf-8') as f:
+                    for span in batch:
+                        f.write(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + '\n')
+        except Exception as e:
+            # Трассировка не должна влиять на работу конвейера
+            logger.warning(f"Не удалось выгрузить {len(batch)} отрезков трассировки: {e}")
+
+    def shutdown(self):
+        """Выгрузка оставшихся отрезков и остановка потока"""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+_tracer = None
+
+def get_tracer():
+    """Трассировщик процесса (создается при первом обращении)"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+def span(name, trace_id=None, **attributes):
+    """Замер этапа обработки новости (см. Tracer.span)"""
+    return get_tracer().span(name, trace_id, **attributes)
+
+def current_span():
+    """Текущий отрезок трассировки или None"""
+    return _current_span.get()
@@ -0,0 +1,40 @@
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Небольшой кэш в памяти с временем жизни записей и ограничением размера"""
+
+    def __init__(self, ttl_seconds, max_entries=128):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # ключ -> (момент устаревания, значение)
+
+    def get(self, key, default=None):
+        """Значение по ключу или default, если записи нет или она устарела"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl_seconds=None):
+        """Сохранение значения; самые давние записи вытесняются при переполнении"""
+        ttl = self.ttl if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """Удаление записи по ключу или всех записей"""
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def __contains__(self, key):
+        return self.get(key, self) is not self
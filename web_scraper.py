@@ -2,7 +2,6 @@ import logging
 import aiohttp
 import asyncio
 import requests
-from bs4 import BeautifulSoup
 from urllib.parse import urlparse
 import time
 import os
@@ -10,19 +9,11 @@ import json
 import re
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+import metrics
 
 # Загрузка переменных окружения
 load_dotenv()
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("web_scraper.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 class WebScraper:
@@ -123,7 +114,7 @@ class WebScraper:
         try:
             with open(self.cache_file, 'w', encoding='utf-8') as f:
                 json.dump(self.url_cache, f, ensure_ascii=False, indent=2)
-            logger.info(f"Кэш URL сохранен: {len(self.url_cache)} записей")
+            logger.debug(f"Кэш URL сохранен: {len(self.url_cache)} записей")
         except Exception as e:
             logger.error(f"Ошибка при сохранении кэша URL: {e}")
     
@@ -195,9 +186,9 @@ class WebScraper:
         is_related = keyword_matches >= 3 or len(matched_keywords) >= 2
         
         if is_related:
-            logger.info(f"Статья соответствует IT-тематике: найдено {len(matched_keywords)} уникальных ключевых слов")
+            logger.debug(f"Статья соответствует IT-тематике: найдено {len(matched_keywords)} уникальных ключевых слов")
         else:
-            logger.info(f"Статья не соответствует IT-тематике: найдено только {len(matched_keywords)} уникальных ключевых слов")
+            logger.debug(f"Статья не соответствует IT-тематике: найдено только {len(matched_keywords)} уникальных ключевых слов")
         
         return is_related
     
@@ -209,15 +200,18 @@ class WebScraper:
             
         # Проверка, был ли URL уже обработан
         if self.is_url_processed(url):
-            logger.info(f"URL уже был обработан ранее: {url}")
+            logger.debug(f"URL уже был обработан ранее: {url}")
             return ""
             
         domain = urlparse(url).netloc
-        logger.info(f"Попытка получить полный текст статьи с домена {domain}: {url}")
+        logger.debug(f"Попытка получить полный текст статьи с домена {domain}: {url}")
         
         for attempt in range(self.retry_count):
             try:
-                response = requests.get(url, headers=self.headers, timeout=self.timeout)
+                with metrics.SCRAPE_SECONDS.time(domain=domain):
+                    response = requests.get(url, headers=self.headers, timeout=self.timeout)
+                metrics.SCRAPE_REQUESTS.inc(domain=domain, status=str(response.status_code))
+                metrics.SCRAPE_BYTES.inc(len(response.content), domain=domain)
                 
                 if response.status_code != 200:
                     logger.warning(f"Ошибка HTTP при запросе {url}: {response.status_code}")
@@ -229,6 +223,7 @@ class WebScraper:
                 
                 # Получение HTML-контента
                 html_content = response.text
+                from bs4 import BeautifulSoup
                 soup = BeautifulSoup(html_content, 'html.parser')
                 
                 # Удаление ненужных элементов
@@ -245,12 +240,12 @@ class WebScraper:
                 if article_text:
                     # Проверка на соответствие IT-тематике
                     if self.is_it_related(title, article_text):
-                        logger.info(f"Успешно получен текст IT-статьи ({len(article_text)} символов)")
+                        logger.debug(f"Успешно получен текст IT-статьи ({len(article_text)} символов)")
                         # Отмечаем URL как обработанный и релевантный
                         self.mark_url_processed(url, is_it_related=True)
                         return article_text
                     else:
-                        logger.info(f"Статья не соответствует IT-тематике: {url}")
+                        logger.debug(f"Статья не соответствует IT-тематике: {url}")
                         # Отмечаем URL как обработанный, но не релевантный
                         self.mark_url_processed(url, is_it_related=False)
                         return ""
@@ -260,7 +255,7 @@ class WebScraper:
                     
                     # Проверка на соответствие IT-тематике
                     if fallback_content and self.is_it_related(title, fallback_content):
-                        logger.info(f"Успешно получен текст IT-статьи через запасной метод ({len(fallback_content)} символов)")
+                        logger.debug(f"Успешно получен текст IT-статьи через запасной метод ({len(fallback_content)} символов)")
                         # Отмечаем URL как обработанный и релевантный
                         self.mark_url_processed(url, is_it_related=True)
                         return fallback_content
@@ -270,6 +265,7 @@ class WebScraper:
                         return ""
             
             except requests.Timeout:
+                metrics.SCRAPE_REQUESTS.inc(domain=domain, status="timeout")
                 logger.error(f"Таймаут при запросе {url}. Попытка {attempt+1} из {self.retry_count}")
                 if attempt < self.retry_count - 1:
                     time.sleep(self.retry_delay)
@@ -295,18 +291,21 @@ class WebScraper:
         
         # Проверка, был ли URL уже обработан
         if self.is_url_processed(url):
-            logger.info(f"URL уже был обработан ранее: {url}")
+            logger.debug(f"URL уже был обработан ранее: {url}")
             return ""
         
         domain = urlparse(url).netloc
-        logger.info(f"Попытка получить полный текст статьи с домена {domain}: {url}")
+        logger.debug(f"Попытка получить полный текст статьи с домена {domain}: {url}")
         
         session = await self.get_session()
         
         for attempt in range(self.retry_count):
             try:
+                started = time.perf_counter()
                 async with session.get(url, timeout=self.timeout) as response:
+                    metrics.SCRAPE_REQUESTS.inc(domain=domain, status=str(response.status))
                     if response.status != 200:
+                        metrics.SCRAPE_SECONDS.observe(time.perf_counter() - started, domain=domain)
                         logger.warning(f"Ошибка HTTP при запросе {url}: {response.status}")
                         if attempt < self.retry_count - 1:
                             await asyncio.sleep(self.retry_delay)
@@ -314,8 +313,12 @@ class WebScraper:
                         self.mark_url_processed(url, is_it_related=False)
                         return ""
                     
-                    # Получение HTML-контента
+                    # Получение HTML-контента (тело читается один раз, text() использует прочитанные байты)
+                    body = await response.read()
+                    metrics.SCRAPE_SECONDS.observe(time.perf_counter() - started, domain=domain)
+                    metrics.SCRAPE_BYTES.inc(len(body), domain=domain)
                     html_content = await response.text()
+                    from bs4 import BeautifulSoup
                     soup = BeautifulSoup(html_content, 'html.parser')
                     
                     # Удаление ненужных элементов
@@ -332,12 +335,12 @@ class WebScraper:
                     if article_text:
                         # Проверка на соответствие IT-тематике
                         if self.is_it_related(title, article_text):
-                            logger.info(f"Успешно получен текст IT-статьи ({len(article_text)} символов)")
+                            logger.debug(f"Успешно получен текст IT-статьи ({len(article_text)} символов)")
                             # Отмечаем URL как обработанный и релевантный
                             self.mark_url_processed(url, is_it_related=True)
                             return article_text
                         else:
-                            logger.info(f"Статья не соответствует IT-тематике: {url}")
+                            logger.debug(f"Статья не соответствует IT-тематике: {url}")
                             # Отмечаем URL как обработанный, но не релевантный
                             self.mark_url_processed(url, is_it_related=False)
                             return ""
@@ -347,7 +350,7 @@ class WebScraper:
                         
                         # Проверка на соответствие IT-тематике
                         if fallback_content and self.is_it_related(title, fallback_content):
-                            logger.info(f"Успешно получен текст IT-статьи через запасной метод ({len(fallback_content)} символов)")
+                            logger.debug(f"Успешно получен текст IT-статьи через запасной метод ({len(fallback_content)} символов)")
                             # Отмечаем URL как обработанный и релевантный
                             self.mark_url_processed(url, is_it_related=True)
                             return fallback_content
@@ -357,6 +360,7 @@ class WebScraper:
                             return ""
             
             except asyncio.TimeoutError:
+                metrics.SCRAPE_REQUESTS.inc(domain=domain, status="timeout")
                 logger.error(f"Таймаут при запросе {url}. Попытка {attempt+1} из {self.retry_count}")
                 if attempt < self.retry_count - 1:
                     await asyncio.sleep(self.retry_delay)